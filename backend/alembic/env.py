@@ -6,6 +6,7 @@ from sqlalchemy import pool
 from alembic import context
 
 from config import config as settings
+from repositories.database import database_url
 pg = settings.postgres
 
 # this is the Alembic Config object, which provides
@@ -29,8 +30,9 @@ target_metadata = None
 # ... etc.
 
 
-DB_URL = f"postgresql+psycopg2://{pg.username}:{pg.password}@{pg.url}/{pg.database}"
-config.set_main_option("sqlalchemy.url", DB_URL)
+DB_URL = database_url(pg, driver="psycopg2")
+# ini options are interpolated, % of escaped characters has to be doubled
+config.set_main_option("sqlalchemy.url", DB_URL.render_as_string(hide_password=False).replace("%", "%%"))
 
 def run_migrations_offline() -> None:
     """Run migrations in 'offline' mode.
@@ -0,0 +1,57 @@
+"""add goods search indexes
+
+Revision ID: 3c1f7a9e52d4
+Revises: 8bb2ff4e20d4
+Create Date: 2026-02-09 19:42:11.318402
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.sql import text
+
+from sqlalchemy.dialects.postgresql import TSVECTOR
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3c1f7a9e52d4'
+down_revision: Union[str, Sequence[str], None] = '8bb2ff4e20d4'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm;"))
+
+    # 'simple' config on purpose: names are in different languages, so no stemming
+    op.add_column(
+        'goods',
+        sa.Column(
+            'search',
+            TSVECTOR(),
+            sa.Computed(
+                "setweight(to_tsvector('simple', coalesce(name, '')), 'A') || "
+                "setweight(to_tsvector('simple', coalesce(description, '')), 'B')",
+                persisted=True
+            )
+        )
+    )
+
+    op.create_index('ix_goods_search', 'goods', ['search'], postgresql_using='gin')
+    op.create_index(
+        'ix_goods_name_trgm',
+        'goods',
+        ['name'],
+        postgresql_using='gin',
+        postgresql_ops={'name': 'gin_trgm_ops'}
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_goods_name_trgm', table_name='goods')
+    op.drop_index('ix_goods_search', table_name='goods')
+    op.drop_column('goods', 'search')
+    # pg_trgm stays, other objects may use it and it may have been there before this migration
@@ -0,0 +1,48 @@
+"""create token revocations table
+
+Revision ID: 7f3d91c2a6e8
+Revises: e4a8c27d9b31
+Create Date: 2026-02-20 19:42:11.583204
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+from sqlalchemy.dialects.postgresql import UUID as PG_UUID
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7f3d91c2a6e8'
+down_revision: Union[str, Sequence[str], None] = 'e4a8c27d9b31'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # tokens of the user issued before revoked_at are not accepted anymore
+    op.create_table(
+        'token_revocations',
+        sa.Column('id', sa.BigInteger(), sa.Identity(), primary_key=True),
+        sa.Column('user_id', PG_UUID(as_uuid=True), nullable=False),
+        sa.Column('revoked_at', sa.DateTime(timezone=True), nullable=False, server_default=sa.func.now())
+    )
+    op.create_foreign_key(
+        'fk_token_revocations_user_id_users',
+        'token_revocations',
+        'users',
+        ['user_id'],
+        ['id'],
+        ondelete='CASCADE'
+    )
+    # initial load reads revocations younger than the token lifetime
+    op.create_index('ix_token_revocations_revoked_at', 'token_revocations', ['revoked_at'])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_token_revocations_revoked_at', table_name='token_revocations')
+    op.drop_constraint('fk_token_revocations_user_id_users', 'token_revocations', type_='foreignkey')
+    op.drop_table('token_revocations')
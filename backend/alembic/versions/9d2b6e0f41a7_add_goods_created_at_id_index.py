@@ -0,0 +1,29 @@
+"""add goods created_at id index
+
+Revision ID: 9d2b6e0f41a7
+Revises: 3c1f7a9e52d4
+Create Date: 2026-02-11 20:05:37.904113
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9d2b6e0f41a7'
+down_revision: Union[str, Sequence[str], None] = '3c1f7a9e52d4'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # keyset pagination walks this index backwards starting from the cursor
+    op.create_index('ix_goods_created_at_id', 'goods', ['created_at', 'id'])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_goods_created_at_id', table_name='goods')
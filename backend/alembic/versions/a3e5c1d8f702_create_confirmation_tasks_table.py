@@ -0,0 +1,40 @@
+"""create confirmation tasks table
+
+Revision ID: a3e5c1d8f702
+Revises: 7f3d91c2a6e8
+Create Date: 2026-10-17 11:08:42.915307
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+from sqlalchemy.dialects.postgresql import UUID as PG_UUID
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a3e5c1d8f702'
+down_revision: Union[str, Sequence[str], None] = '7f3d91c2a6e8'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # tasks waiting for the link sent to the user to be followed, args are json of the action's arguments
+    op.create_table(
+        'confirmation_tasks',
+        sa.Column('id', PG_UUID(as_uuid=True), primary_key=True),
+        sa.Column('action_id', sa.String(100), nullable=False),
+        sa.Column('args', sa.Text(), nullable=False),
+        sa.Column('expires_at', sa.DateTime(timezone=True), nullable=False)
+    )
+    # expired tasks are deleted periodically
+    op.create_index('ix_confirmation_tasks_expires_at', 'confirmation_tasks', ['expires_at'])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_confirmation_tasks_expires_at', table_name='confirmation_tasks')
+    op.drop_table('confirmation_tasks')
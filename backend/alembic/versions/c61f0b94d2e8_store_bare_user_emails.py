@@ -0,0 +1,44 @@
+"""store bare user emails
+
+Revision ID: c61f0b94d2e8
+Revises: a3e5c1d8f702
+Create Date: 2026-10-17 13:41:06.302718
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c61f0b94d2e8'
+down_revision: Union[str, Sequence[str], None] = 'a3e5c1d8f702'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# address part of "name <address>", emails without a display name are kept as they are
+BARE_EMAIL = "CASE WHEN email LIKE '%<%>' THEN substring(email from '<([^<>]*)>$') ELSE email END"
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # emails were stored as "name <address>", only the address is kept now;
+    # one address registered under two names would break the unique constraint halfway, so it's checked first
+    collisions = op.get_bind().execute(sa.text(
+        f"SELECT address FROM (SELECT {BARE_EMAIL} AS address FROM users WHERE email IS NOT NULL) AS emails "
+        "GROUP BY address HAVING count(*) > 1 ORDER BY address LIMIT 20"
+    )).scalars().all()
+    if collisions:
+        raise RuntimeError(
+            "these email addresses belong to several users once display names are stripped, "
+            f"resolve them by hand and run the migration again: {', '.join(collisions)}"
+        )
+
+    op.execute(sa.text(f"UPDATE users SET email = {BARE_EMAIL} WHERE email LIKE '%<%>'"))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    raise NotImplementedError("display names of emails aren't kept anywhere, restore them from a backup")
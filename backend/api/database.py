@@ -0,0 +1,111 @@
+import time
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
+from typing import Annotated
+
+from fastapi import Depends, Request, Response
+
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine
+
+from repositories.database import ReplicaSet, checkout_seconds, pool_stats, transaction_wrote
+
+import logging
+logger = logging.getLogger(__name__)
+
+# time until which reads of the client go to the primary, set after its writes
+READ_PRIMARY_COOKIE = "read_primary_until"
+
+# something resembling singleton
+_engine: AsyncEngine | None = None
+_replicas: ReplicaSet | None = None
+_read_your_writes: float = 0
+
+def init(engine: AsyncEngine, replicas: ReplicaSet | None = None, read_your_writes: float = 0):
+    global _engine, _replicas, _read_your_writes
+    _engine = engine
+    _replicas = replicas
+    _read_your_writes = read_your_writes
+
+def stats() -> dict[str, dict[str, int]]:
+    if _engine is None:
+        return dict()
+    stats = {"primary": pool_stats(_engine)}
+    if _replicas is not None:
+        stats["replicas"] = _replicas.stats()
+    return stats
+
+@asynccontextmanager
+async def _begin(engine: AsyncEngine, pool: str) -> AsyncIterator[AsyncConnection]:
+    # engine.begin() with the time waited for a pooled connection measured
+    started = time.perf_counter()
+    async with engine.connect() as conn:
+        checkout_seconds.observe(time.perf_counter() - started, pool)
+        async with conn.begin():
+            yield conn
+
+@asynccontextmanager
+async def transaction() -> AsyncIterator[AsyncConnection]:
+    # for work outside of requests, commits on exit and rolls back on error
+    async with _begin(_engine, "primary") as conn:
+        yield conn
+
+def remember_wrote(request: Request):
+    # for writes made outside of the request's connection
+    request.state.wrote = True
+
+async def get_connection(request: Request) -> AsyncIterator[AsyncConnection]:
+    async with _begin(_engine, "primary") as conn:
+        yield conn
+        # client of a request that wrote reads from the primary for a while after it; asked before commit,
+        # so it's only known to the read_your_writes middleware for connections released before the response
+        if _replicas is not None and _read_your_writes and await transaction_wrote(conn):
+            remember_wrote(request)
+
+def _reads_primary(request: Request) -> bool:
+    until = request.cookies.get(READ_PRIMARY_COOKIE)
+    try:
+        return until is not None and float(until) > time.time()
+    except ValueError:
+        return False
+
+async def get_read_connection(request: Request) -> AsyncIterator[AsyncConnection]:
+    engine = None
+    if _replicas is not None and not _reads_primary(request):
+        engine = _replicas.engine()
+
+    conn = None
+    if engine is not None:
+        try:
+            started = time.perf_counter()
+            conn = await engine.connect()
+            checkout_seconds.observe(time.perf_counter() - started, "replica")
+        except Exception as e:
+            logger.warning("failed to connect to replica %s, reading from the primary: %s", engine.url.host, e)
+            _replicas.mark_down(engine)
+
+    if conn is None:
+        async with _begin(_engine, "primary") as conn:
+            yield conn
+        return
+
+    try:
+        async with conn.begin():
+            yield conn
+    finally:
+        await conn.close()
+
+def remember_write(request: Request, response: Response):
+    if _replicas is None or not _read_your_writes or response.status_code >= 400:
+        return
+    if getattr(request.state, "wrote", False):
+        response.set_cookie(READ_PRIMARY_COOKIE, str(time.time() + _read_your_writes),
+                            max_age=max(1, int(_read_your_writes)), httponly=True, samesite="lax")
+
+# one pooled connection and transaction per request, committed before the response is sent,
+# so the client never sees a success that wasn't committed
+Connection = Annotated[AsyncConnection, Depends(get_connection, scope="function")]
+# kept until the response is sent, for streaming responses reading after the endpoint returns
+StreamingConnection = Annotated[AsyncConnection, Depends(get_connection, scope="request")]
+# for routes that only read, goes to a replica when there are some and the client hasn't written just now
+ReadConnection = Annotated[AsyncConnection, Depends(get_read_connection, scope="function")]
+StreamingReadConnection = Annotated[AsyncConnection, Depends(get_read_connection, scope="request")]
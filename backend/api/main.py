@@ -1,16 +1,23 @@
+from datetime import timedelta
+
 from fastapi import APIRouter
 
 from api.routes import goods, users, confirm
-from api import security
+from api import security, rate_limit
+
+from config import Settings
 
 from usecases.users import UserUsecase 
 from usecases.goods import GoodUsecase
 from utils.late_executor import LateExecutor
 
-def init(user_usecase: UserUsecase, good_usecase: GoodUsecase, late_executor: LateExecutor):
+def init(config: Settings, user_usecase: UserUsecase, good_usecase: GoodUsecase, late_executor: LateExecutor):
     api_router = APIRouter()
-    security.init(None)
+    security.init(user_usecase, config.security)
+    rate_limit.init(config.rate_limit)
 
     api_router.include_router(goods.init(good_usecase, user_usecase))
-    api_router.include_router(users.init(user_usecase))
+    api_router.include_router(users.init(user_usecase, timedelta(minutes=config.security.access_token_expire_minutes)))
     api_router.include_router(confirm.init(late_executor))
+
+    return api_router
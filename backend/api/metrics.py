@@ -0,0 +1,60 @@
+import time
+from collections.abc import Callable
+
+from fastapi import APIRouter, Request, Response
+
+from utils import metrics
+
+# prometheus text exposition format
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+request_seconds = metrics.histogram("http_request_duration_seconds", "Time of requests by route, until the response starts",
+                                    ("method", "route", "status"))
+requests_in_flight = metrics.gauge("http_requests_in_flight", "Requests being handled at the moment", ("method",))
+
+async def track_requests(request: Request, call_next):
+    method = request.method
+    requests_in_flight.inc(method)
+    started = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        requests_in_flight.dec(method)
+        # set by routing, unmatched paths share one label, so scanning urls doesn't make a series per url
+        route = request.scope.get("route")
+        request_seconds.observe(time.perf_counter() - started, method, route.path if route else "unmatched", status)
+
+# stats that count events since the component was made, the others are sizes at the moment
+COUNTER_STATS = frozenset(("hits", "misses", "rejected", "allowed", "limited", "generation"))
+
+def _collect(sources: dict[str, Callable[[], dict]], counters: bool) -> dict[tuple, float]:
+    # stats are flat or one level nested dicts, nested ones are named component_part
+    values = dict()
+    for component, source in sources.items():
+        for key, value in source().items():
+            if isinstance(value, dict):
+                for stat, nested in value.items():
+                    if (stat in COUNTER_STATS) == counters:
+                        values[(f"{component}_{key}", stat)] = nested
+            elif (key in COUNTER_STATS) == counters:
+                values[(component, key)] = value
+    return values
+
+def init(sources: dict[str, Callable[[], dict]]) -> APIRouter:
+    """
+    Sources are stats() of components, read on every scrape
+    """
+    metrics.callback_gauge("app_stats", "Sizes reported by components: pools, caches, rate limit buckets",
+                           lambda: _collect(sources, counters=False), ("component", "stat"))
+    metrics.callback_counter("app_stats_total", "Counters reported by components: cache hits and misses, rejections",
+                             lambda: _collect(sources, counters=True), ("component", "stat"))
+    router = APIRouter(tags=["metrics"])
+
+    @router.get("/metrics", include_in_schema=False)
+    async def get_metrics() -> Response:
+        return Response(metrics.registry.render(), media_type=CONTENT_TYPE)
+
+    return router
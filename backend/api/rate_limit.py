@@ -0,0 +1,57 @@
+import math
+from typing import Annotated
+
+from fastapi import Depends, HTTPException, Request, status
+from fastapi.security import OAuth2PasswordRequestForm
+
+from config import RateLimitSettings
+
+from utils.rate_limit import RateLimitBackend, LocalRateLimitBackend, RateLimiter
+
+# something resembling singleton
+_by_ip: RateLimiter | None = None
+_by_username: RateLimiter | None = None
+
+def init(settings: RateLimitSettings, backend: RateLimitBackend | None = None):
+    global _by_ip, _by_username
+    if not settings.enabled:
+        _by_ip = _by_username = None
+        return
+
+    backend = backend or LocalRateLimitBackend(settings.max_keys)
+    _by_ip = RateLimiter(backend, "ip", settings.ip_rate, settings.ip_burst)
+    _by_username = RateLimiter(backend, "username", settings.username_rate, settings.username_burst)
+
+def stats() -> dict[str, dict[str, float]]:
+    if _by_ip is None:
+        return dict()
+    return {"backend": _by_ip.backend.stats(), "ip": _by_ip.stats(), "username": _by_username.stats()}
+
+def client_ip(request: Request) -> str:
+    # behind a proxy that's the proxy address, it should limit by itself then
+    return request.client.host if request.client else "unknown"
+
+async def _check(limiter: RateLimiter | None, key: str):
+    if limiter is None:
+        return
+    wait = await limiter.check(key)
+    if wait:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Too many requests, try again later",
+            headers={"Retry-After": str(math.ceil(wait))},
+        )
+
+# dependencies run before the endpoint, so limited requests never get to hashing, database or notifiers
+
+async def limit_by_ip(request: Request):
+    await _check(_by_ip, client_ip(request))
+
+async def limit_login(request: Request, form_data: Annotated[OAuth2PasswordRequestForm, Depends()]):
+    await _check(_by_ip, client_ip(request))
+    # credential stuffing comes from many addresses, so the account is limited too
+    await _check(_by_username, form_data.username)
+
+async def limit_reset_password(request: Request, username: str):
+    await _check(_by_ip, client_ip(request))
+    await _check(_by_username, username)
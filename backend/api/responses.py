@@ -0,0 +1,21 @@
+from typing import Any
+
+import pydantic_core
+from fastapi.responses import JSONResponse
+
+class ModelResponse(JSONResponse):
+    """
+    Serializes domain models straight into json in one pass of the pydantic-core serializer
+
+    Returned from a route it skips validation against the response model, which stays in the route only for docs,
+    so it's meant for trusted objects built by usecases and repositories, not for anything taken from the request.
+
+    Attributes:
+        include -- fields sent, others are left out (e.g. hashes of passwords), all of them when None
+    """
+    def __init__(self, content: Any, include: set[str] | dict | None = None, **kwargs):
+        self.include = include
+        super().__init__(content, **kwargs)
+
+    def render(self, content: Any) -> bytes:
+        return pydantic_core.to_json(content, include=self.include)
@@ -1,15 +1,21 @@
 from uuid import UUID
 
-from fastapi import APIRouter
+from fastapi import APIRouter, Depends, HTTPException, status
 
-from utils.late_executor import LateExecutor
+from api import rate_limit
+from api.database import Connection
+
+from utils.late_executor import LateExecutor, TaskNotExistsError
 
 def init(late_executor: LateExecutor) -> APIRouter:
     router = APIRouter(prefix="/confirm", tags=["confirm"])
 
-    @router.get("/{confirmation_id}")
-    def confirm(confirmation_id: UUID):
+    @router.get("/{confirmation_id}", dependencies=[Depends(rate_limit.limit_by_ip)])
+    async def confirm(confirmation_id: UUID, conn: Connection):
         # don't know what to return, maybe just redirect to some other page
-        late_executor.execute_task(confirmation_id)
+        try:
+            await late_executor.execute_task(conn, confirmation_id)
+        except TaskNotExistsError:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Confirmation not found or expired")
 
     return router
\ No newline at end of file
@@ -1,19 +1,26 @@
+from enum import Enum
 from uuid import UUID
 
 from typing import Annotated
 
-from pydantic import BaseModel, PositiveFloat
-from pydantic_extra_types.coordinate import Coordinate
+from pydantic import BaseModel, PositiveFloat, NonNegativeFloat, Field
+from pydantic_extra_types.coordinate import Coordinate, Latitude, Longitude
 
-from fastapi import APIRouter, Query
+from fastapi import APIRouter, Body, HTTPException, Query, status
+from fastapi.responses import StreamingResponse
 
-from api.security import AuthorizedUser
+from api.database import Connection, ReadConnection, StreamingReadConnection
+from api.responses import ModelResponse
+from api.security import AuthorizedUser, ActiveUser
 
-from model import Good as ModelGood, Area as ModelArea,  Message as ModelMessage, LookFilter as ModelLookFilter
+from model import Good as ModelGood, Area as ModelArea,  Message as ModelMessage, LookFilter as ModelLookFilter, \
+    GoodsOrder, DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, DEFAULT_PRICE_BOUNDS, InvalidCursorError
 
 from usecases.goods import GoodUsecase
 from usecases.users import UserUsecase
 
+# models below describe responses in the docs, routes send domain models of the same shape through ModelResponse
+
 class PostGood(BaseModel):
     name: str
     description: str | None = None
@@ -24,37 +31,89 @@ class PostGood(BaseModel):
 class Good(BaseModel):
     id: UUID
     name: str
-    description: str
+    description: str | None = None
     price: float
     images: list[str]
     location: Coordinate | None = None
     owner_id: UUID
     
+class GoodSummary(BaseModel):
+    id: UUID
+    name: str
+    price: float
+    image: str | None = None
+    location: Coordinate | None = None
+
+class Suggestion(BaseModel):
+    id: UUID
+    name: str
+
+class PublishResult(BaseModel):
+    name: str
+    good: Good | None = None
+    error: str | None = None
+
 class Message(BaseModel):
     message: str
     contact_info: str
 
-class Area(BaseModel):
-    place: Coordinate
-    radius: PositiveFloat
-
-class LookParams(BaseModel):
+# query parameters can't be nested, so the search area is flattened
+class ExportParams(BaseModel):
     name: str
-    location: Area | None = None
+    latitude: Latitude | None = None
+    longitude: Longitude | None = None
+    # in meters
+    radius: PositiveFloat | None = None
     user_id: UUID | None = None
+    min_price: NonNegativeFloat | None = None
+    max_price: NonNegativeFloat | None = None
+
+class LookView(str, Enum):
+    full = 'full'
+    # only what list views show, much lighter to fetch and send
+    summary = 'summary'
+
+class LookParams(ExportParams):
+    view: LookView = LookView.full
+    order: GoodsOrder | None = None
+    limit: int = Field(default=DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE)
+    cursor: str | None = None
+
+class FacetParams(ExportParams):
+    # upper bounds of price buckets
+    price_bounds: list[NonNegativeFloat] = Field(default=DEFAULT_PRICE_BOUNDS, min_length=1, max_length=50)
 
 class GoodsList(BaseModel):
     array: list[Good]
+    next_cursor: str | None = None
+
+class GoodSummaryList(BaseModel):
+    array: list[GoodSummary]
+    next_cursor: str | None = None
+
+class PriceBucket(BaseModel):
+    min_price: float | None = None
+    max_price: float | None = None
+    count: int
 
-def model_good_to_good(model_good: ModelGood) -> Good:
-    return Good(id=model_good.id, name=model_good.name, description=model_good.description, price=model_good.price, 
-                images=model_good.images, location=model_good.location, owner_id=model_good.owner_id)
+MAX_PUBLISH_BATCH = 1000
+MAX_SUGGESTIONS = 20
+
+# lines of ndjson sent in one chunk of the export stream
+EXPORT_CHUNK_SIZE = 100
+
+def params_to_look_filter(params: ExportParams) -> ModelLookFilter:
+    area = None
+    if params.latitude is not None and params.longitude is not None and params.radius:
+        area = ModelArea(place=Coordinate(latitude=params.latitude, longitude=params.longitude), radius=params.radius)
+    return ModelLookFilter(name=params.name, location=area, user_id=params.user_id, 
+                           min_price=params.min_price, max_price=params.max_price)
 
 def init(good_usecase: GoodUsecase, user_usecase: UserUsecase) -> APIRouter:
     router = APIRouter(prefix="/goods", tags=["goods"])
 
-    @router.post("/publish")
-    def publish_good(good: PostGood, current_user: AuthorizedUser) -> Good:
+    @router.post("/publish", response_model=Good)
+    async def publish_good(good: PostGood, current_user: ActiveUser, conn: Connection) -> ModelResponse:
         model_good = ModelGood(
             id=None, 
             name=good.name,
@@ -64,16 +123,79 @@ def init(good_usecase: GoodUsecase, user_usecase: UserUsecase) -> APIRouter:
             location=good.location,
             owner_id=current_user.id
         )
-        model_good = good_usecase.publish_good(current_user.id, model_good)
-        return model_good_to_good(model_good)
-
-    @router.get("/{good_id}")
-    def get_good(good_id: UUID) -> Good:
-        model_good = good_usecase.get_good(good_id)
-        return model_good_to_good(model_good)
-
-    @router.post("/{good_id}")
-    def update_good(good_id: UUID, good: PostGood, current_user: AuthorizedUser) -> Good:
+        model_good = await good_usecase.publish_good(conn, current_user.id, model_good)
+        return ModelResponse(model_good)
+
+    @router.post("/publish-batch", response_model=list[PublishResult])
+    async def publish_goods(goods: Annotated[list[PostGood], Body(min_length=1, max_length=MAX_PUBLISH_BATCH)], 
+                            current_user: ActiveUser, conn: Connection) -> ModelResponse:
+        model_goods = [
+            ModelGood(
+                id=None,
+                name=good.name,
+                description=good.description,
+                price=good.price,
+                images=good.images,
+                location=good.location,
+                owner_id=current_user.id
+            ) for good in goods
+        ]
+        model_results = await good_usecase.publish_goods(conn, current_user.id, model_goods)
+        return ModelResponse(model_results)
+
+    # static paths must go before /{good_id}, otherwise they are taken for an id
+    @router.get("/look", response_model=GoodsList | GoodSummaryList)
+    async def look_good(look_query: Annotated[LookParams, Query()], conn: ReadConnection) -> ModelResponse:
+        model_lf = params_to_look_filter(look_query).model_copy(update={
+            "order": look_query.order,
+            "limit": look_query.limit,
+            "cursor": look_query.cursor
+        })
+        # cursor comes from the client, it may be mangled or belong to another ordering
+        try:
+            if look_query.view == LookView.summary:
+                return ModelResponse(await good_usecase.look_summaries(conn, model_lf))
+
+            return ModelResponse(await good_usecase.look_good(conn, model_lf))
+        except InvalidCursorError:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+
+    @router.get("/suggest", response_model=list[Suggestion])
+    async def suggest(prefix: Annotated[str, Query(min_length=1, max_length=150)], conn: ReadConnection,
+                      limit: Annotated[int, Query(ge=1, le=MAX_SUGGESTIONS)] = 10) -> ModelResponse:
+        model_suggestions = await good_usecase.suggest(conn, prefix, limit)
+        return ModelResponse(model_suggestions)
+
+    @router.get("/facets", response_model=list[PriceBucket])
+    async def price_facets(facet_query: Annotated[FacetParams, Query()], conn: ReadConnection) -> ModelResponse:
+        model_lf = params_to_look_filter(facet_query)
+        model_buckets = await good_usecase.price_facets(conn, model_lf, facet_query.price_bounds)
+        return ModelResponse(model_buckets)
+
+    @router.get("/export")
+    async def export_goods(export_query: Annotated[ExportParams, Query()], conn: StreamingReadConnection) -> StreamingResponse:
+        model_lf = params_to_look_filter(export_query)
+
+        # domain goods have the same fields as route ones, so they are dumped directly
+        async def ndjson_chunks():
+            lines = []
+            async for model_good in good_usecase.export_goods(conn, model_lf):
+                lines.append(model_good.model_dump_json())
+                if len(lines) >= EXPORT_CHUNK_SIZE:
+                    yield "\n".join(lines) + "\n"
+                    lines = []
+            if lines:
+                yield "\n".join(lines) + "\n"
+
+        return StreamingResponse(ndjson_chunks(), media_type="application/x-ndjson")
+
+    @router.get("/{good_id}", response_model=Good)
+    async def get_good(good_id: UUID, conn: ReadConnection) -> ModelResponse:
+        model_good = await good_usecase.get_good(conn, good_id)
+        return ModelResponse(model_good)
+
+    @router.post("/{good_id}", response_model=Good)
+    async def update_good(good_id: UUID, good: PostGood, current_user: ActiveUser, conn: Connection) -> ModelResponse:
         model_good = ModelGood(
             id=good_id,
             name=good.name,
@@ -83,15 +205,15 @@ def init(good_usecase: GoodUsecase, user_usecase: UserUsecase) -> APIRouter:
             location=good.location,
             owner_id=current_user.id
         )
-        model_good = good_usecase.update_good(current_user.id, good_id, model_good)
-        return model_good_to_good(model_good)
+        model_good = await good_usecase.update_good(conn, current_user.id, good_id, model_good)
+        return ModelResponse(model_good)
 
     @router.delete("/{good_id}")
-    def delete_good(good_id: UUID, current_user: AuthorizedUser):
-        good_usecase.delete_good(current_user.id, good_id)
+    async def delete_good(good_id: UUID, current_user: AuthorizedUser, conn: Connection):
+        await good_usecase.delete_good(conn, current_user.id, good_id)
 
     @router.post("/{good_id}/message")
-    def message_good_owner(good_id: UUID, message: Message, current_user: AuthorizedUser):
+    async def message_good_owner(good_id: UUID, message: Message, current_user: ActiveUser, conn: Connection):
         model_message = ModelMessage(
             sender=current_user.id,
             recipient=None,
@@ -99,16 +221,6 @@ def init(good_usecase: GoodUsecase, user_usecase: UserUsecase) -> APIRouter:
             message=message.message,
             contact_info=message.contact_info
         )
-        user_usecase.message_owner(model_message)
-
-    @router.get("/look")
-    def look_good(look_query: Annotated[LookParams, Query()]) -> GoodsList:
-        model_lf = ModelLookFilter(
-            name=look_query.name,
-            location=ModelArea(place=look_query.location.place, radius=look_query.location.radius),
-            user_id=look_query.user_id
-        )
-        model_goods_list = good_usecase.look_good(model_lf)
-        return GoodsList(array=[model_good_to_good(model_good) for model_good in model_goods_list.array])
+        await user_usecase.message_owner(conn, model_message)
 
     return router
\ No newline at end of file
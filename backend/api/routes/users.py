@@ -6,17 +6,23 @@ from typing import Annotated
 
 from pydantic import BaseModel, NameEmail
 
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Request, status
 from fastapi.security import OAuth2PasswordRequestForm
 
-from api.security import Token, create_access_token, AuthorizedUser
-from utils.security import verify_password
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+from api import database, rate_limit
+from api.database import Connection, ReadConnection
+from api.responses import ModelResponse
+from api.security import Token, create_access_token, user_claims, AuthorizedUser
+from utils.security import verify_and_update_password, PasswordHashingBusyError
 
 from usecases.users import UserUsecase
 
-from model import User as ModelUser, ActiveTime as ModelActiveTime
+from model import User as ModelUser, ActiveTime as ModelActiveTime, UserNotFoundError
 
-from config import config
+import logging
+logger = logging.getLogger(__name__)
 
 class ActiveTime(BaseModel):
     from_hour: int
@@ -37,15 +43,21 @@ class UpdateConfirmation(BaseModel):
     email: NameEmail | None = None
     telegram: str | None = None
 
-def model_user_to_user(model_user: ModelUser) -> User:
-    return User(name=model_user.name, active_time=ActiveTime(from_hour=model_user.active_time.from_hour, 
-                                                             to_hour=model_user.active_time.to_hour))
+# fields of the domain user that User has, the rest (hash of the password, confirmation addresses) is never sent
+USER_FIELDS = {"name": True, "active_time": True}
+
+def hashing_busy_exception() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail="Too many password checks at the moment, try again later",
+        headers={"Retry-After": "1"},
+    )
 
-def init(user_usecase: UserUsecase) -> APIRouter:
+def init(user_usecase: UserUsecase, access_token_expires: timedelta) -> APIRouter:
     router = APIRouter(prefix="/users", tags=["users"])
     
-    @router.post("/register")
-    def register_user(user: CreateUser) -> User:
+    @router.post("/register", response_model=User)
+    async def register_user(user: CreateUser, conn: Connection) -> ModelResponse:
         model_user = ModelUser(
             id = None,
             name = user.name,
@@ -55,59 +67,79 @@ def init(user_usecase: UserUsecase) -> APIRouter:
             telegram = user.telegram,
             active = False
         )
-        model_user = user_usecase.register_user(model_user, user.pasword)
-        return model_user_to_user(model_user)
-
-    @router.get("/{user_id}")
-    def get_user(user_id: UUID) -> User:
-        model_user = user_usecase.get_user(user_id)
-        return model_user_to_user(model_user)
-
-    @router.get("/username/{username}")
-    def get_user_by_username(username: str) -> User:
-        model_user = user_usecase.get_by_username(username)
-        return model_user_to_user(model_user)
-
-    def authenticate_user(username: str, password: str):
-        user = user_usecase.get_by_username(username)
-        if not user:
+        try:
+            model_user = await user_usecase.register_user(conn, model_user, user.pasword)
+        except PasswordHashingBusyError:
+            raise hashing_busy_exception()
+        return ModelResponse(model_user, include=USER_FIELDS)
+
+    @router.get("/{user_id}", response_model=User)
+    async def get_user(user_id: UUID, conn: ReadConnection) -> ModelResponse:
+        model_user = await user_usecase.get_user(conn, user_id)
+        return ModelResponse(model_user, include=USER_FIELDS)
+
+    @router.get("/username/{username}", response_model=User)
+    async def get_user_by_username(username: str, conn: ReadConnection) -> ModelResponse:
+        model_user = await user_usecase.get_by_username(conn, username)
+        return ModelResponse(model_user, include=USER_FIELDS)
+
+    async def authenticate_user(request: Request, conn: AsyncConnection, username: str, password: str):
+        try:
+            user = await user_usecase.get_by_username(conn, username)
+        except UserNotFoundError:
             return False
-        if not verify_password(password, user.hashed_pasword):
+        valid, new_hash = await verify_and_update_password(password, user.hashed_pasword)
+        if not valid:
             return False
+        if new_hash:
+            # hash was made with old parameters, login shouldn't fail because of that;
+            # it's rare, so the primary is taken only for it and the login itself reads from a replica
+            try:
+                async with database.transaction() as primary_conn:
+                    user = await user_usecase.update_password_hash(primary_conn, user, new_hash)
+                database.remember_wrote(request)
+            except Exception as e:
+                logger.warning("failed to rehash password of user %s: %s", user.id, e)
         return user
 
-    @router.post("/authorize")
-    def authorize_user(form_data: Annotated[OAuth2PasswordRequestForm, Depends()]) -> Token:
-        user = authenticate_user(form_data.username, form_data.password)
+    @router.post("/authorize", dependencies=[Depends(rate_limit.limit_login)])
+    async def authorize_user(request: Request, form_data: Annotated[OAuth2PasswordRequestForm, Depends()],
+                             conn: ReadConnection) -> Token:
+        try:
+            user = await authenticate_user(request, conn, form_data.username, form_data.password)
+        except PasswordHashingBusyError:
+            raise hashing_busy_exception()
         if not user:
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
                 detail="Incorrect username or password",
                 headers={"WWW-Authenticate": "Bearer"},
             )
-        access_token_expires = timedelta(minutes=config.security.access_token_expire_minutes)
         access_token = create_access_token(
-            data={"sub": user.name}, expires_delta=access_token_expires
+            data=user_claims(user), expires_delta=access_token_expires
         )
         return Token(access_token=access_token, token_type="bearer")
 
-    @router.post("/update")
-    def update_user(user: User, current_user: AuthorizedUser) -> User:
-        model_user = user_usecase.update_user_info(current_user.id, user.name, 
+    @router.post("/update", response_model=User)
+    async def update_user(user: User, current_user: AuthorizedUser, conn: Connection) -> ModelResponse:
+        model_user = await user_usecase.update_user_info(conn, current_user.id, user.name, 
             None if not user.active_time else ModelActiveTime(from_hour=user.active_time.from_hour, 
                                                               to_hour=user.active_time.to_hour))
-        return model_user_to_user(model_user)
+        return ModelResponse(model_user, include=USER_FIELDS)
 
     @router.post("/change-password")
-    def change_password(old_password: str, new_password: str, current_user: AuthorizedUser):
-        user_usecase.change_password(current_user.id, old_password, new_password)
+    async def change_password(old_password: str, new_password: str, current_user: AuthorizedUser, conn: Connection):
+        try:
+            await user_usecase.change_password(conn, current_user.id, old_password, new_password)
+        except PasswordHashingBusyError:
+            raise hashing_busy_exception()
 
-    @router.post("/reset-password")
-    def reset_password(username: str):
-        user_usecase.reset_password(username)
+    @router.post("/reset-password", dependencies=[Depends(rate_limit.limit_reset_password)])
+    async def reset_password(username: str, conn: Connection):
+        await user_usecase.reset_password(conn, username)
 
     @router.post("/update-confirmation")
-    def update_confirmation(new_confirmation: UpdateConfirmation, current_user: AuthorizedUser):
-        user_usecase.update_confirmation(current_user.id, new_confirmation.email, new_confirmation.telegram)
+    async def update_confirmation(new_confirmation: UpdateConfirmation, current_user: AuthorizedUser, conn: Connection):
+        await user_usecase.update_confirmation(conn, current_user.id, new_confirmation.email, new_confirmation.telegram)
 
     return router
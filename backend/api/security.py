@@ -1,32 +1,51 @@
+import asyncio
 from datetime import datetime, timedelta, timezone
 from typing import Annotated
+from uuid import UUID
 
 import jwt
 from jwt.exceptions import InvalidTokenError
 
-from pydantic import BaseModel
+from pydantic import BaseModel, ValidationError
 
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 
-from config import config
+from config import SecuritySettings
 
-from model import User
+from api import database
+
+from model import User, Principal, UserNotFoundError
 
 from usecases.users import UserUsecase
 
+from utils.cache import TTLCache
+from utils.revocations import RevocationList
+
+import logging
+logger = logging.getLogger(__name__)
+
+# seconds, revocations this recent are read again in case they were committed out of id order
+REVOCATION_OVERLAP = 60
+
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/users/authorize")
 
 def create_access_token(data: dict, expires_delta: timedelta | None = None):
     to_encode = data.copy()
+    now = datetime.now(timezone.utc)
     if expires_delta:
-        expire = datetime.now(timezone.utc) + expires_delta
+        expire = now + expires_delta
     else:
-        expire = datetime.now(timezone.utc) + timedelta(minutes=15)
-    to_encode.update({"exp": expire})
-    encoded_jwt = jwt.encode(to_encode, config.security.secretkey, algorithm=config.security.algorithm)
+        expire = now + timedelta(minutes=15)
+    # iat isn't rounded to seconds, so a token issued right after revocation isn't taken for an older one
+    to_encode.update({"exp": expire, "iat": now.timestamp()})
+    encoded_jwt = jwt.encode(to_encode, _settings.secretkey, algorithm=_settings.algorithm)
     return encoded_jwt
 
+def user_claims(user: User) -> dict:
+    # enough to build the principal without going to the database
+    return {"sub": user.name, "uid": str(user.id), "act": user.active}
+
 class Token(BaseModel):
     access_token: str
     token_type: str
@@ -34,31 +53,113 @@ class Token(BaseModel):
 
 class TokenData(BaseModel):
     username: str | None = None
+    user_id: UUID | None = None
+    active: bool | None = None
+    issued_at: float | None = None
     
 # something resembling singleton
+_settings: SecuritySettings | None = None
 _user_usecase: UserUsecase | None = None
+# user id -> user, entries don't outlive the token
+_user_cache: TTLCache | None = None
+_revocations: RevocationList | None = None
 
-def init(user_usecase: UserUsecase) -> Annotated:
-    global _user_usecase
+def invalidate_user(user_id: UUID):
+    if _user_cache is not None:
+        _user_cache.pop(user_id)
+
+def revoke_tokens(user_id: UUID, revoked_at: datetime):
+    if _revocations is not None:
+        _revocations.revoke(user_id, revoked_at)
+
+def stats() -> dict[str, dict[str, int]]:
+    if _user_cache is None:
+        return dict()
+    return {"user_cache": _user_cache.stats(), "revocations": {"users": len(_revocations)}}
+
+def init(user_usecase: UserUsecase, settings: SecuritySettings) -> Annotated:
+    global _settings, _user_usecase, _user_cache, _revocations
+    _settings = settings
     _user_usecase = user_usecase
+    _user_cache = TTLCache(settings.user_cache_size, settings.user_cache_ttl)
+    _revocations = RevocationList(settings.access_token_expire_minutes * 60)
+    if user_usecase:
+        user_usecase.add_user_changed_listener(invalidate_user)
+        user_usecase.add_tokens_revoked_listener(revoke_tokens)
+
+async def refresh_revocations():
+    # revocations made by other workers, this one applies its own right away
+    now = datetime.now(timezone.utc)
+    async with database.transaction() as conn:
+        revocations = await _user_usecase.get_revocations(
+            conn,
+            since=now - timedelta(seconds=_revocations.lifetime),
+            after_id=_revocations.last_id,
+            recent=now - timedelta(seconds=REVOCATION_OVERLAP)
+        )
+    _revocations.apply(revocations)
+    _revocations.prune(now.timestamp())
 
-async def get_current_user(token: Annotated[str, Depends(oauth2_scheme)]) -> User:
+async def refresh_revocations_forever():
+    while True:
+        try:
+            await refresh_revocations()
+        except Exception as e:
+            # tokens are still checked against what was loaded before
+            logger.warning("failed to refresh token revocations: %s", e)
+        await asyncio.sleep(_settings.revocation_refresh_interval)
+
+async def get_current_user(token: Annotated[str, Depends(oauth2_scheme)]) -> Principal:
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
     try:
-        payload = jwt.decode(token, config.security.secretkey, algorithms=[config.security.algorithm])
+        payload = jwt.decode(token, _settings.secretkey, algorithms=[_settings.algorithm])
         username = payload.get("sub")
         if username is None:
             raise credentials_exception
-        token_data = TokenData(username=username)
-    except InvalidTokenError:
+        token_data = TokenData(username=username, user_id=payload.get("uid"), active=payload.get("act"),
+                               issued_at=payload.get("iat"))
+    except (InvalidTokenError, ValidationError):
         raise credentials_exception
-    user = _user_usecase.get_by_username(token_data.username)
-    if user is None:
+
+    if token_data.user_id is not None and token_data.issued_at is not None \
+            and _revocations.is_revoked(token_data.user_id, token_data.issued_at):
         raise credentials_exception
-    return user
 
-AuthorizedUser = Annotated[User, Depends(get_current_user)]
+    if _settings.stateless_tokens and token_data.user_id is not None and token_data.active:
+        # signature is all that's checked, changes of the user reach it with the next token or a revocation;
+        # deactivation revokes tokens, but activation doesn't reissue them, so inactive ones are looked up
+        return Principal(id=token_data.user_id, name=token_data.username, active=token_data.active)
+
+    async def load_user():
+        # a connection is taken only on a miss, so requests served from the cache don't touch the pool
+        async with database.transaction() as conn:
+            if token_data.user_id is None:
+                return await _user_usecase.get_by_username(conn, token_data.username)
+            return await _user_usecase.get_user(conn, token_data.user_id)
+
+    ttl = _settings.user_cache_ttl
+    if "exp" in payload:
+        ttl = min(ttl, payload["exp"] - datetime.now(timezone.utc).timestamp())
+    try:
+        if token_data.user_id is None:
+            # tokens issued before they carried the id can't be invalidated by it, so they aren't cached
+            user = await load_user()
+        else:
+            user = await _user_cache.get_or_load(token_data.user_id, load_user, ttl=ttl)
+    except UserNotFoundError:
+        raise credentials_exception
+    return Principal(id=user.id, name=user.name, active=user.active)
+
+AuthorizedUser = Annotated[Principal, Depends(get_current_user)]
+
+async def get_active_user(current_user: AuthorizedUser) -> Principal:
+    # users who haven't confirmed their address yet can manage their account, but not show anything to others
+    if not current_user.active:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="User is not active")
+    return current_user
+
+ActiveUser = Annotated[Principal, Depends(get_active_user)]
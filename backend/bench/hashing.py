@@ -0,0 +1,100 @@
+import argparse
+import asyncio
+import os
+import statistics
+import time
+
+from utils import security
+
+import logging
+logger = logging.getLogger(__name__)
+
+PASSWORD = "correct horse battery staple"
+
+def percentile(samples: list[float], q: float) -> float:
+    if not samples:
+        return 0.0
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(q * len(samples)))]
+
+async def probe_loop(stop: asyncio.Event, lags: list[float]):
+    # what any other request on this worker waits for the event loop
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(0.001)
+        lags.append((time.perf_counter() - started - 0.001) * 1000)
+
+async def login(hashed: str, inline: bool, latencies: list[float], rejected: list[int]):
+    started = time.perf_counter()
+    try:
+        if inline:
+            # how it was before the pool, argon2 right on the event loop
+            security.check_and_update_password(PASSWORD, hashed)
+        else:
+            await security.verify_and_update_password(PASSWORD, hashed)
+    except security.PasswordHashingBusyError:
+        rejected[0] += 1
+        return
+    latencies.append((time.perf_counter() - started) * 1000)
+
+async def run_case(hashed: str, concurrency: int, duration: float, inline: bool) -> dict[str, float]:
+    latencies, lags, rejected = [], [], [0]
+    stop = asyncio.Event()
+    prober = asyncio.create_task(probe_loop(stop, lags))
+
+    async def client():
+        while not stop.is_set():
+            await login(hashed, inline, latencies, rejected)
+            # lets the prober in when hashing is inline
+            await asyncio.sleep(0)
+
+    clients = [asyncio.create_task(client()) for _ in range(concurrency)]
+    started = time.perf_counter()
+    await asyncio.sleep(duration)
+    stop.set()
+    await asyncio.gather(*clients, prober)
+    took = time.perf_counter() - started
+
+    return {
+        "logins_per_s": len(latencies) / took,
+        "p50_ms": statistics.median(latencies) if latencies else 0.0,
+        "p99_ms": percentile(latencies, 0.99),
+        "rejected": rejected[0],
+        "loop_lag_p99_ms": percentile(lags, 0.99),
+    }
+
+async def run(pool_sizes: list[int], concurrency: int, duration: float, max_queue: int, processes: bool):
+    hashed = security.get_password_hash(PASSWORD)
+    started = time.perf_counter()
+    security.check_password(PASSWORD, hashed)
+    print(f"{concurrency} concurrent logins for {duration} s each, one verify takes {(time.perf_counter() - started) * 1000:.1f} ms")
+    print(f"{'pool':>8} {'logins/s':>10} {'p50 ms':>10} {'p99 ms':>10} {'rejected':>10} {'loop lag p99 ms':>16}")
+
+    cases = [("inline", None)] + [(str(size), size) for size in pool_sizes]
+    for label, size in cases:
+        if size is not None:
+            security.init_pool(workers=size, max_queue=max_queue, processes=processes)
+        result = await run_case(hashed, concurrency, duration, inline=size is None)
+        print(f"{label:>8} {result['logins_per_s']:>10.1f} {result['p50_ms']:>10.1f} {result['p99_ms']:>10.1f} "
+              f"{result['rejected']:>10} {result['loop_lag_p99_ms']:>16.1f}")
+    security.shutdown_pool()
+
+if __name__ == "__main__":
+    cores = os.cpu_count() or 1
+    parser = argparse.ArgumentParser(description="Login throughput (argon2 verify) of one worker by hashing pool size")
+    parser.add_argument("--pool-sizes", default=",".join(str(size) for size in sorted({1, 2, 4, cores})),
+                        help="comma separated numbers of hashing workers")
+    parser.add_argument("--concurrency", type=int, default=64, help="logins in flight at once")
+    parser.add_argument("--duration", type=float, default=5, help="seconds per pool size")
+    parser.add_argument("--max-queue", type=int, default=64)
+    parser.add_argument("--processes", action="store_true", help="process pool instead of threads")
+    parser.add_argument("--budget-ms", type=float, default=None,
+                        help="calibrate argon2 to this budget first, pwdlib defaults otherwise")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    if args.budget_ms:
+        time_cost, memory_cost = security.calibrate(args.budget_ms)
+        security.configure_hasher(time_cost, memory_cost, 4)
+    asyncio.run(run([int(size) for size in args.pool_sizes.split(",")], args.concurrency, args.duration,
+                    args.max_queue, args.processes))
@@ -0,0 +1,96 @@
+import argparse
+import random
+import time
+from typing import Annotated
+from uuid import uuid4
+
+from fastapi import APIRouter, FastAPI, Query
+from fastapi.testclient import TestClient
+
+from pydantic_extra_types.coordinate import Coordinate
+
+from api import database
+from api.routes import goods as goods_routes
+
+from model import Good, GoodsList, LookFilter
+
+import logging
+logger = logging.getLogger(__name__)
+
+def fake_goods(count: int) -> GoodsList:
+    owner_id = uuid4()
+    return GoodsList(array=[
+        Good(id=uuid4(), name=f"good {i}", description="description " * 20, price=random.uniform(1, 1000),
+             images=[f"{i}-1.png", f"{i}-2.png"],
+             location=Coordinate(latitude=random.uniform(-90, 90), longitude=random.uniform(-180, 180)),
+             owner_id=owner_id)
+        for i in range(count)
+    ], next_cursor="cursor")
+
+class FakeGoodUsecase:
+    """
+    Answers look_good with the same page every time, so only the route and serialization are measured
+    """
+    def __init__(self, page: GoodsList):
+        self.page = page
+
+    async def look_good(self, conn, look_filter: LookFilter) -> GoodsList:
+        return self.page
+
+def validated_router(good_usecase: FakeGoodUsecase) -> APIRouter:
+    # the route as it was before, domain goods copied into route ones and validated against the response model
+    router = APIRouter(prefix="/validated")
+
+    @router.get("/look")
+    async def look_good(look_query: Annotated[goods_routes.LookParams, Query()],
+                        conn: database.ReadConnection) -> goods_routes.GoodsList:
+        goods_list = await good_usecase.look_good(conn, goods_routes.params_to_look_filter(look_query))
+        return goods_routes.GoodsList(
+            array=[goods_routes.Good(id=good.id, name=good.name, description=good.description, price=good.price,
+                                     images=good.images, location=good.location, owner_id=good.owner_id)
+                   for good in goods_list.array],
+            next_cursor=goods_list.next_cursor
+        )
+
+    return router
+
+async def no_connection():
+    yield None
+
+def measure(client: TestClient, url: str, requests: int) -> tuple[float, int]:
+    # requests per second and size of a response
+    size = len(client.get(url).content)
+    started = time.perf_counter()
+    for _ in range(requests):
+        response = client.get(url)
+        response.raise_for_status()
+    return requests / (time.perf_counter() - started), size
+
+def run(count: int, requests: int):
+    good_usecase = FakeGoodUsecase(fake_goods(count))
+
+    app = FastAPI()
+    app.include_router(goods_routes.init(good_usecase, None))
+    app.include_router(validated_router(good_usecase))
+    app.dependency_overrides[database.get_read_connection] = no_connection
+    # without the context manager, so the lifespan doesn't connect to a database
+    client = TestClient(app)
+
+    print(f"{count} goods per response, {requests} requests")
+    print(f"{'route':<12} {'requests/s':>12} {'ms per request':>16} {'bytes':>10}")
+    for name, url in [("validated", "/validated/look?name=good"), ("direct", "/goods/look?name=good")]:
+        rps, size = measure(client, url, requests)
+        print(f"{name:<12} {rps:>12.1f} {1000 / rps:>16.2f} {size:>10}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Throughput of /goods/look with a fake usecase: goods copied into route models and validated "
+                    "against the response model, as before, against domain models serialized directly"
+    )
+    parser.add_argument("--goods", type=int, default=1000, help="goods per response")
+    parser.add_argument("--requests", type=int, default=200)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    random.seed(0)
+    run(args.goods, args.requests)
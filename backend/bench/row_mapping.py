@@ -0,0 +1,103 @@
+import argparse
+import random
+import time
+from uuid import uuid4
+
+from model import Good, GoodSummary, User, ActiveTime, Coordinate
+
+from repositories.goods import good_from_row, summary_from_row
+from repositories.users import user_from_row
+
+import logging
+logger = logging.getLogger(__name__)
+
+class FakeRow:
+    """
+    Stands in for sqlalchemy Row, mappers only read columns by name through _mapping
+    """
+    __slots__ = ("_mapping",)
+
+    def __init__(self, mapping: dict):
+        self._mapping = mapping
+
+def fake_good_rows(count: int) -> list[FakeRow]:
+    owner_id = uuid4()
+    return [FakeRow({
+        "id": uuid4(),
+        "name": f"good {i}",
+        "description": "description " * 20,
+        "price": random.uniform(1, 1000),
+        "images": [f"{i}-1.png", f"{i}-2.png"],
+        "image": f"{i}-1.png",
+        "latitude": random.uniform(-90, 90),
+        "longitude": random.uniform(-180, 180),
+        "owner_id": owner_id,
+    }) for i in range(count)]
+
+def fake_user_rows(count: int) -> list[FakeRow]:
+    return [FakeRow({
+        "id": uuid4(),
+        "name": f"user {i}",
+        "hashed_password": "$argon2id$v=19$m=65536,t=3,p=4$" + "a" * 60,
+        "active_from": 8,
+        "active_to": 20,
+        "email": f"user{i}@example.com",
+        "telegram": None,
+        "active": True,
+    }) for i in range(count)]
+
+# validated construction, as the mappers did before
+
+def good_validated(row) -> Good:
+    row = row._mapping
+    location = None
+    if row["latitude"] is not None and row["longitude"] is not None:
+        location = Coordinate(latitude=row["latitude"], longitude=row["longitude"])
+    return Good(id=row["id"], name=row["name"], description=row["description"], price=row["price"],
+                images=row["images"], location=location, owner_id=row["owner_id"])
+
+def summary_validated(row) -> GoodSummary:
+    row = row._mapping
+    location = None
+    if row["latitude"] is not None and row["longitude"] is not None:
+        location = Coordinate(latitude=row["latitude"], longitude=row["longitude"])
+    return GoodSummary(id=row["id"], name=row["name"], price=row["price"], image=row["image"], location=location)
+
+def user_validated(row) -> User:
+    row = row._mapping
+    return User(id=row["id"], name=row["name"], hashed_pasword=row["hashed_password"],
+                active_time=ActiveTime(from_hour=row["active_from"], to_hour=row["active_to"]),
+                email=row["email"], telegram=row["telegram"], active=row["active"])
+
+def measure(mapper, rows: list[FakeRow]) -> float:
+    started = time.perf_counter()
+    for row in rows:
+        mapper(row)
+    return time.perf_counter() - started
+
+def run(count: int):
+    good_rows = fake_good_rows(count)
+    cases = [
+        ("goods", good_rows, good_validated, good_from_row),
+        ("summaries", good_rows, summary_validated, summary_from_row),
+        ("users", fake_user_rows(count), user_validated, user_from_row),
+    ]
+    print(f"{count} rows")
+    print(f"{'model':<10} {'validated s':>12} {'mapper s':>10} {'us per row':>18} {'speedup':>8}")
+    for name, rows, validated, mapper in cases:
+        # warm up, otherwise whichever goes first pays for it
+        measure(validated, rows[:1000])
+        measure(mapper, rows[:1000])
+        slow = measure(validated, rows)
+        fast = measure(mapper, rows)
+        per_row = f"{slow / count * 1e6:.2f} -> {fast / count * 1e6:.2f}"
+        print(f"{name:<10} {slow:>12.3f} {fast:>10.3f} {per_row:>18} {slow / fast:>7.1f}x")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Row to model mapping: validated models against the mappers of repositories")
+    parser.add_argument("--rows", type=int, default=100000)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    random.seed(0)
+    run(args.rows)
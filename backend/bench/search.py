@@ -0,0 +1,121 @@
+import argparse
+import asyncio
+import itertools
+import random
+import statistics
+import time
+from uuid import uuid4
+
+import sqlalchemy as sa
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+from config import get_config
+
+from model import Good, User, ActiveTime, LookFilter
+
+from repositories.database import create_engine
+from repositories.goods import GoodRepo, filter_goods, goods_table
+from repositories.users import UsersRepo
+
+import logging
+logger = logging.getLogger(__name__)
+
+# words of names are drawn from a made up vocabulary with zipf frequencies, like words of real listings:
+# a few are in a good share of the names, most are rare
+VOCABULARY_SIZE = 20000
+SYLLABLES = [consonant + vowel for consonant in "bdfgklmnprstvz" for vowel in "aeiou"]
+WORDS_PER_NAME = 3
+WORDS_PER_DESCRIPTION = 8
+# ranks of the words searched for, from the most common to rare ones
+QUERY_RANKS = [1, 10, 100, 1000, 10000]
+
+def make_vocabulary() -> list[str]:
+    words = set()
+    while len(words) < VOCABULARY_SIZE:
+        words.add("".join(random.choices(SYLLABLES, k=random.randint(2, 4))))
+    return sorted(words, key=lambda word: random.random())
+
+def make_queries(vocabulary: list[str]) -> list[str]:
+    queries = [vocabulary[rank - 1] for rank in QUERY_RANKS]
+    # misspelled, found only by the trigram part of the search
+    queries.append(vocabulary[99][:-1] + "x")
+    return queries
+
+class Names:
+    def __init__(self, vocabulary: list[str]):
+        self.vocabulary = vocabulary
+        self.weights = list(itertools.accumulate(1 / rank for rank in range(1, len(vocabulary) + 1)))
+
+    def words(self, count: int) -> list[str]:
+        return random.choices(self.vocabulary, cum_weights=self.weights, k=count)
+
+def fake_goods(names: Names, owner_id, start: int, count: int) -> list[Good]:
+    goods = []
+    for i in range(start, start + count):
+        name = " ".join(names.words(WORDS_PER_NAME)) + f" {i}"
+        goods.append(Good(name=name, description=" ".join(names.words(WORDS_PER_DESCRIPTION)),
+                          price=random.uniform(1, 1000), images=[], owner_id=owner_id))
+    return goods
+
+async def count_matches(conn: AsyncConnection, query: str) -> int:
+    stmt = filter_goods(select(sa.func.count()).select_from(goods_table), LookFilter(name=query))
+    return (await conn.execute(stmt)).scalar_one()
+
+async def measure(conn: AsyncConnection, repo: GoodRepo, queries: list[str], rounds: int) -> dict[str, tuple[int, float]]:
+    # matches and median ms of the first page per query
+    timings = dict()
+    for query in queries:
+        samples = []
+        for _ in range(rounds):
+            started = time.perf_counter()
+            await repo.look_good(conn, LookFilter(name=query, limit=20))
+            samples.append((time.perf_counter() - started) * 1000)
+        timings[query] = (await count_matches(conn, query), statistics.median(samples))
+    return timings
+
+async def run(sizes: list[int], rounds: int):
+    engine = create_engine(get_config().postgres)
+    repo = GoodRepo()
+    vocabulary = make_vocabulary()
+    names = Names(vocabulary)
+    queries = make_queries(vocabulary)
+    try:
+        async with engine.connect() as conn:
+            # everything is rolled back at the end, so it can be pointed at a database with real data
+            transaction = await conn.begin()
+            owner = await UsersRepo().add_nonactive(conn, User(
+                name=f"bench-{uuid4().hex[:12]}", hashed_pasword="-", active_time=ActiveTime(from_hour=0, to_hour=0),
+                telegram=f"bench-{uuid4().hex[:12]}", active=False
+            ))
+
+            inserted = 0
+            print(f"{'goods':>10} " + " ".join(f"{query:>20}" for query in queries) + "   (matches / median ms)")
+            for size in sorted(sizes):
+                while inserted < size:
+                    count = min(size - inserted, 4000)
+                    await repo.add_goods(conn, fake_goods(names, owner.id, inserted, count))
+                    inserted += count
+                await conn.exec_driver_sql("ANALYZE goods")
+
+                timings = await measure(conn, repo, queries, rounds)
+                print(f"{size:>10} " + " ".join(f"{f'{matches} / {took:.2f}':>20}" for matches, took in
+                                                  (timings[query] for query in queries)))
+
+            await transaction.rollback()
+    finally:
+        await engine.dispose()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Latency of name search while the goods table grows, needs a migrated database from config; "
+                    "GIN indexes find the matches, but every match is ranked before the page is cut, "
+                    "so latency follows the number of matches of the query rather than the size of the table"
+    )
+    parser.add_argument("--sizes", default="10000,100000,1000000", help="comma separated numbers of goods")
+    parser.add_argument("--rounds", type=int, default=20, help="lookups per query and size")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    random.seed(0)
+    asyncio.run(run([int(size) for size in args.sizes.split(",")], args.rounds))
@@ -0,0 +1,100 @@
+import argparse
+import time
+from uuid import uuid4
+
+from sqlalchemy import select, update
+from sqlalchemy.dialects.postgresql import asyncpg
+from sqlalchemy.util import LRUCache
+
+from model import Good, User, ActiveTime, Coordinate
+
+from repositories import goods, users
+
+import logging
+logger = logging.getLogger(__name__)
+
+dialect = asyncpg.dialect()
+
+def execute_overhead(stmt, params: dict, compiled_cache: LRUCache | None):
+    """
+    What Connection.execute does on the python side before the driver gets the statement:
+    cache key, lookup or compilation, parameters; a database isn't needed for that part
+    """
+    compiled, extracted, _, _ = stmt._compile_w_cache(
+        dialect=dialect, compiled_cache=compiled_cache, column_keys=sorted(params),
+        for_executemany=False, schema_translate_map=None, linting=0
+    )
+    compiled.construct_params(params, extracted_parameters=extracted, escape_names=False)
+
+# statements as repositories built them on every call before
+
+def get_good_built(good_id):
+    return select(*goods.good_columns).where(goods.goods_table.c.id == good_id), {}
+
+def update_good_built(good_id, good: Good):
+    stmt = update(goods.goods_table).where(goods.goods_table.c.id == good_id).values(
+        name=good.name,
+        description=good.description,
+        price=good.price,
+        images=good.images,
+        location=goods.location_value(good.location),
+        owner_id=good.owner_id
+    ).returning(*goods.good_columns)
+    return stmt, {}
+
+def get_user_built(user_id):
+    return select(users.users_table).where(users.users_table.c.id == user_id), {}
+
+# and as they are prebuilt now, only parameters are made per call
+
+def get_good_prebuilt(good_id):
+    return goods.get_good_stmt, {"good_id": good_id}
+
+def update_good_prebuilt(good_id, good: Good):
+    return goods.update_good_stmt, {"good_id": good_id, **goods.good_params(good)}
+
+def get_user_prebuilt(user_id):
+    return users.get_user_stmt, {"user_id": user_id}
+
+def measure(make, args, calls: int, compiled_cache: LRUCache | None) -> float:
+    # microseconds per call, arguments change every call like ids of requests do
+    started = time.perf_counter()
+    for i in range(calls):
+        stmt, params = make(*args[i % len(args)])
+        execute_overhead(stmt, params, compiled_cache)
+    return (time.perf_counter() - started) / calls * 1e6
+
+def run(calls: int):
+    owner_id = uuid4()
+    goods_args = [(uuid4(), Good(name=f"good {i}", description="description", price=i, images=["a.png"],
+                                 location=Coordinate(latitude=55.75, longitude=37.61), owner_id=owner_id))
+                  for i in range(100)]
+    ids = [(good_id,) for good_id, _ in goods_args]
+
+    cases = [
+        ("goods.get_good", get_good_built, get_good_prebuilt, ids),
+        ("goods.update_good", update_good_built, update_good_prebuilt, goods_args),
+        ("users.get_user", get_user_built, get_user_prebuilt, ids),
+    ]
+    print(f"{'statement':<20} {'built, no cache':>16} {'built, cached':>14} {'prebuilt':>10}   (us per call)")
+    for name, built, prebuilt, args in cases:
+        # warm up, so the cached columns compare lookups and not the first compilation
+        cache = LRUCache(500)
+        measure(built, args, 100, cache)
+        measure(prebuilt, args, 100, cache)
+
+        uncached = measure(built, args, max(1, calls // 10), None)
+        cached = measure(built, args, calls, cache)
+        reused = measure(prebuilt, args, calls, cache)
+        print(f"{name:<20} {uncached:>16.1f} {cached:>14.1f} {reused:>10.1f}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Python side overhead per repository call: statements built every call against prebuilt ones; "
+                    "prepared statements of asyncpg save a parse on the server on top of that, which needs a database to see"
+    )
+    parser.add_argument("--calls", type=int, default=20000)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    run(args.calls)
@@ -1,6 +1,6 @@
 from enum import Enum
 
-from pydantic import BaseModel, PositiveInt
+from pydantic import BaseModel, PositiveInt, PositiveFloat, NonNegativeInt, NonNegativeFloat
 
 from pydantic_settings import BaseSettings, PydanticBaseSettingsSource, YamlConfigSettingsSource, DotEnvSettingsSource
 
@@ -8,12 +8,139 @@ class SecuritySettings(BaseModel):
     secretkey: str
     algorithm: str
     access_token_expire_minutes: PositiveInt = 30
+    # authenticated users cached by id; a change of the user drops it only from the cache of the worker
+    # that made it, other workers keep serving the old user for up to user_cache_ttl seconds
+    user_cache_size: PositiveInt = 10000
+    user_cache_ttl: PositiveFloat = 60
+    # argon2 parameters, pwdlib defaults if not set; hashes made with other ones are rehashed on login
+    hash_time_cost: PositiveInt | None = None
+    # KiB
+    hash_memory_cost: PositiveInt | None = None
+    hash_parallelism: PositiveInt = 4
+    # pick time and memory costs at startup so that a hash takes about hash_budget_ms on this machine,
+    # otherwise run `make calibrate` once per instance type and put the result here
+    calibrate_hashing: bool = False
+    hash_budget_ms: PositiveFloat = 50
+    # trust user id and activity carried by the token instead of reading the user on every request,
+    # only revoked tokens are rejected then
+    stateless_tokens: bool = False
+    # seconds between reads of revocations made by other workers
+    revocation_refresh_interval: PositiveFloat = 5
+
+class HashingExecutor(str, Enum):
+    thread = 'thread'
+    process = 'process'
+
+class PasswordHashingSettings(BaseModel):
+    # argon2 releases the GIL, so threads are usually enough
+    executor: HashingExecutor = HashingExecutor.thread
+    # hashes computed at the same time, cpu count if not set
+    workers: PositiveInt | None = None
+    # hashes waiting for a worker, requests above that get 503
+    max_queue: NonNegativeInt = 64
 
 class Postgres(BaseModel):
     username: str
     password: str
     url: str
     database: str
+    # connections kept open, plus overflow ones opened under load and closed after
+    pool_size: PositiveInt = 10
+    max_overflow: NonNegativeInt = 10
+    # seconds to wait for a free connection before failing the request
+    pool_timeout: PositiveFloat = 10
+    # seconds after which a connection is replaced, below idle timeouts of proxies in between
+    pool_recycle: PositiveInt = 1800
+    # checks connection with a round trip on checkout, survives database restarts at a small cost
+    pool_pre_ping: bool = True
+    connect_timeout: PositiveFloat = 5
+    statement_timeout_ms: PositiveInt = 5000
+    # compiled sql kept per engine, repository statements are built once so they hit it every time
+    query_cache_size: PositiveInt = 500
+    # statements asyncpg prepares and keeps per connection, 0 turns it off (pgbouncer in transaction mode)
+    prepared_statement_cache_size: NonNegativeInt = 100
+    # host:port of read replicas, same database and credentials as the primary; reads of routes that don't write
+    # go there in turns, writes and everything else stay on the primary
+    replicas: list[str] = []
+    # seconds between health checks of replicas
+    replica_check_interval: PositiveFloat = 5
+    # seconds reads of a client stay on the primary after its own write, should cover replication lag;
+    # caches of goods and searches may still keep what a lagging replica returned until their ttl
+    read_your_writes: NonNegativeFloat = 10
+
+class GeoIndexSettings(BaseModel):
+    # keep goods locations in memory and answer radius lookups from there
+    enabled: bool = False
+    # grid cell size in degrees
+    cell_size: PositiveFloat = 0.05
+    # seconds between reloads from the database, every worker keeps its own index
+    # and sees writes made through other workers only after a reload
+    reload_interval: PositiveFloat = 60
+
+class GoodCacheSettings(BaseModel):
+    # cache goods by id in memory
+    enabled: bool = False
+    max_size: PositiveInt = 10000
+    # seconds, bounds staleness of goods changed by other workers
+    ttl: PositiveFloat = 30
+
+class SearchCacheSettings(BaseModel):
+    # cache lookup results by normalized filter, dropped on any change of goods
+    enabled: bool = False
+    max_size: PositiveInt = 10000
+    ttl: PositiveFloat = 60
+    # degrees coordinates are snapped to, ~110 m
+    grid: PositiveFloat = 0.001
+    # meters radius is rounded up to
+    radius_step: PositiveFloat = 100
+
+class SuggestSettings(BaseModel):
+    # serve /goods/suggest from in-memory index of names instead of the name search
+    enabled: bool = False
+    # names with the typed prefix ranked per request at most
+    max_scan: PositiveInt = 1000
+    # seconds between reloads of names from the database, same as for geo index
+    reload_interval: PositiveFloat = 60
+
+class ConfirmationStorage(str, Enum):
+    database = 'database'
+    # links work only with a single worker and until restart
+    memory = 'memory'
+
+class ConfirmationSettings(BaseModel):
+    # where pending confirmations are kept
+    storage: ConfirmationStorage = ConfirmationStorage.database
+    # for memory storage only
+    max_size: PositiveInt = 100000
+    # seconds a confirmation link stays valid
+    ttl: PositiveFloat = 86400
+    # seconds between deletions of expired confirmations from the database
+    prune_interval: PositiveFloat = 3600
+
+class RateLimitSettings(BaseModel):
+    # shed authorization, password reset and confirmation bursts with 429
+    enabled: bool = True
+    # requests per second and requests at once from one address
+    ip_rate: PositiveFloat = 1
+    ip_burst: PositiveFloat = 20
+    # same for one username, protects accounts from attempts coming from many addresses
+    username_rate: PositiveFloat = 0.1
+    username_burst: PositiveFloat = 5
+    # buckets kept in memory, least recently used are dropped over that
+    max_keys: PositiveInt = 100000
+
+class MetricsSettings(BaseModel):
+    # prometheus /metrics with request, query and pool timings; every worker keeps and serves its own
+    # metrics, so with several of them a scrape shows the one it landed on
+    enabled: bool = True
+
+class ServerSettings(BaseModel):
+    host: str = "0.0.0.0"
+    port: PositiveInt = 8000
+    # processes forked by the launcher, one per core if not set;
+    # state kept in memory (caches, rate limits, indexes until reloaded) is per worker,
+    # more than one isn't allowed with confirmations kept in memory
+    workers: PositiveInt | None = None
 
 class OAPISettings(BaseModel):
     oapi_path: str
@@ -28,8 +155,17 @@ class Settings(BaseSettings):
     domain: str
 
     security: SecuritySettings
+    password_hashing: PasswordHashingSettings = PasswordHashingSettings()
     oapi: OAPISettings
     postgres: Postgres
+    geo_index: GeoIndexSettings = GeoIndexSettings()
+    good_cache: GoodCacheSettings = GoodCacheSettings()
+    search_cache: SearchCacheSettings = SearchCacheSettings()
+    suggest: SuggestSettings = SuggestSettings()
+    rate_limit: RateLimitSettings = RateLimitSettings()
+    confirmations: ConfirmationSettings = ConfirmationSettings()
+    server: ServerSettings = ServerSettings()
+    metrics: MetricsSettings = MetricsSettings()
 
     @classmethod
     def settings_customise_sources(
@@ -46,4 +182,18 @@ class Settings(BaseSettings):
             env_settings
         )
 
-config = Settings()
+# read on first use instead of import, so modules importing config don't pay for it until it's needed
+_config: Settings | None = None
+
+def get_config() -> Settings:
+    global _config
+    if _config is None:
+        _config = Settings()
+    return _config
+
+def __getattr__(name: str):
+    # `from config import config` ends up here as there is no such module attribute, for scripts like alembic's env;
+    # the app gets its settings passed down from create_app instead
+    if name == "config":
+        return get_config()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,139 @@
+import argparse
+import os
+import signal
+import socket
+import time
+
+import logging
+logger = logging.getLogger(__name__)
+
+def exec_time() -> float:
+    """
+    Wall clock time the process was started at, taken from /proc so interpreter startup and imports are counted too;
+    current time on systems without /proc
+    """
+    try:
+        with open("/proc/self/stat") as f:
+            # fields after the command name, which may have spaces, starttime is the 22nd field overall
+            start_ticks = int(f.read().rsplit(")", 1)[1].split()[19])
+        with open("/proc/uptime") as f:
+            uptime = float(f.read().split()[0])
+        return time.time() - (uptime - start_ticks / os.sysconf("SC_CLK_TCK"))
+    except (OSError, ValueError, IndexError):
+        return time.time()
+
+# taken before anything heavy is imported
+EXEC_TIME = exec_time()
+
+# seconds to wait before forking a worker again after it died, so a crashing one doesn't spin
+RESPAWN_DELAY = 1
+
+class FirstRequestTimer:
+    """
+    Logs how long after exec the worker served its first request
+    """
+    def __init__(self, app, started_at: float):
+        self.app = app
+        self.started_at = started_at
+        self.served = False
+
+    async def __call__(self, scope, receive, send):
+        await self.app(scope, receive, send)
+        if not self.served and scope["type"] == "http":
+            self.served = True
+            logger.info("worker %s served its first request %.3f s after exec", os.getpid(), time.time() - self.started_at)
+
+def bind(host: str, port: int) -> socket.socket:
+    # bound once in the master, every worker accepts from it
+    sock = socket.socket(socket.AF_INET6 if ":" in host else socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+    return sock
+
+def run_worker(app, sock: socket.socket):
+    import uvicorn
+
+    # master's handlers aren't for workers, uvicorn installs its own for graceful shutdown
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    # lifespan makes the database pools, hashing pool and background tasks of this worker
+    server = uvicorn.Server(uvicorn.Config(FirstRequestTimer(app, EXEC_TIME), lifespan="on"))
+    server.run(sockets=[sock])
+
+def spawn(app, sock: socket.socket) -> int:
+    pid = os.fork()
+    if pid == 0:
+        code = 0
+        try:
+            run_worker(app, sock)
+        except BaseException:
+            logger.exception("worker %s failed", os.getpid())
+            code = 1
+        finally:
+            os._exit(code)
+    logger.info("forked worker %s", pid)
+    return pid
+
+def serve(host: str, port: int, workers: int):
+    """
+    Builds the app once and forks workers from it, so imports, config and wiring are shared copy-on-write
+    and every worker only makes its own pools; workers that die are forked again
+    """
+    from config import ConfirmationStorage, get_config
+    from main import create_app
+
+    config = get_config()
+    if workers > 1 and config.confirmations.storage == ConfirmationStorage.memory:
+        # a link would only work when it gets to the worker that sent it
+        raise SystemExit("confirmations kept in memory need a single worker, set confirmations.storage to database")
+
+    app = create_app(config)
+    sock = bind(host, port)
+    logger.info("preloaded app in %.3f s, listening on %s:%s with %s workers", time.time() - EXEC_TIME, host, port, workers)
+
+    children = set(spawn(app, sock) for _ in range(workers))
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in list(children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    while children:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        except InterruptedError:
+            continue
+        children.discard(pid)
+        if not stopping:
+            logger.warning("worker %s exited with %s, forking another one", pid, os.waitstatus_to_exitcode(status))
+            time.sleep(RESPAWN_DELAY)
+            children.add(spawn(app, sock))
+
+    sock.close()
+    logger.info("all workers stopped")
+
+if __name__ == "__main__":
+    from config import get_config
+
+    server_config = get_config().server
+    parser = argparse.ArgumentParser(description="Serve the app with preforked workers")
+    parser.add_argument("--host", default=server_config.host)
+    parser.add_argument("--port", type=int, default=server_config.port)
+    parser.add_argument("--workers", type=int, default=server_config.workers or os.cpu_count() or 1,
+                        help="one per core by default")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    serve(args.host, args.port, args.workers)
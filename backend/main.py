@@ -1,19 +1,173 @@
-from fastapi import FastAPI
+import asyncio
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI, Request
 from fastapi.routing import APIRoute
 
-from config import config
+from config import Settings, HashingExecutor, ConfirmationStorage, get_config
+
+from api import main as main_router, database, security, rate_limit, metrics
+
+from repositories.database import create_engine, create_replica_set, instrument
+from repositories.goods import GoodRepo
+from repositories.users import UsersRepo
+from repositories.revocations import RevocationRepo
+from repositories.confirmations import ConfirmationRepo
+from repositories.batching import BatchingGoodRepo, BatchingUserRepo
+from repositories.cached_goods import CachedGoodRepo
+from repositories.geo_indexed_goods import GeoIndexedGoodRepo
+
+from usecases.goods import GoodUsecase
+from usecases.users import UserUsecase
+from usecases.notifiers import MNotifierUsecase, TNotifierUsecase, LoggingWriter
+from usecases.search_cache import SearchCache
+
+from utils.cache import TTLCache
+from utils.geo_index import GeoIndex
+from utils.late_executor import LateExecutor, InMemoryTaskArgumentStorage
+from utils.loader import loader_scope
+from utils.prefix_index import PrefixIndex
+from utils import security as password_security
 
-from api import main as main_router
+import logging
+logger = logging.getLogger(__name__)
 
-api_router = main_router.init(None, None, None)
+def configure_hashing(config: Settings):
+    # made once before workers are forked, they inherit the parameters
+    if config.security.calibrate_hashing:
+        time_cost, memory_cost = password_security.calibrate(config.security.hash_budget_ms, config.security.hash_parallelism)
+        password_security.configure_hasher(time_cost, memory_cost, config.security.hash_parallelism)
+    elif config.security.hash_time_cost and config.security.hash_memory_cost:
+        password_security.configure_hasher(config.security.hash_time_cost, config.security.hash_memory_cost,
+                                           config.security.hash_parallelism)
 
 def custom_generate_unique_id(route: APIRoute) -> str:
     return f"{route.tags[0]}-{route.name}"
 
-app = FastAPI(
-    title=config.name,
-    openapi_url=f"{config.oapi.oapi_path}/openapi.json",
-    generate_unique_id_function=custom_generate_unique_id,
-)
+def create_app(config: Settings | None = None) -> FastAPI:
+    """
+    Wires repositories, usecases and routes, none of which holds connections, threads or processes,
+    so the app can be built once and forked; pools are made by every worker in lifespan
+    """
+    config = config or get_config()
+    configure_hashing(config)
+
+    # wrappers go from the database outwards: geo index answers radius lookups, cache serves goods by id,
+    # batching merges lookups made by one request
+    geo_good_repo = cached_good_repo = None
+    good_repo = GoodRepo()
+    if config.geo_index.enabled:
+        good_repo = geo_good_repo = GeoIndexedGoodRepo(good_repo, GeoIndex(config.geo_index.cell_size))
+    if config.good_cache.enabled:
+        good_repo = cached_good_repo = CachedGoodRepo(good_repo, TTLCache(config.good_cache.max_size, config.good_cache.ttl))
+    good_repo = BatchingGoodRepo(good_repo)
+    user_repo = BatchingUserRepo(UsersRepo())
+
+    search_cache = None
+    if config.search_cache.enabled:
+        search_cache = SearchCache(TTLCache(config.search_cache.max_size, config.search_cache.ttl),
+                                   config.search_cache.grid, config.search_cache.radius_step)
+    prefix_index = PrefixIndex(config.suggest.max_scan) if config.suggest.enabled else None
+
+    confirmation_repo = None
+    if config.confirmations.storage == ConfirmationStorage.memory:
+        late_executor = LateExecutor(InMemoryTaskArgumentStorage(config.confirmations.max_size, config.confirmations.ttl))
+    else:
+        confirmation_repo = ConfirmationRepo(config.confirmations.ttl)
+        late_executor = LateExecutor(confirmation_repo)
+    # there are no real mail and telegram senders yet
+    writer = LoggingWriter()
+    mail = MNotifierUsecase(writer, good_repo, user_repo, late_executor, config.domain)
+    telegram = TNotifierUsecase(writer, good_repo, user_repo, late_executor, config.domain)
+
+    good_usecase = GoodUsecase(good_repo, search_cache, prefix_index)
+    user_usecase = UserUsecase(user_repo, good_repo, mail, telegram, late_executor, RevocationRepo())
+
+    api_router = main_router.init(config, user_usecase, good_usecase, late_executor)
+
+    @asynccontextmanager
+    async def lifespan(app: FastAPI):
+        # runs in every worker after fork, pools and their connections aren't shared between processes
+        password_security.init_pool(
+            workers=config.password_hashing.workers,
+            max_queue=config.password_hashing.max_queue,
+            processes=config.password_hashing.executor == HashingExecutor.process
+        )
+        engine = create_engine(config.postgres)
+        replicas = create_replica_set(config.postgres)
+        database.init(engine, replicas, config.postgres.read_your_writes)
+        if config.metrics.enabled:
+            instrument(engine, "primary")
+            for replica in (replicas.engines if replicas else []):
+                instrument(replica, "replica")
+
+        async with database.transaction() as conn:
+            if geo_good_repo:
+                await geo_good_repo.load(conn)
+            await good_usecase.load_suggestions(conn)
+        # every worker keeps its own copy of these, reloads bring in what the others wrote
+        background = [asyncio.create_task(security.refresh_revocations_forever())]
+        if geo_good_repo:
+            background.append(asyncio.create_task(
+                geo_good_repo.load_forever(config.geo_index.reload_interval, database.transaction)))
+        if prefix_index:
+            background.append(asyncio.create_task(
+                good_usecase.load_suggestions_forever(config.suggest.reload_interval, database.transaction)))
+        if confirmation_repo:
+            background.append(asyncio.create_task(
+                confirmation_repo.prune_forever(config.confirmations.prune_interval, database.transaction)))
+        replica_checker = None
+        if replicas:
+            await replicas.check()
+            replica_checker = asyncio.create_task(replicas.check_forever(config.postgres.replica_check_interval))
+        logger.info("%s started", config.name)
+
+        yield
+
+        for task in background:
+            task.cancel()
+        if replica_checker:
+            replica_checker.cancel()
+            await replicas.dispose()
+        password_security.shutdown_pool()
+        await engine.dispose()
+
+    app = FastAPI(
+        title=config.name,
+        openapi_url=f"{config.oapi.oapi_path}/openapi.json",
+        generate_unique_id_function=custom_generate_unique_id,
+        lifespan=lifespan,
+    )
+
+    app.include_router(api_router)
+    if config.metrics.enabled:
+        sources = {
+            "database": database.stats,
+            "password_hashing": password_security.pool_stats,
+            "rate_limit": rate_limit.stats,
+            "security": security.stats,
+        }
+        if cached_good_repo:
+            sources["good_cache"] = cached_good_repo.stats
+        if search_cache:
+            sources["search_cache"] = search_cache.stats
+        app.include_router(metrics.init(sources))
+
+    # every request gets its own loaders, so repeated lookups of the same good or user are batched
+    @app.middleware("http")
+    async def loader_scope_middleware(request: Request, call_next):
+        with loader_scope():
+            return await call_next(request)
+
+    # clients that have just written read from the primary for a while, replicas may not have their writes yet
+    @app.middleware("http")
+    async def read_your_writes_middleware(request: Request, call_next):
+        response = await call_next(request)
+        database.remember_write(request, response)
+        return response
+
+    if config.metrics.enabled:
+        # added last, so it's the outermost and times the other middlewares too
+        app.middleware("http")(metrics.track_requests)
 
-app.include_router(api_router)
+    return app
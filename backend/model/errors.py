@@ -17,6 +17,17 @@ class ConfirmationInUseError(Exception):
         self.value = value
         super().__init__(f"Address {self.value} on {self.source} is already in use")
 
+class UsernameInUseError(Exception):
+    """Exception raised when user with such name already exists
+    
+    Attributes:
+        username -- name that is taken
+    """
+
+    def __init__(self, username):
+        self.username = username
+        super().__init__(f"Username {self.username} is already in use")
+
 class IncorrectOldPasswordError(Exception):
     """Exception raised when provided incorrect old password to change it
     
@@ -68,3 +79,14 @@ class GoodNotFoundError(Exception):
     def __init__(self, good_id):
         self.good_id = good_id
         super().__init__(f"Good with such id {self.good_id} not found")
+
+class InvalidCursorError(Exception):
+    """Exception raised when pagination cursor can't be decoded or belongs to another ordering
+    
+    Attributes:
+        cursor -- given cursor
+    """
+
+    def __init__(self, cursor):
+        self.cursor = cursor
+        super().__init__(f"Cursor {self.cursor} is invalid")
@@ -1,14 +1,58 @@
+from enum import Enum
 from uuid import UUID
 
-from pydantic import BaseModel, PositiveFloat
+from pydantic import BaseModel, PositiveFloat, NonNegativeFloat, Field
 from pydantic_extra_types.coordinate import Coordinate
 
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+# upper bounds of price buckets in facets, the last bucket has no upper bound
+DEFAULT_PRICE_BOUNDS = [100, 500, 1000, 5000, 10000, 50000]
+
 class Area(BaseModel):
     place: Coordinate
+    # in meters
     radius: PositiveFloat
 
+class GoodsOrder(str, Enum):
+    newest = 'newest'
+    relevance = 'relevance'
+    distance = 'distance'
+    price_asc = 'price_asc'
+    price_desc = 'price_desc'
+
 class LookFilter(BaseModel):
     name: str
     location: Area | None = None
     user_id: UUID | None = None
-    
\ No newline at end of file
+    min_price: NonNegativeFloat | None = None
+    max_price: NonNegativeFloat | None = None
+    # None means relevance when searching by name, distance when searching by area and newest otherwise
+    order: GoodsOrder | None = None
+    limit: int = Field(default=DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE)
+    # opaque cursor from the previous page, None for the first one
+    cursor: str | None = None
+
+def look_order(look_filter: LookFilter) -> GoodsOrder:
+    order = look_filter.order
+    if order is None:
+        if look_filter.name:
+            order = GoodsOrder.relevance
+        elif look_filter.location:
+            order = GoodsOrder.distance
+        else:
+            order = GoodsOrder.newest
+
+    # orderings that miss their input fall back to the newest goods
+    if order == GoodsOrder.relevance and not look_filter.name:
+        return GoodsOrder.newest
+    if order == GoodsOrder.distance and not look_filter.location:
+        return GoodsOrder.newest
+    return order
+
+class PriceBucket(BaseModel):
+    # None means unbounded
+    min_price: float | None = None
+    max_price: float | None = None
+    count: int
@@ -4,9 +4,10 @@ from pydantic import BaseModel
 from pydantic_extra_types.coordinate import Coordinate
 
 class Good(BaseModel):
-    id: UUID
+    # not known until the good is stored
+    id: UUID | None = None
     name: str
-    description: str
+    description: str | None = None
     price: float
     images: list[str]
     location: Coordinate | None = None
@@ -14,3 +15,26 @@ class Good(BaseModel):
 
 class GoodsList(BaseModel):
     array: list[Good]
+    next_cursor: str | None = None
+
+# what list views show, without description and other images
+class GoodSummary(BaseModel):
+    id: UUID
+    name: str
+    price: float
+    image: str | None = None
+    location: Coordinate | None = None
+
+class GoodSummaryList(BaseModel):
+    array: list[GoodSummary]
+    next_cursor: str | None = None
+
+class Suggestion(BaseModel):
+    id: UUID
+    name: str
+
+class PublishResult(BaseModel):
+    name: str
+    good: Good | None = None
+    # reason the good wasn't published
+    error: str | None = None
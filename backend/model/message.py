@@ -4,7 +4,8 @@ from pydantic import BaseModel, PositiveFloat
 
 class Message(BaseModel):
     sender: UUID
-    recipient: UUID
+    # owner of the good, filled when the message is sent
+    recipient: UUID | None = None
     good_id: UUID
     message: str
     contact_info: str
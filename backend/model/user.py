@@ -7,14 +7,23 @@ class ActiveTime(BaseModel):
     to_hour: int
 
 class User(BaseModel):
-    id: UUID
+    # not known until the user is stored
+    id: UUID | None = None
     name: str
-    hashed_pasword: str
+    hashed_pasword: str | None = None
     active_time: ActiveTime
-    email: NameEmail
-    telegram: str
+    email: NameEmail | None = None
+    telegram: str | None = None
+    active: bool
+
+class Principal(BaseModel):
+    """
+    Authorized user as the token tells it, may lag behind the database until the token is reissued
+    """
+    id: UUID
+    name: str
     active: bool
 
 def safe_print_user(user: User) -> User:
-    user = user.model_copy(update={"hashed_password": None})
+    user = user.model_copy(update={"hashed_pasword": None})
     return user
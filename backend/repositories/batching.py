@@ -0,0 +1,77 @@
+from uuid import UUID
+
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+from model import Good, User, ActiveTime, GoodNotFoundError, UserNotFoundError
+
+from repositories.proxy import GoodRepoProxy, UserRepoProxy
+
+from utils.loader import scoped_loader, clear_scoped
+
+import logging
+logger = logging.getLogger(__name__)
+
+# point lookups made inside of one loader scope (request) are deduplicated and
+# the concurrent ones are merged into a single get_goods / get_users query;
+# every connection of the request has its own loaders, writes drop the key from all of them
+
+class BatchingGoodRepo(GoodRepoProxy):
+    def _loader(self, conn: AsyncConnection):
+        return scoped_loader(
+            "goods",
+            conn,
+            lambda good_ids: self.good.get_goods(conn, good_ids),
+            lambda good: good.id,
+            GoodNotFoundError
+        )
+
+    async def get_good(self, conn: AsyncConnection, good_id: UUID) -> Good:
+        loader = self._loader(conn)
+        if loader is None:
+            return await self.good.get_good(conn, good_id)
+        return await loader.load(good_id)
+
+    async def update_good(self, conn: AsyncConnection, good_id: UUID, good: Good) -> Good:
+        good = await self.good.update_good(conn, good_id, good)
+        clear_scoped("goods", good_id)
+        return good
+
+    async def delete_good(self, conn: AsyncConnection, good_id: UUID):
+        await self.good.delete_good(conn, good_id)
+        clear_scoped("goods", good_id)
+
+class BatchingUserRepo(UserRepoProxy):
+    def _loader(self, conn: AsyncConnection):
+        return scoped_loader(
+            "users",
+            conn,
+            lambda uuids: self.user.get_users(conn, uuids),
+            lambda user: user.id,
+            lambda uuid: UserNotFoundError(user_id=uuid)
+        )
+
+
+    async def get_user(self, conn: AsyncConnection, uuid: UUID) -> User:
+        loader = self._loader(conn)
+        if loader is None:
+            return await self.user.get_user(conn, uuid)
+        return await loader.load(uuid)
+
+    async def activate(self, conn: AsyncConnection, id: UUID):
+        await self.user.activate(conn, id)
+        clear_scoped("users", id)
+
+    async def update_user_info(self, conn: AsyncConnection, uuid: UUID, name: str | None = None, active_time: ActiveTime | None = None) -> User:
+        user = await self.user.update_user_info(conn, uuid, name, active_time)
+        clear_scoped("users", uuid)
+        return user
+
+    async def update_user(self, conn: AsyncConnection, user: User) -> User:
+        user = await self.user.update_user(conn, user)
+        clear_scoped("users", user.id)
+        return user
+
+    async def update_password_hash(self, conn: AsyncConnection, uuid: UUID, old_hash: str, new_hash: str) -> bool:
+        updated = await self.user.update_password_hash(conn, uuid, old_hash, new_hash)
+        clear_scoped("users", uuid)
+        return updated
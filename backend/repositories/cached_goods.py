@@ -0,0 +1,73 @@
+from uuid import UUID
+
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+from model import Good
+
+from repositories.proxy import GoodRepoProxy
+
+from usecases.goods import GoodRepo
+
+from utils.cache import TTLCache
+
+import logging
+logger = logging.getLogger(__name__)
+
+class CachedGoodRepo(GoodRepoProxy):
+    """
+    Read-through cache of goods by id, entries are dropped on update and delete
+    """
+    def __init__(self, good: GoodRepo, cache: TTLCache):
+        super().__init__(good)
+        self.cache = cache
+        # bumped by every write, a read that raced with a write doesn't put its (maybe stale) result
+        self.writes = 0
+
+    async def get_good(self, conn: AsyncConnection, good_id: UUID) -> Good:
+        good = self.cache.get(good_id)
+        if good is not None:
+            return good
+
+        writes = self.writes
+        good = await self.good.get_good(conn, good_id)
+        if writes == self.writes:
+            self.cache.put(good_id, good)
+        return good
+
+    async def get_goods(self, conn: AsyncConnection, good_ids: list[UUID]) -> list[Good]:
+        goods = []
+        missing = []
+        for good_id in good_ids:
+            good = self.cache.get(good_id)
+            if good is None:
+                missing.append(good_id)
+            else:
+                goods.append(good)
+        if not missing:
+            return goods
+
+        writes = self.writes
+        fetched = await self.good.get_goods(conn, missing)
+        if writes == self.writes:
+            for good in fetched:
+                self.cache.put(good.id, good)
+        return goods + fetched
+
+    def _invalidate(self, good_id: UUID):
+        self.writes += 1
+        self.cache.pop(good_id)
+
+    async def update_good(self, conn: AsyncConnection, good_id: UUID, good: Good) -> Good:
+        # twice, so reads started while the update was running don't bring old row back
+        self._invalidate(good_id)
+        good = await self.good.update_good(conn, good_id, good)
+        self._invalidate(good_id)
+        return good
+
+    async def delete_good(self, conn: AsyncConnection, good_id: UUID):
+        self._invalidate(good_id)
+        await self.good.delete_good(conn, good_id)
+        self._invalidate(good_id)
+
+    def stats(self) -> dict[str, int]:
+        return self.cache.stats()
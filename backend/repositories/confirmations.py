@@ -0,0 +1,76 @@
+import asyncio
+from datetime import timedelta
+from uuid import UUID, uuid4
+
+import sqlalchemy as sa
+from sqlalchemy import insert, delete
+from sqlalchemy.ext.asyncio import AsyncConnection
+from sqlalchemy.dialects.postgresql import UUID as PG_UUID
+
+from utils.late_executor import TaskArgumentStorage, TaskNotExistsError
+
+import logging
+logger = logging.getLogger(__name__)
+
+confirmations_table = sa.Table(
+    'confirmation_tasks',
+    sa.MetaData(),
+    sa.Column('id', PG_UUID(as_uuid=True), primary_key=True),
+    sa.Column('action_id', sa.String(100), nullable=False),
+    sa.Column('args', sa.Text(), nullable=False),
+    sa.Column('expires_at', sa.DateTime(timezone=True), nullable=False)
+)
+
+add_confirmation_stmt = insert(confirmations_table) \
+    .values(
+        id=sa.bindparam('confirmation_id'),
+        action_id=sa.bindparam('confirmation_action_id'),
+        args=sa.bindparam('confirmation_args'),
+        expires_at=sa.func.now() + sa.bindparam('confirmation_ttl', type_=sa.Interval())
+    ) \
+    .execution_options(query_name="confirmations.put")
+# taken and deleted at once, the confirming transaction keeps the row locked until it commits,
+# so a link followed twice at the same time runs the task once; expired rows are left for prune
+take_confirmation_stmt = delete(confirmations_table) \
+    .where(confirmations_table.c.id == sa.bindparam('confirmation_id'), confirmations_table.c.expires_at > sa.func.now()) \
+    .returning(confirmations_table.c.action_id, confirmations_table.c.args) \
+    .execution_options(query_name="confirmations.get")
+prune_confirmations_stmt = delete(confirmations_table) \
+    .where(confirmations_table.c.expires_at <= sa.func.now()) \
+    .execution_options(query_name="confirmations.prune")
+
+class ConfirmationRepo(TaskArgumentStorage):
+    """
+    Keeps tasks in the database, so a link works whichever worker gets it and after restarts
+
+    Every task can be taken once, unused ones expire after ttl seconds and are deleted by prune
+    """
+    def __init__(self, ttl: float):
+        self.ttl = timedelta(seconds=ttl)
+
+    async def put(self, conn: AsyncConnection, action_id: str, args: str) -> UUID:
+        task_id = uuid4()
+        await conn.execute(add_confirmation_stmt, {"confirmation_id": task_id, "confirmation_action_id": action_id,
+                                                   "confirmation_args": args, "confirmation_ttl": self.ttl})
+        return task_id
+
+    async def get(self, conn: AsyncConnection, task_id: UUID) -> tuple[str, str]:
+        row = (await conn.execute(take_confirmation_stmt, {"confirmation_id": task_id})).first()
+        if row is None:
+            raise TaskNotExistsError(task_id)
+        return row.action_id, row.args
+
+    async def prune(self, conn: AsyncConnection) -> int:
+        result = await conn.execute(prune_confirmations_stmt)
+        logger.debug("deleted %s expired confirmations", result.rowcount)
+        return result.rowcount
+
+    async def prune_forever(self, interval: float, transaction):
+        while True:
+            try:
+                async with transaction() as conn:
+                    await self.prune(conn)
+            except Exception as e:
+                # expired rows can't be taken anyway, they only take space until the next try
+                logger.warning("failed to delete expired confirmations: %s", e)
+            await asyncio.sleep(interval)
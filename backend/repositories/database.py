@@ -0,0 +1,146 @@
+import asyncio
+import time
+
+import sqlalchemy as sa
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine, create_async_engine
+
+from config import Postgres
+
+from utils import metrics
+
+import logging
+logger = logging.getLogger(__name__)
+
+# statements are labelled with execution_options(query_name=...), where they are built
+query_seconds = metrics.histogram("db_query_duration_seconds", "Time of database queries by repository method",
+                                  ("pool", "query"))
+checkout_seconds = metrics.histogram("db_pool_checkout_seconds", "Time waited for a pooled connection", ("pool",))
+
+# transaction id is assigned on the first write of the transaction, reads don't get one
+wrote_stmt = sa.select(sa.func.txid_current_if_assigned().is_not(None)) \
+    .execution_options(query_name="database.wrote")
+
+async def transaction_wrote(conn: AsyncConnection) -> bool:
+    return bool(await conn.scalar(wrote_stmt))
+
+def _host_and_port(address: str) -> tuple[str, int | None]:
+    # host, host:port, [ipv6] or [ipv6]:port
+    host, separator, port = address.rpartition(":")
+    if separator and port.isdigit() and (":" not in host or host.endswith("]")):
+        return host.strip("[]"), int(port)
+    return address.strip("[]"), None
+
+def database_url(pg: Postgres, driver: str = "asyncpg", host: str | None = None) -> sa.URL:
+    # replicas have the same database and credentials as the primary, only the host differs;
+    # parts are escaped by URL, so passwords may have any characters
+    host, port = _host_and_port(host or pg.url)
+    query = dict()
+    if driver == "asyncpg":
+        query["prepared_statement_cache_size"] = str(pg.prepared_statement_cache_size)
+    return sa.URL.create(drivername=f"postgresql+{driver}", username=pg.username, password=pg.password,
+                         host=host, port=port, database=pg.database, query=query)
+
+def create_engine(pg: Postgres, host: str | None = None) -> AsyncEngine:
+    """
+    Pooled engine, connections are opened lazily on the first checkout
+    """
+    engine = create_async_engine(
+        database_url(pg, host=host),
+        pool_size=pg.pool_size,
+        max_overflow=pg.max_overflow,
+        pool_timeout=pg.pool_timeout,
+        pool_recycle=pg.pool_recycle,
+        pool_pre_ping=pg.pool_pre_ping,
+        query_cache_size=pg.query_cache_size,
+        connect_args={
+            # set once per connection instead of a SET on every checkout
+            "server_settings": {"statement_timeout": str(pg.statement_timeout_ms)},
+            "timeout": pg.connect_timeout,
+        },
+    )
+    logger.info("created database engine for %s/%s, pool of %s + %s overflow",
+                host or pg.url, pg.database, pg.pool_size, pg.max_overflow)
+    return engine
+
+def instrument(engine: AsyncEngine, pool: str):
+    """
+    Times every query of the engine, around the cursor execute, so fetching of streamed rows isn't counted
+    """
+    @event.listens_for(engine.sync_engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        context.query_started = time.perf_counter()
+
+    @event.listens_for(engine.sync_engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        started = getattr(context, "query_started", None)
+        if started is not None:
+            query_seconds.observe(time.perf_counter() - started, pool, context.execution_options.get("query_name", "other"))
+
+def pool_stats(engine: AsyncEngine) -> dict[str, int]:
+    pool = engine.pool
+    return {"size": pool.size(), "checked_out": pool.checkedout(), "overflow": max(0, pool.overflow())}
+
+class ReplicaSet:
+    """
+    Engines of read replicas taken in turns, replicas failing health checks are skipped until they pass again
+
+    Attributes:
+        check_timeout -- seconds a replica has to answer a health check
+    """
+    def __init__(self, engines: list[AsyncEngine], check_timeout: float = 5):
+        self.engines = engines
+        self.check_timeout = check_timeout
+        self.healthy = list(engines)
+        self.turn = 0
+
+    def __len__(self) -> int:
+        return len(self.engines)
+
+    def engine(self) -> AsyncEngine | None:
+        # None when every replica is down, reads go to the primary then
+        if not self.healthy:
+            return None
+        self.turn = (self.turn + 1) % len(self.healthy)
+        return self.healthy[self.turn]
+
+    def mark_down(self, engine: AsyncEngine):
+        # until the next check brings it back
+        if engine in self.healthy:
+            self.healthy.remove(engine)
+            logger.warning("replica %s is down", engine.url.host)
+
+    async def _is_healthy(self, engine: AsyncEngine) -> bool:
+        try:
+            async with asyncio.timeout(self.check_timeout):
+                async with engine.connect() as conn:
+                    await conn.execute(sa.text("select 1"))
+            return True
+        except Exception as e:
+            logger.debug("health check of replica %s failed: %s", engine.url.host, e)
+            return False
+
+    async def check(self):
+        results = await asyncio.gather(*(self._is_healthy(engine) for engine in self.engines))
+        healthy = [engine for engine, ok in zip(self.engines, results) if ok]
+        for engine in self.engines:
+            if (engine in healthy) != (engine in self.healthy):
+                logger.warning("replica %s is %s", engine.url.host, "up" if engine in healthy else "down")
+        self.healthy = healthy
+
+    async def check_forever(self, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            await self.check()
+
+    async def dispose(self):
+        for engine in self.engines:
+            await engine.dispose()
+
+    def stats(self) -> dict[str, int]:
+        return {"replicas": len(self.engines), "healthy": len(self.healthy)}
+
+def create_replica_set(pg: Postgres) -> ReplicaSet | None:
+    if not pg.replicas:
+        return None
+    return ReplicaSet([create_engine(pg, host) for host in pg.replicas], pg.connect_timeout)
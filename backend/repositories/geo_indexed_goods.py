@@ -0,0 +1,144 @@
+import asyncio
+import bisect
+from uuid import UUID
+
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+from model import Good, GoodsList, GoodSummaryList, LookFilter, GoodsOrder, look_order
+
+from repositories.goods import distance_keyset
+from repositories.proxy import GoodRepoProxy
+
+from usecases.goods import GoodRepo
+
+from utils.geo_index import GeoIndex
+
+import logging
+logger = logging.getLogger(__name__)
+
+# distances of the index and of the database differ in the last bits, a page continued on the other side
+# could skip or repeat rows at its boundary, so cursors of the index are named apart from database ones
+INDEX_KEYSET_NAME = 'index_distance'
+
+class GeoIndexedGoodRepo(GoodRepoProxy):
+    """
+    Keeps locations of all goods in memory and answers "near me" lookups from there,
+    only the goods of the requested page are read from the database by id
+    """
+    def __init__(self, good: GoodRepo, geo_index: GeoIndex):
+        super().__init__(good)
+        self.geo_index = geo_index
+        self.loaded = False
+        # changes made by this worker while a load is streaming, the snapshot may have been taken before them
+        self.pending: list[tuple[UUID, float | None, float | None]] | None = None
+
+    async def load(self, conn: AsyncConnection):
+        # built aside and swapped in, lookups keep using the old index meanwhile
+        geo_index = GeoIndex(self.geo_index.cell_size)
+        self.pending = []
+        try:
+            async for good_id, lat, lon in self.good.stream_locations(conn):
+                geo_index.insert(good_id, lat, lon)
+            for good_id, lat, lon in self.pending:
+                self._apply(geo_index, good_id, lat, lon)
+        finally:
+            self.pending = None
+        self.geo_index = geo_index
+        self.loaded = True
+        logger.info("loaded %s goods into geo index", len(self.geo_index))
+
+    async def load_forever(self, interval: float, transaction):
+        # other workers write to the table too, their goods show up here only after a reload
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                async with transaction() as conn:
+                    await self.load(conn)
+            except Exception as e:
+                logger.warning("failed to reload geo index: %s", e)
+
+    @staticmethod
+    def _apply(geo_index: GeoIndex, good_id: UUID, lat: float | None, lon: float | None):
+        if lat is None:
+            geo_index.remove(good_id)
+        else:
+            geo_index.insert(good_id, lat, lon)
+
+    def _changed(self, good_id: UUID, lat: float | None = None, lon: float | None = None):
+        # index is updated right after the statement, rolled back transaction leaves it ahead of the table
+        # until the next load; that only costs a missing row on the page as goods are fetched by id anyway
+        self._apply(self.geo_index, good_id, lat, lon)
+        if self.pending is not None:
+            self.pending.append((good_id, lat, lon))
+
+    def _index(self, good: Good):
+        if good.location:
+            self._changed(good.id, good.location.latitude, good.location.longitude)
+        else:
+            self._changed(good.id)
+
+    async def add_good(self, conn: AsyncConnection, good: Good) -> Good:
+        good = await self.good.add_good(conn, good)
+        self._index(good)
+        return good
+
+    async def add_goods(self, conn: AsyncConnection, goods: list[Good]) -> list[Good | None]:
+        new_goods = await self.good.add_goods(conn, goods)
+        for good in new_goods:
+            if good is not None:
+                self._index(good)
+        return new_goods
+
+    async def update_good(self, conn: AsyncConnection, good_id: UUID, good: Good) -> Good:
+        good = await self.good.update_good(conn, good_id, good)
+        self._index(good)
+        return good
+
+    async def delete_good(self, conn: AsyncConnection, good_id: UUID):
+        await self.good.delete_good(conn, good_id)
+        self._changed(good_id)
+
+    def _answerable(self, look_filter: LookFilter) -> bool:
+        # index knows only locations, so any other filter goes to the database
+        if not (self.loaded and look_filter.location is not None and not look_filter.name
+                and not look_filter.user_id and look_filter.min_price is None and look_filter.max_price is None
+                and look_order(look_filter) == GoodsOrder.distance):
+            return False
+        # pages started on the database go on there; the database rejects cursors of the index as invalid
+        return not look_filter.cursor or distance_keyset(look_filter.location.place, INDEX_KEYSET_NAME) \
+            .owns(look_filter.cursor)
+
+    async def _look(self, conn: AsyncConnection, look_filter: LookFilter, fetch) -> tuple[list, str | None]:
+        area = look_filter.location
+        # same ordering and cursor format as the database lookup, but named apart
+        keyset = distance_keyset(area.place, INDEX_KEYSET_NAME)
+        hits = self.geo_index.within(area.place.latitude, area.place.longitude, area.radius)
+
+        start = 0
+        if look_filter.cursor:
+            start = bisect.bisect_right(hits, tuple(keyset.decode(look_filter.cursor)))
+
+        page = hits[start:start + look_filter.limit + 1]
+        next_cursor = None
+        if len(page) > look_filter.limit:
+            page = page[:look_filter.limit]
+            next_cursor = keyset.encode_values(list(page[-1]))
+
+        items = await fetch(conn, [good_id for _, good_id in page])
+        items_by_id = {item.id: item for item in items}
+        logger.debug("answered lookup by filter %s from geo index, %s hits in total", look_filter, len(hits))
+        return [items_by_id[good_id] for _, good_id in page if good_id in items_by_id], next_cursor
+
+    async def look_good(self, conn: AsyncConnection, look_filter: LookFilter) -> GoodsList:
+        if not self._answerable(look_filter):
+            return await self.good.look_good(conn, look_filter)
+
+        good_list, next_cursor = await self._look(conn, look_filter, self.good.get_goods)
+        return GoodsList(array=good_list, next_cursor=next_cursor)
+
+    async def look_summaries(self, conn: AsyncConnection, look_filter: LookFilter) -> GoodSummaryList:
+        if not self._answerable(look_filter):
+            return await self.good.look_summaries(conn, look_filter)
+
+        summary_list, next_cursor = await self._look(conn, look_filter, self.good.get_summaries)
+        return GoodSummaryList(array=summary_list, next_cursor=next_cursor)
@@ -1,14 +1,20 @@
+from collections.abc import AsyncIterator
+from datetime import datetime
 from uuid import UUID
 
 import sqlalchemy as sa
 from sqlalchemy import insert, update, select, delete
 from sqlalchemy.ext.asyncio import AsyncConnection
-from sqlalchemy.dialects.postgresql import UUID as PG_UUID
-from geoalchemy2 import Geography
-from geoalchemy2.functions import ST_Distance
+from sqlalchemy.dialects.postgresql import UUID as PG_UUID, TSVECTOR, ARRAY, insert as pg_insert
+from geoalchemy2 import Geography, Geometry
+from geoalchemy2.functions import ST_DWithin, ST_MakePoint, ST_SetSRID, ST_X, ST_Y
+from pydantic_extra_types.coordinate import Coordinate
 
 
-from model import Good, GoodsList, LookFilter, GoodNotFoundError
+from model import Good, GoodsList, GoodSummary, GoodSummaryList, LookFilter, GoodsOrder, PriceBucket, GoodNotFoundError, \
+    look_order
+
+from repositories.pagination import Keyset
 
 from usecases.goods import GoodRepo as GoodRepoInterfaceGoods
 from usecases.users import GoodRepo as GoodRepoInterfaceUsers
@@ -23,58 +29,270 @@ goods_table = sa.Table(
     sa.Column('id', PG_UUID(as_uuid=True), primary_key=True, server_default=sa.func.gen_random_uuid()),
     sa.Column('name', sa.String(150), unique=True, nullable=False),
     sa.Column('description', sa.String(1000)),
-    sa.Column('price', sa.Float()),
+    sa.Column('price', sa.Float(), nullable=False),
     sa.Column('images', sa.ARRAY(sa.String(500))),
     sa.Column('location', Geography(geometry_type='POINT', srid=4326)),
     sa.Column('owner_id', PG_UUID(as_uuid=True), nullable=False),
     sa.Column('created_at', sa.DateTime(), server_default=sa.func.now()),
-    sa.Column('updated_at', sa.DateTime(), server_onupdate=sa.func.now())
+    sa.Column('updated_at', sa.DateTime(), server_onupdate=sa.func.now()),
+    sa.Column('search', TSVECTOR(), sa.Computed(
+        "setweight(to_tsvector('simple', coalesce(name, '')), 'A') || "
+        "setweight(to_tsvector('simple', coalesce(description, '')), 'B')",
+        persisted=True
+    ))
+)
+
+# postgres allows at most 32767 bind parameters per statement, a good with location uses 8 of them:
+# 5 columns plus longitude, latitude and srid of the point
+INSERT_BATCH_SIZE = 32767 // 8
+
+# rows fetched from the server-side cursor per round trip
+STREAM_BATCH_SIZE = 1000
+
+# must be the same as in the migration, otherwise the search index won't be used
+SEARCH_CONFIG = 'simple'
+
+latitude_column = ST_Y(sa.cast(goods_table.c.location, Geometry(geometry_type='POINT', srid=4326))).label('latitude')
+longitude_column = ST_X(sa.cast(goods_table.c.location, Geometry(geometry_type='POINT', srid=4326))).label('longitude')
+
+# columns good_from_row expects, location is unpacked into coordinates on the db side
+good_columns = (
+    goods_table.c.id,
+    goods_table.c.name,
+    goods_table.c.description,
+    goods_table.c.price,
+    goods_table.c.images,
+    latitude_column,
+    longitude_column,
+    goods_table.c.owner_id,
+)
+
+# columns summary_from_row expects
+summary_columns = (
+    goods_table.c.id,
+    goods_table.c.name,
+    goods_table.c.price,
+    # arrays are 1-based in postgres
+    goods_table.c.images[1].label('image'),
+    latitude_column,
+    longitude_column,
+)
+
+def location_value(location: Coordinate | None):
+    if location is None:
+        return None
+    point = ST_SetSRID(ST_MakePoint(location.longitude, location.latitude), 4326)
+    return sa.cast(point, Geography(geometry_type='POINT', srid=4326))
+
+# statements of point queries are built once, only parameters change between calls;
+# that skips building and hashing them on every call, compiled form comes from the engine cache
+# and asyncpg reuses the statement prepared on the connection
+
+# null coordinates give null location
+location_param = sa.cast(
+    ST_SetSRID(ST_MakePoint(sa.bindparam('good_longitude', type_=sa.Float), sa.bindparam('good_latitude', type_=sa.Float)), 4326),
+    Geography(geometry_type='POINT', srid=4326)
+)
+
+# bind parameters can't be named after columns in VALUES and SET, so they are prefixed
+good_values = dict(
+    name=sa.bindparam('good_name'),
+    description=sa.bindparam('good_description'),
+    price=sa.bindparam('good_price'),
+    images=sa.bindparam('good_images'),
+    location=location_param,
+    owner_id=sa.bindparam('good_owner_id')
 )
 
-def good_from_row(tuple_like: tuple) -> Good:
-    raise NotImplementedError
+def good_params(good: Good) -> dict:
+    return dict(
+        good_name=good.name,
+        good_description=good.description,
+        good_price=good.price,
+        good_images=good.images,
+        good_latitude=good.location.latitude if good.location else None,
+        good_longitude=good.location.longitude if good.location else None,
+        good_owner_id=good.owner_id
+    )
+
+good_ids_param = sa.bindparam('good_ids', type_=ARRAY(PG_UUID(as_uuid=True)))
+
+# query_name labels timings of the statement in metrics
+add_good_stmt = insert(goods_table).values(**good_values).returning(goods_table.c.id) \
+    .execution_options(query_name="goods.add_good")
+update_good_stmt = update(goods_table).where(goods_table.c.id == sa.bindparam('good_id')) \
+    .values(**good_values).returning(*good_columns).execution_options(query_name="goods.update_good")
+get_good_stmt = select(*good_columns).where(goods_table.c.id == sa.bindparam('good_id')) \
+    .execution_options(query_name="goods.get_good")
+get_goods_stmt = select(*good_columns).where(goods_table.c.id == sa.any_(good_ids_param)) \
+    .execution_options(query_name="goods.get_goods")
+get_summaries_stmt = select(*summary_columns).where(goods_table.c.id == sa.any_(good_ids_param)) \
+    .execution_options(query_name="goods.get_summaries")
+delete_good_stmt = delete(goods_table).where(goods_table.c.id == sa.bindparam('good_id')) \
+    .execution_options(query_name="goods.delete_good")
+
+# rows come from our own table and are already constrained by postgres, so models are built without validation;
+# model_construct goes through every field in python and is slower than validating these plain fields,
+# so instances are filled in directly (bench/row_mapping.py), tests check they equal validated ones
+_GOOD_FIELDS = frozenset(Good.model_fields)
+_SUMMARY_FIELDS = frozenset(GoodSummary.model_fields)
+
+def _construct(model: type, fields: frozenset, values: dict):
+    instance = object.__new__(model)
+    object.__setattr__(instance, '__dict__', values)
+    object.__setattr__(instance, '__pydantic_fields_set__', set(fields))
+    object.__setattr__(instance, '__pydantic_extra__', None)
+    object.__setattr__(instance, '__pydantic_private__', None)
+    return instance
+
+def location_from_row(row) -> Coordinate | None:
+    if row['latitude'] is None or row['longitude'] is None:
+        return None
+    # pydantic dataclass, its fields are plain attributes
+    location = object.__new__(Coordinate)
+    object.__setattr__(location, '__dict__', {'latitude': row['latitude'], 'longitude': row['longitude']})
+    return location
+
+def good_from_row(row) -> Good:
+    row = row._mapping
+    return _construct(Good, _GOOD_FIELDS, {
+        'id': row['id'],
+        'name': row['name'],
+        'description': row['description'],
+        'price': row['price'],
+        'images': row['images'],
+        'location': location_from_row(row),
+        'owner_id': row['owner_id'],
+    })
+
+def summary_from_row(row) -> GoodSummary:
+    row = row._mapping
+    return _construct(GoodSummary, _SUMMARY_FIELDS, {
+        'id': row['id'],
+        'name': row['name'],
+        'price': row['price'],
+        'image': row['image'],
+        'location': location_from_row(row),
+    })
+
+def name_search(stmt, name: str):
+    """
+    Adds full-text (name and description) and trigram (name, typo tolerant) search to the statement
+    """
+    query = sa.func.websearch_to_tsquery(SEARCH_CONFIG, name)
+    return stmt.where(sa.or_(
+        goods_table.c.search.op('@@')(query),
+        goods_table.c.name.op('%')(name)
+    ))
+
+def name_rank(name: str) -> sa.ColumnElement:
+    query = sa.func.websearch_to_tsquery(SEARCH_CONFIG, name)
+    return sa.func.ts_rank(goods_table.c.search, query) + sa.func.similarity(goods_table.c.name, name)
+
+# newest goods first, backed by ix_goods_created_at_id
+newest_keyset = Keyset('newest', [(goods_table.c.created_at, datetime), (goods_table.c.id, UUID)])
+
+def relevance_keyset(name: str) -> Keyset:
+    return Keyset('relevance', [(name_rank(name), float), (goods_table.c.created_at, datetime), (goods_table.c.id, UUID)])
+
+def filter_goods(stmt, look_filter: LookFilter):
+    if look_filter.name:
+        stmt = name_search(stmt, look_filter.name)
+    if look_filter.location:
+        # geography distances are in meters, ST_DWithin is answered by idx_goods_location;
+        # measured on the sphere like <-> and the in-memory index, so every path agrees on who is inside
+        place = location_value(look_filter.location.place)
+        stmt = stmt.where(ST_DWithin(goods_table.c.location, place, look_filter.location.radius, False))
+    if look_filter.user_id:
+        stmt = stmt.where(goods_table.c.owner_id == look_filter.user_id)
+    if look_filter.min_price is not None:
+        stmt = stmt.where(goods_table.c.price >= look_filter.min_price)
+    if look_filter.max_price is not None:
+        stmt = stmt.where(goods_table.c.price <= look_filter.max_price)
+    return stmt
+
+def distance_keyset(place: Coordinate, name: str = 'distance') -> Keyset:
+    # <-> is the knn operator, ordering by it walks idx_goods_location nearest first
+    distance = goods_table.c.location.op('<->', return_type=sa.Float)(location_value(place))
+    return Keyset(name, [(distance, float), (goods_table.c.id, UUID)], descending=False)
+
+# cheapest (most expensive) goods first, backed by ix_goods_price_id
+price_asc_keyset = Keyset('price_asc', [(goods_table.c.price, float), (goods_table.c.id, UUID)], descending=False)
+price_desc_keyset = Keyset('price_desc', [(goods_table.c.price, float), (goods_table.c.id, UUID)])
+
+def look_keyset(look_filter: LookFilter) -> Keyset:
+    order = look_order(look_filter)
+    if order == GoodsOrder.relevance:
+        return relevance_keyset(look_filter.name)
+    if order == GoodsOrder.distance:
+        return distance_keyset(look_filter.location.place)
+    if order == GoodsOrder.price_asc:
+        return price_asc_keyset
+    if order == GoodsOrder.price_desc:
+        return price_desc_keyset
+    return newest_keyset
 
 class GoodRepo(GoodRepoInterfaceGoods, GoodRepoInterfaceUsers):
     async def add_good(self, conn: AsyncConnection, good: Good) -> Good:
-        stmt = insert(goods_table).values(
-            name=good.name,
-            description=good.description,
-            price=good.price,
-            images=good.images,
-            location=good.location,
-            owner_id=good.owner_id
-        )
-        logger.debug("formed add_good request: %s", stmt)
-
         try:
-            result = await conn.execute(stmt)
+            result = await conn.execute(add_good_stmt, good_params(good))
         except Exception as e:
             logger.debug("failed to add good %s error %s", good, e)
             raise e
 
-        new_good = good.model_copy({"id": result.inserted_primary_key})
+        new_good = good.model_copy(update={"id": result.scalar_one()})
         logger.info("added new good %s", new_good)
         return new_good
 
-    async def update_good(self, conn: AsyncConnection, good_id: UUID, good: Good) -> Good:
-        stmt = update(goods_table).where(goods_table.c.id == good_id).values(
-            name=good.name,
-            description=good.description,
-            price=good.price,
-            images=good.images,
-            location=good.location,
-            owner_id=good.owner_id
-        ).returning(goods_table)
-        logger.debug("formed update_good request: %s", stmt)
+    async def add_goods(self, conn: AsyncConnection, goods: list[Good]) -> list[Good | None]:
+        """
+        Inserts goods with one statement per INSERT_BATCH_SIZE goods, skipping the ones with already used names
+
+        Returns added goods in the same order, None in place of skipped ones
+        """
+        ids_by_name = dict()
+        for start in range(0, len(goods), INSERT_BATCH_SIZE):
+            batch = goods[start:start + INSERT_BATCH_SIZE]
+            stmt = pg_insert(goods_table).values([
+                dict(
+                    name=good.name,
+                    description=good.description,
+                    price=good.price,
+                    images=good.images,
+                    location=location_value(good.location),
+                    owner_id=good.owner_id
+                ) for good in batch
+            ]).on_conflict_do_nothing(index_elements=[goods_table.c.name]) \
+                .returning(goods_table.c.id, goods_table.c.name).execution_options(query_name="goods.add_goods")
+            logger.debug("formed add_goods request for %s goods", len(batch))
+
+            try:
+                result = await conn.execute(stmt)
+            except Exception as e:
+                logger.debug("failed to add %s goods error %s", len(batch), e)
+                raise e
 
+            for row in result:
+                ids_by_name[row.name] = row.id
+
+        new_goods = []
+        for good in goods:
+            # with duplicate names in the list only the first one is added
+            good_id = ids_by_name.pop(good.name, None)
+            new_goods.append(None if good_id is None else good.model_copy(update={"id": good_id}))
+        logger.info("added %s new goods out of %s", sum(good is not None for good in new_goods), len(goods))
+        return new_goods
+
+    async def update_good(self, conn: AsyncConnection, good_id: UUID, good: Good) -> Good:
         try:
-            result = await conn.execute(stmt)
+            result = await conn.execute(update_good_stmt, {"good_id": good_id, **good_params(good)})
         except Exception as e:
             logger.debug("failed to update good %s with id %s error %s", good, good_id, e)
             raise e
         
-        if result.first:
-            good = good_from_row(result.first)
+        row = result.first()
+        if row:
+            good = good_from_row(row)
         else:
             logger.info("no good found for update with id %s", good_id)
             raise GoodNotFoundError(good_id)
@@ -83,13 +301,11 @@ class GoodRepo(GoodRepoInterfaceGoods, GoodRepoInterfaceUsers):
         return good
 
     async def get_good(self, conn: AsyncConnection, good_id: UUID) -> Good:
-        stmt = select(goods_table).where(goods_table.c.id == good_id)
-        logger.debug("formed get_good request %s", stmt)
+        result = await conn.execute(get_good_stmt, {"good_id": good_id})
 
-        result = await conn.execute(stmt)
-
-        if result.first:
-            good = good_from_row(result.first)
+        row = result.first()
+        if row:
+            good = good_from_row(row)
         else:
             logger.info("good with such id not found: %s", good_id)
             raise GoodNotFoundError(good_id)
@@ -97,27 +313,105 @@ class GoodRepo(GoodRepoInterfaceGoods, GoodRepoInterfaceUsers):
         logger.debug("received user by id %s: %s", good_id, good)
         return good
 
-    async def delete_good(self, conn: AsyncConnection, good_id: UUID):
-        stmt = delete(goods_table).where(goods_table.c.id == good_id)
-        logger.debug("formed delete_good request %s", stmt)
+    async def get_goods(self, conn: AsyncConnection, good_ids: list[UUID]) -> list[Good]:
+        # goods that weren't found are skipped, order isn't preserved
+        if not good_ids:
+            return []
+
+        result = await conn.execute(get_goods_stmt, {"good_ids": list(good_ids)})
+        goods = [good_from_row(row) for row in result]
+        logger.debug("received %s goods out of %s requested", len(goods), len(good_ids))
+        return goods
+
+    async def get_summaries(self, conn: AsyncConnection, good_ids: list[UUID]) -> list[GoodSummary]:
+        # same as get_goods, but only the columns of summary
+        if not good_ids:
+            return []
 
-        await conn.execute(stmt)
+        result = await conn.execute(get_summaries_stmt, {"good_ids": list(good_ids)})
+        summaries = [summary_from_row(row) for row in result]
+        logger.debug("received %s good summaries out of %s requested", len(summaries), len(good_ids))
+        return summaries
+
+    async def delete_good(self, conn: AsyncConnection, good_id: UUID):
+        await conn.execute(delete_good_stmt, {"good_id": good_id})
         logger.info("executed delete by id %s", good_id)
 
-    async def look_good(self, conn: AsyncConnection, look_filter: LookFilter) -> GoodsList:
-        stmt = select(goods_table)
-        if look_filter.location:
-            stmt = stmt.where(ST_Distance(goods_table.c.location, look_filter.location))
-        if look_filter.user_id:
-            stmt = stmt.where(goods_table.c.owner_id == look_filter.user_id)
-        # also need to add full name search
+    async def _look(self, conn: AsyncConnection, look_filter: LookFilter, columns, from_row) -> tuple[list, str | None]:
+        stmt = filter_goods(select(*columns), look_filter)
+        keyset = look_keyset(look_filter)
+        stmt = keyset.apply(stmt, look_filter.cursor, look_filter.limit).execution_options(query_name="goods.look")
 
-        logger.debug("formed look_good request: %s", stmt)
+        logger.debug("formed look request: %s", stmt)
 
         result = await conn.execute(stmt)
-        good_list = []
-        for row in result:
-            good_list.append(good_from_row(row))
+        rows, next_cursor = keyset.page(result.all(), look_filter.limit)
+        return [from_row(row) for row in rows], next_cursor
+
+    async def look_good(self, conn: AsyncConnection, look_filter: LookFilter) -> GoodsList:
+        good_list, next_cursor = await self._look(conn, look_filter, good_columns, good_from_row)
         logger.debug("received good list %s by filter %s", good_list, look_filter)
         
-        return GoodsList(array=good_list)
+        return GoodsList(array=good_list, next_cursor=next_cursor)
+
+    async def look_summaries(self, conn: AsyncConnection, look_filter: LookFilter) -> GoodSummaryList:
+        summary_list, next_cursor = await self._look(conn, look_filter, summary_columns, summary_from_row)
+        logger.debug("received %s good summaries by filter %s", len(summary_list), look_filter)
+
+        return GoodSummaryList(array=summary_list, next_cursor=next_cursor)
+
+    async def price_facets(self, conn: AsyncConnection, look_filter: LookFilter, bounds: list[float]) -> list[PriceBucket]:
+        """
+        Counts goods matching the filter per price bucket with one grouped query, bounds must be sorted
+
+        Price range of the filter is ignored, so all the buckets are counted, not only the chosen ones
+        """
+        look_filter = look_filter.model_copy(update={"min_price": None, "max_price": None})
+        # 0 is for prices below the first bound, len(bounds) for the ones above the last
+        bucket = sa.func.width_bucket(goods_table.c.price, sa.literal(list(bounds), ARRAY(sa.Float))).label('bucket')
+        stmt = filter_goods(select(bucket, sa.func.count().label('count')), look_filter) \
+            .where(goods_table.c.price.is_not(None)).group_by(bucket).execution_options(query_name="goods.price_facets")
+        logger.debug("formed price_facets request: %s", stmt)
+
+        result = await conn.execute(stmt)
+        counts = {row.bucket: row.count for row in result}
+
+        edges = [None, *bounds, None]
+        facets = [
+            PriceBucket(min_price=edges[i], max_price=edges[i + 1], count=counts.get(i, 0))
+            for i in range(len(bounds) + 1)
+        ]
+        logger.debug("received price facets %s by filter %s", facets, look_filter)
+        return facets
+
+    async def stream_goods(self, conn: AsyncConnection, look_filter: LookFilter) -> AsyncIterator[Good]:
+        # limit and cursor are ignored, rows are read from a server-side cursor in batches
+        stmt = filter_goods(select(*good_columns), look_filter) \
+            .execution_options(yield_per=STREAM_BATCH_SIZE, query_name="goods.stream_goods")
+        logger.debug("formed stream_goods request: %s", stmt)
+
+        result = await conn.stream(stmt)
+        count = 0
+        async for row in result:
+            count += 1
+            yield good_from_row(row)
+        logger.debug("streamed %s goods by filter %s", count, look_filter)
+
+    async def stream_locations(self, conn: AsyncConnection) -> AsyncIterator[tuple[UUID, float, float]]:
+        # (id, latitude, longitude) of every good that has a location
+        stmt = select(goods_table.c.id, latitude_column, longitude_column).where(goods_table.c.location.is_not(None)) \
+            .execution_options(yield_per=STREAM_BATCH_SIZE, query_name="goods.stream_locations")
+        logger.debug("formed stream_locations request: %s", stmt)
+
+        result = await conn.stream(stmt)
+        async for row in result:
+            yield row.id, row.latitude, row.longitude
+
+    async def stream_names(self, conn: AsyncConnection) -> AsyncIterator[tuple[UUID, str]]:
+        stmt = select(goods_table.c.id, goods_table.c.name) \
+            .execution_options(yield_per=STREAM_BATCH_SIZE, query_name="goods.stream_names")
+        logger.debug("formed stream_names request: %s", stmt)
+
+        result = await conn.stream(stmt)
+        async for row in result:
+            yield row.id, row.name
@@ -0,0 +1,94 @@
+import base64
+import binascii
+import json
+from datetime import datetime
+from uuid import UUID
+
+import sqlalchemy as sa
+
+from model import InvalidCursorError
+
+import logging
+logger = logging.getLogger(__name__)
+
+def _dump_value(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, UUID):
+        return str(value)
+    return value
+
+def _load_value(value, value_type: type):
+    if value_type is datetime:
+        return datetime.fromisoformat(value)
+    if value_type is UUID:
+        # UUID() takes anything else that came from json apart with AttributeError
+        if not isinstance(value, str):
+            raise TypeError(f"expected uuid string, got {value!r}")
+        return UUID(value)
+    return value_type(value)
+
+class Keyset:
+    """
+    Ordering used for keyset pagination
+
+    Rows are sorted by the given keys, the last one must be unique (usually the primary key).
+    Cursor is an opaque string with key values of the last row on the page, so the next page
+    is found by a row comparison instead of OFFSET. When an index is ordered by the keys (newest, price, distance)
+    it's answered from the index, no matter how deep the page is; keys computed per row (relevance)
+    are computed for every matching row, so each page costs O(matches), deep or not.
+    """
+    def __init__(self, name: str, keys: list[tuple[sa.ColumnElement, type]], descending: bool = True):
+        self.name = name
+        self.exprs = [expr for expr, _ in keys]
+        self.types = [value_type for _, value_type in keys]
+        self.descending = descending
+
+    def _label(self, i: int) -> str:
+        return f"_keyset_{i}"
+
+    def encode(self, row) -> str:
+        row = row._mapping
+        return self.encode_values([row[self._label(i)] for i in range(len(self.exprs))])
+
+    def encode_values(self, values: list) -> str:
+        values = [_dump_value(value) for value in values]
+        raw = json.dumps([self.name, *values], separators=(",", ":")).encode()
+        return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+    def decode(self, cursor: str) -> list:
+        try:
+            raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+            name, *values = json.loads(raw)
+            if name != self.name or len(values) != len(self.types):
+                raise ValueError(f"cursor doesn't belong to ordering {self.name}")
+            return [_load_value(value, value_type) for value, value_type in zip(values, self.types)]
+        except (binascii.Error, ValueError, TypeError) as e:
+            logger.debug("failed to decode cursor %s error %s", cursor, e)
+            raise InvalidCursorError(cursor)
+
+    def owns(self, cursor: str) -> bool:
+        try:
+            self.decode(cursor)
+        except InvalidCursorError:
+            return False
+        return True
+
+    def apply(self, stmt, cursor: str | None, limit: int):
+        # one extra row tells if there is a next page
+        stmt = stmt.add_columns(*[expr.label(self._label(i)) for i, expr in enumerate(self.exprs)])
+
+        if cursor:
+            values = self.decode(cursor)
+            row_key = sa.tuple_(*self.exprs)
+            last_key = sa.tuple_(*[sa.literal(value, expr.type) for value, expr in zip(values, self.exprs)])
+            stmt = stmt.where(row_key < last_key if self.descending else row_key > last_key)
+
+        order = [expr.desc() if self.descending else expr.asc() for expr in self.exprs]
+        return stmt.order_by(*order).limit(limit + 1)
+
+    def page(self, rows: list, limit: int) -> tuple[list, str | None]:
+        if len(rows) <= limit:
+            return rows, None
+        rows = rows[:limit]
+        return rows, self.encode(rows[-1])
@@ -0,0 +1,87 @@
+from collections.abc import AsyncIterator
+from uuid import UUID
+
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+from model import Good, GoodsList, GoodSummary, GoodSummaryList, LookFilter, PriceBucket, User, ActiveTime
+
+from usecases.goods import GoodRepo as GoodRepoInterfaceGoods
+from usecases.users import GoodRepo as GoodRepoInterfaceUsers, UserRepo as UserRepoInterface
+
+class GoodRepoProxy(GoodRepoInterfaceGoods, GoodRepoInterfaceUsers):
+    """
+    Passes every call to the wrapped repository, base for repositories adding something on top of it
+    (in-memory indexes, caches), so they only override what they need
+    """
+    def __init__(self, good: GoodRepoInterfaceGoods):
+        self.good = good
+
+    async def add_good(self, conn: AsyncConnection, good: Good) -> Good:
+        return await self.good.add_good(conn, good)
+
+    async def add_goods(self, conn: AsyncConnection, goods: list[Good]) -> list[Good | None]:
+        return await self.good.add_goods(conn, goods)
+
+    async def update_good(self, conn: AsyncConnection, good_id: UUID, good: Good) -> Good:
+        return await self.good.update_good(conn, good_id, good)
+
+    async def get_good(self, conn: AsyncConnection, good_id: UUID) -> Good:
+        return await self.good.get_good(conn, good_id)
+
+    async def get_goods(self, conn: AsyncConnection, good_ids: list[UUID]) -> list[Good]:
+        return await self.good.get_goods(conn, good_ids)
+
+    async def get_summaries(self, conn: AsyncConnection, good_ids: list[UUID]) -> list[GoodSummary]:
+        return await self.good.get_summaries(conn, good_ids)
+
+    async def delete_good(self, conn: AsyncConnection, good_id: UUID):
+        return await self.good.delete_good(conn, good_id)
+
+    async def look_good(self, conn: AsyncConnection, look_filter: LookFilter) -> GoodsList:
+        return await self.good.look_good(conn, look_filter)
+
+    async def look_summaries(self, conn: AsyncConnection, look_filter: LookFilter) -> GoodSummaryList:
+        return await self.good.look_summaries(conn, look_filter)
+
+    async def price_facets(self, conn: AsyncConnection, look_filter: LookFilter, bounds: list[float]) -> list[PriceBucket]:
+        return await self.good.price_facets(conn, look_filter, bounds)
+
+    def stream_goods(self, conn: AsyncConnection, look_filter: LookFilter) -> AsyncIterator[Good]:
+        return self.good.stream_goods(conn, look_filter)
+
+    def stream_locations(self, conn: AsyncConnection) -> AsyncIterator[tuple[UUID, float, float]]:
+        return self.good.stream_locations(conn)
+
+    def stream_names(self, conn: AsyncConnection) -> AsyncIterator[tuple[UUID, str]]:
+        return self.good.stream_names(conn)
+
+class UserRepoProxy(UserRepoInterface):
+    """
+    Passes every call to the wrapped repository, same as GoodRepoProxy
+    """
+    def __init__(self, user: UserRepoInterface):
+        self.user = user
+
+    async def add_nonactive(self, conn: AsyncConnection, user: User) -> User:
+        return await self.user.add_nonactive(conn, user)
+
+    async def activate(self, conn: AsyncConnection, id: UUID):
+        return await self.user.activate(conn, id)
+
+    async def get_user(self, conn: AsyncConnection, uuid: UUID) -> User:
+        return await self.user.get_user(conn, uuid)
+
+    async def get_users(self, conn: AsyncConnection, uuids: list[UUID]) -> list[User]:
+        return await self.user.get_users(conn, uuids)
+
+    async def get_by_username(self, conn: AsyncConnection, username: str) -> User:
+        return await self.user.get_by_username(conn, username)
+
+    async def update_user_info(self, conn: AsyncConnection, uuid: UUID, name: str | None = None, active_time: ActiveTime | None = None) -> User:
+        return await self.user.update_user_info(conn, uuid, name, active_time)
+
+    async def update_user(self, conn: AsyncConnection, user: User) -> User:
+        return await self.user.update_user(conn, user)
+
+    async def update_password_hash(self, conn: AsyncConnection, uuid: UUID, old_hash: str, new_hash: str) -> bool:
+        return await self.user.update_password_hash(conn, uuid, old_hash, new_hash)
@@ -0,0 +1,53 @@
+from datetime import datetime
+from uuid import UUID
+
+import sqlalchemy as sa
+from sqlalchemy import insert, select
+from sqlalchemy.ext.asyncio import AsyncConnection
+from sqlalchemy.dialects.postgresql import UUID as PG_UUID
+
+from usecases.users import RevocationRepo as RevocationRepoInterface
+
+import logging
+logger = logging.getLogger(__name__)
+
+revocations_table = sa.Table(
+    'token_revocations',
+    sa.MetaData(),
+    sa.Column('id', sa.BigInteger(), sa.Identity(), primary_key=True),
+    sa.Column('user_id', PG_UUID(as_uuid=True), nullable=False),
+    sa.Column('revoked_at', sa.DateTime(timezone=True), nullable=False, server_default=sa.func.now())
+)
+
+add_revocation_stmt = insert(revocations_table) \
+    .values(user_id=sa.bindparam('revocation_user_id'), revoked_at=sa.bindparam('revocation_revoked_at')) \
+    .execution_options(query_name="revocations.add_revocation")
+# ids are taken before commit, so a revocation with a smaller id may become visible after a bigger one,
+# recent revocations are read again whatever their id is to catch those (none when recent is null)
+get_revocations_stmt = select(revocations_table.c.id, revocations_table.c.user_id, revocations_table.c.revoked_at) \
+    .where(
+        revocations_table.c.revoked_at >= sa.bindparam('since'),
+        sa.or_(
+            revocations_table.c.id > sa.bindparam('after_id'),
+            revocations_table.c.revoked_at >= sa.bindparam('recent', type_=sa.DateTime(timezone=True))
+        )
+    ) \
+    .order_by(revocations_table.c.id) \
+    .execution_options(query_name="revocations.get_revocations")
+
+class RevocationRepo(RevocationRepoInterface):
+    async def add_revocation(self, conn: AsyncConnection, user_id: UUID, revoked_at: datetime):
+        # revoked_at comes from the app clock, same one tokens get their iat from
+        try:
+            await conn.execute(add_revocation_stmt, {"revocation_user_id": user_id, "revocation_revoked_at": revoked_at})
+        except Exception as e:
+            logger.info("failed to revoke tokens of user %s error %s", user_id, e)
+            raise e
+        logger.info("revoked tokens of user %s issued before %s", user_id, revoked_at)
+
+    async def get_revocations(self, conn: AsyncConnection, since: datetime, after_id: int = 0,
+                              recent: datetime | None = None) -> list[tuple[int, UUID, datetime]]:
+        result = await conn.execute(get_revocations_stmt, {"since": since, "after_id": after_id, "recent": recent})
+        revocations = [tuple(row) for row in result]
+        logger.debug("received %s revocations after id %s", len(revocations), after_id)
+        return revocations
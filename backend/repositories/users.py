@@ -1,15 +1,14 @@
 
 from uuid import UUID
 
-from pydantic import NameEmail
-
 import sqlalchemy as sa
-from sqlalchemy import insert, update, select
+from sqlalchemy import update, select
 from sqlalchemy.ext.asyncio import AsyncConnection
-from sqlalchemy.dialects.postgresql import UUID as PG_UUID
+from sqlalchemy.dialects.postgresql import UUID as PG_UUID, ARRAY, insert as pg_insert
+from pydantic import NameEmail
 
 
-from model import User, ActiveTime, UserNotFoundError, safe_print_user
+from model import User, ActiveTime, UserNotFoundError, UsernameInUseError, ConfirmationInUseError, safe_print_user
 
 from usecases.users import UserRepo as UserRepoInterface
 
@@ -32,79 +31,142 @@ users_table = sa.Table(
     sa.Column('updated_at', sa.DateTime(), server_onupdate=sa.func.now())
 )
 
-def user_from_row(tuple_like: tuple) -> User:
-    return User(
-        id=tuple_like[0],
-        name=tuple_like[1],
-        hashed_pasword=tuple_like[2],
-        active_time=ActiveTime(from_hour=tuple_like[3], to_hour=tuple_like[4]),
-        email=tuple_like[4],
-        telegram=tuple_like[5],
-        active=tuple_like[6]
+def email_from_db(value: str | None) -> NameEmail | None:
+    # only the address is stored, it's named after its local part the same way pydantic names a bare address
+    if value is None:
+        return None
+    return NameEmail(value.partition('@')[0], value)
+
+def user_from_row(row) -> User:
+    # rows come from our own table and are already constrained by postgres, so models are built without validation;
+    # columns are taken by name, so changes of the table or the select don't shift them
+    row = row._mapping
+    return User.model_construct(
+        id=row['id'],
+        name=row['name'],
+        hashed_pasword=row['hashed_password'],
+        active_time=ActiveTime.model_construct(from_hour=row['active_from'], to_hour=row['active_to']),
+        email=email_from_db(row['email']),
+        telegram=row['telegram'],
+        active=row['active']
+    )
+
+# statements are built once, only parameters change between calls, same as in goods repository;
+# bind parameters can't be named after columns in VALUES and SET, so they are prefixed
+user_values = dict(
+    name=sa.bindparam('user_name'),
+    hashed_password=sa.bindparam('user_hashed_password'),
+    active_from=sa.bindparam('user_active_from'),
+    active_to=sa.bindparam('user_active_to'),
+    email=sa.bindparam('user_email'),
+    telegram=sa.bindparam('user_telegram'),
+    active=sa.bindparam('user_active')
+)
+
+def user_params(user: User) -> dict:
+    return dict(
+        user_name=user.name,
+        user_hashed_password=user.hashed_pasword,
+        user_active_from=user.active_time.from_hour,
+        user_active_to=user.active_time.to_hour,
+        # the address alone, so one address under different display names is still the same one for unique checks
+        user_email=user.email.email if user.email else None,
+        user_telegram=user.telegram,
+        user_active=user.active
     )
 
+def _used(column: sa.Column) -> sa.ColumnElement:
+    # comparison with null is null and so is bool_or of nulls only, missing email or telegram is never used
+    return sa.func.coalesce(sa.func.bool_or(column == sa.bindparam(f'user_{column.name}')), sa.false())
+
+# conflicts are looked up in the same statement as the insert, the lookup sees the table as it was before it;
+# aggregate without grouping always gives one row, so the result has one row whatever happened
+_conflicts = select(
+    _used(users_table.c.name).label("name_used"),
+    _used(users_table.c.email).label("email_used"),
+    _used(users_table.c.telegram).label("telegram_used")
+).where(sa.or_(
+    users_table.c.name == sa.bindparam('user_name'),
+    users_table.c.email == sa.bindparam('user_email'),
+    users_table.c.telegram == sa.bindparam('user_telegram')
+)).cte("conflicts")
+_inserted = pg_insert(users_table).values(**user_values).on_conflict_do_nothing() \
+    .returning(users_table.c.id).cte("inserted")
+
+# query_name labels timings of the statement in metrics
+add_nonactive_stmt = select(_inserted.c.id, _conflicts.c.name_used, _conflicts.c.email_used, _conflicts.c.telegram_used) \
+    .select_from(_conflicts.outerjoin(_inserted, sa.true())).execution_options(query_name="users.add_nonactive")
+conflicts_stmt = select(_conflicts.c.name_used, _conflicts.c.email_used, _conflicts.c.telegram_used) \
+    .execution_options(query_name="users.conflicts")
+
+activate_stmt = update(users_table).where(users_table.c.id == sa.bindparam('user_id')).values(active=True) \
+    .execution_options(query_name="users.activate")
+get_user_stmt = select(users_table).where(users_table.c.id == sa.bindparam('user_id')) \
+    .execution_options(query_name="users.get_user")
+get_users_stmt = select(users_table) \
+    .where(users_table.c.id == sa.any_(sa.bindparam('user_ids', type_=ARRAY(PG_UUID(as_uuid=True))))) \
+    .execution_options(query_name="users.get_users")
+get_by_username_stmt = select(users_table).where(users_table.c.name == sa.bindparam('username')) \
+    .execution_options(query_name="users.get_by_username")
+# fields given as null are kept as they are
+update_user_info_stmt = update(users_table).where(users_table.c.id == sa.bindparam('user_id')).values(
+    name=sa.func.coalesce(sa.bindparam('user_name', type_=sa.String), users_table.c.name),
+    active_from=sa.func.coalesce(sa.bindparam('user_active_from', type_=sa.Integer), users_table.c.active_from),
+    active_to=sa.func.coalesce(sa.bindparam('user_active_to', type_=sa.Integer), users_table.c.active_to)
+).returning(users_table).execution_options(query_name="users.update_user_info")
+update_user_stmt = update(users_table).where(users_table.c.id == sa.bindparam('user_id')) \
+    .values(**user_values).returning(users_table).execution_options(query_name="users.update_user")
+# compare and set, a password changed or reset meanwhile isn't overwritten with a rehash of the old one
+update_password_hash_stmt = update(users_table) \
+    .where(users_table.c.id == sa.bindparam('user_id'), users_table.c.hashed_password == sa.bindparam('old_hashed_password')) \
+    .values(hashed_password=sa.bindparam('user_hashed_password')) \
+    .execution_options(query_name="users.update_password_hash")
+
 class UsersRepo(UserRepoInterface):
     async def add_nonactive(self, conn: AsyncConnection, user: User) -> User:
-        stmt = insert(users_table).values(
-            name=user.name,
-            hashed_password=user.hashed_pasword,
-            active_from=user.active_time.from_hour,
-            active_to=user.active_time.to_hour,
-            email=user.email,
-            telegram=user.telegram,
-            active=False
-        )
-        # only a temporary mesure, logging of hashed password is not safe
-        logger.debug("formed add_nonactive request: %s", stmt)
+        params = user_params(user.model_copy(update={"active": False}))
 
         try:
-            result = await conn.execute(stmt)
+            result = await conn.execute(add_nonactive_stmt, params)
         except Exception as e:
-            logger.info("failed to add user %s error %s", user, e)
+            logger.info("failed to add user %s error %s", safe_print_user(user), e)
             raise e
-        new_user = user.model_copy({"id": result.inserted_primary_key})
-        logger.info("added non-active user %s", new_user)
+
+        row = result.one()
+        if row.id is None:
+            if not (row.name_used or row.email_used or row.telegram_used):
+                # conflicting user was committed after the statement had started, so only the insert saw it
+                row = (await conn.execute(conflicts_stmt, params)).one()
+            logger.info("user %s conflicts with existing: name %s, email %s, telegram %s",
+                        safe_print_user(user), row.name_used, row.email_used, row.telegram_used)
+            if row.name_used:
+                raise UsernameInUseError(user.name)
+            if row.email_used:
+                raise ConfirmationInUseError("email", user.email)
+            if row.telegram_used:
+                raise ConfirmationInUseError("telegram", user.telegram)
+            raise UsernameInUseError(user.name)
+
+        new_user = user.model_copy(update={"id": row.id})
+        logger.info("added non-active user %s", safe_print_user(new_user))
         return new_user
 
     async def activate(self, conn: AsyncConnection, id: UUID):
-        stmt = update(users_table).where(users_table.c.id == id).values(active=True)
-        logger.debug("formed activate request: %s", stmt)
-
         # it would also be good to check for error type and reraise with my own error types
         try:
-            await conn.execute(stmt)
+            await conn.execute(activate_stmt, {"user_id": id})
         except Exception as e:
             logger.info("failed to activate user with id %s error %s", id, e)
             raise e
 
         logger.info("successfully activated user with id %s", id)
 
-    async def is_mail_used(self, conn: AsyncConnection, email: NameEmail) -> bool:
-        stmt = select(sa.func.count("*")).select_from(users_table).where(users_table.c.email == email)
-        logger.debug("formed is_mail_used request: %s", stmt)
-
-        result = await conn.execute(stmt)
-        used = result.first[0] != 0
-        logger.debug("is_mail_used for %s: %s", email, used)
-        return used
-
-    async def is_telegram_used(self, conn: AsyncConnection, telegram: str) -> bool:
-        stmt = select(sa.func.count("*")).select_from(users_table).where(users_table.c.telegram == telegram)
-        logger.debug("formed is_telegram_used request: %s", stmt)
-
-        result = await conn.execute(stmt)
-        used = result.first[0] != 0
-        logger.debug("is_telegram_used for %s: %s", telegram, used)
-        return used
-
     async def get_user(self, conn: AsyncConnection, uuid: UUID) -> User:
-        stmt = select(users_table).where(users_table.c.id == uuid)
-        logger.debug("formed get_user request: %s", stmt)
-
-        result = await conn.execute(stmt)
+        result = await conn.execute(get_user_stmt, {"user_id": uuid})
         
-        if result.first:
-            user = user_from_row(result.first)
+        row = result.first()
+        if row:
+            user = user_from_row(row)
         else:
             logger.debug("user with such id %s not found", uuid)
             raise UserNotFoundError(user_id=uuid)
@@ -112,14 +174,22 @@ class UsersRepo(UserRepoInterface):
         logger.debug("received user by id %s: %s", uuid, safe_print_user(user))
         return user
 
-    async def get_by_username(self, conn: AsyncConnection, username: str) -> User:
-        stmt = select(users_table).where(users_table.c.name == username)
-        logger.debug("formed get_by_username request: %s", stmt)
+    async def get_users(self, conn: AsyncConnection, uuids: list[UUID]) -> list[User]:
+        # users that weren't found are skipped, order isn't preserved
+        if not uuids:
+            return []
 
-        result = await conn.execute(stmt)
+        result = await conn.execute(get_users_stmt, {"user_ids": list(uuids)})
+        users = [user_from_row(row) for row in result]
+        logger.debug("received %s users out of %s requested", len(users), len(uuids))
+        return users
+
+    async def get_by_username(self, conn: AsyncConnection, username: str) -> User:
+        result = await conn.execute(get_by_username_stmt, {"username": username})
         
-        if result.first:
-            user = user_from_row(result.first)
+        row = result.first()
+        if row:
+            user = user_from_row(row)
         else:
             logger.debug("user with such username %s not found", username)
             raise UserNotFoundError(username=username)
@@ -128,53 +198,52 @@ class UsersRepo(UserRepoInterface):
         return user
 
     async def update_user_info(self, conn: AsyncConnection, uuid: UUID, name: str | None = None, active_time: ActiveTime | None = None) -> User:
-        stmt = update(users_table).where(users_table.c.id == uuid)
-        if name and active_time:
-            stmt = stmt.values(name=name, active_from=active_time.from_hour, to_hour=active_time.to_hour)
-        elif name:
-            stmt = stmt.values(name=name)
-        elif active_time:
-            stmt = stmt.values(active_from=active_time.from_hour, to_hour=active_time.to_hour)
-
-        stmt = stmt.returning(users_table)
-        logger.debug("formed update_user_info request: %s", stmt)
+        params = {
+            "user_id": uuid,
+            "user_name": name or None,
+            "user_active_from": active_time.from_hour if active_time else None,
+            "user_active_to": active_time.to_hour if active_time else None
+        }
 
         try:
-            result = await conn.execute(stmt)
+            result = await conn.execute(update_user_info_stmt, params)
         except Exception as e:
             logger.info("failed to update user with id %s with data: name = %s, active_time = %s; error %s", uuid, name, active_time, e)
             raise e
 
-        if result.first:
-            user = user_from_row(result.first)
+        row = result.first()
+        if row:
+            user = user_from_row(row)
         else:
             logger.info("no user with id %s found for update", uuid)
-            raise UserNotFoundError(uuid=uuid)
-        logger.info("successfully updated user with id %s with data: name = %s, active_time = %s; result = %s", uuid, name, active_time, user)
+            raise UserNotFoundError(user_id=uuid)
+        logger.info("successfully updated user with id %s with data: name = %s, active_time = %s; result = %s", uuid, name, active_time, safe_print_user(user))
         return user
 
     async def update_user(self, conn: AsyncConnection, user: User) -> User:
-        stmt = update(users_table).where(users_table.c.id == user.id).values(
-            name=user.name,
-            hashed_password=user.hashed_pasword,
-            active_from=user.active_time.from_hour,
-            active_to=user.active_time.to_hour,
-            email=user.email,
-            telegram=user.telegram,
-            active=user.active
-        )
-        logger.debug("formed update_user request: %s", stmt)
-
         try:
-            result = await conn.execute(stmt)
+            result = await conn.execute(update_user_stmt, {"user_id": user.id, **user_params(user)})
         except Exception as e:
-            logger.info("failed to update user %s; error %s", user, e)
+            logger.info("failed to update user %s; error %s", safe_print_user(user), e)
             raise e
 
-        if result.first:
-            user = user_from_row(result.first)
+        row = result.first()
+        if row:
+            user = user_from_row(row)
         else:
             logger.info("no user with id %s found for update", user.id)
-            raise UserNotFoundError(uuid=user.id)
-        logger.info("successfully updated user %s", user)
-        return user
\ No newline at end of file
+            raise UserNotFoundError(user_id=user.id)
+        logger.info("successfully updated user %s", safe_print_user(user))
+        return user
+
+    async def update_password_hash(self, conn: AsyncConnection, uuid: UUID, old_hash: str, new_hash: str) -> bool:
+        try:
+            result = await conn.execute(update_password_hash_stmt, {"user_id": uuid, "old_hashed_password": old_hash,
+                                                                     "user_hashed_password": new_hash})
+        except Exception as e:
+            logger.info("failed to update password hash of user with id %s error %s", uuid, e)
+            raise e
+
+        updated = result.rowcount == 1
+        logger.debug("updated password hash of user with id %s: %s", uuid, updated)
+        return updated
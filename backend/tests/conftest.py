@@ -0,0 +1,15 @@
+import pytest
+
+class FakeClock:
+    """
+    Stands in for the time module of modules reading time.monotonic, moved by hand
+    """
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self) -> float:
+        return self.now
+
+@pytest.fixture
+def fake_clock() -> FakeClock:
+    return FakeClock()
@@ -0,0 +1,135 @@
+import asyncio
+
+import pytest
+
+from utils import cache
+from utils.cache import TTLCache
+
+@pytest.fixture
+def clock(fake_clock, monkeypatch):
+    monkeypatch.setattr(cache, "time", fake_clock)
+    return fake_clock
+
+def test_entries_expire(clock):
+    entries = TTLCache(max_size=10, ttl=60)
+    entries.put("a", 1)
+    entries.put("b", 2, ttl=5)
+
+    clock.now += 10
+    assert entries.get("a") == 1
+    assert entries.get("b") is None
+    assert len(entries) == 1
+
+    clock.now += 60
+    assert entries.get("a", "missing") == "missing"
+    assert len(entries) == 0
+
+def test_least_recently_used_evicted(clock):
+    entries = TTLCache(max_size=2, ttl=60)
+    entries.put("a", 1)
+    entries.put("b", 2)
+    entries.get("a")
+    entries.put("c", 3)
+
+    assert entries.get("b") is None
+    assert entries.get("a") == 1
+    assert entries.get("c") == 3
+
+def test_stats(clock):
+    entries = TTLCache(max_size=10, ttl=60)
+    entries.put("a", 1)
+    entries.get("a")
+    entries.get("a")
+    entries.get("b")
+
+    assert entries.stats() == {"size": 1, "hits": 2, "misses": 1}
+
+def test_pop_and_clear(clock):
+    entries = TTLCache(max_size=10, ttl=60)
+    for i in range(4):
+        entries.put(i, i * 10)
+
+    entries.pop(0)
+    entries.pop(100)
+
+    assert list(entries.entries) == [1, 2, 3]
+    entries.clear()
+    assert len(entries) == 0
+
+def test_get_or_load_makes_one_load(clock):
+    entries = TTLCache(max_size=10, ttl=60)
+    loads = []
+
+    async def load():
+        loads.append(1)
+        await asyncio.sleep(0)
+        return "value"
+
+    async def main():
+        values = await asyncio.gather(*(entries.get_or_load("a", load) for _ in range(5)))
+        again = await entries.get_or_load("a", load)
+        return values, again
+
+    values, again = asyncio.run(main())
+    assert values == ["value"] * 5
+    assert again == "value"
+    assert len(loads) == 1
+    assert not entries.loading
+
+def test_failed_load_is_not_cached(clock):
+    entries = TTLCache(max_size=10, ttl=60)
+
+    async def failing():
+        raise RuntimeError("down")
+
+    async def load():
+        return "value"
+
+    async def main():
+        with pytest.raises(RuntimeError):
+            await entries.get_or_load("a", failing)
+        return await entries.get_or_load("a", load)
+
+    assert asyncio.run(main()) == "value"
+
+def test_load_racing_pop_is_not_cached(clock):
+    entries = TTLCache(max_size=10, ttl=60)
+    started, release = None, None
+
+    async def load():
+        started.set()
+        await release.wait()
+        return "stale"
+
+    async def main():
+        nonlocal started, release
+        started, release = asyncio.Event(), asyncio.Event()
+        loading = asyncio.ensure_future(entries.get_or_load("a", load))
+        await started.wait()
+        # e.g. the value was written while it was being read
+        entries.pop("a")
+        release.set()
+        return await loading
+
+    # the caller still gets what was loaded, but it isn't kept
+    assert asyncio.run(main()) == "stale"
+    assert entries.get("a") is None
+
+def test_pop_leaves_loads_of_other_keys(clock):
+    entries = TTLCache(max_size=10, ttl=60)
+
+    async def main():
+        release = asyncio.Event()
+
+        async def load():
+            await release.wait()
+            return "value"
+
+        loading = asyncio.ensure_future(entries.get_or_load("a", load))
+        await asyncio.sleep(0)
+        entries.pop("b")
+        release.set()
+        return await loading
+
+    assert asyncio.run(main()) == "value"
+    assert entries.get("a") == "value"
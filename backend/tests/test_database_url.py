@@ -0,0 +1,28 @@
+import pytest
+
+import sqlalchemy as sa
+
+from config import Postgres
+
+from repositories.database import database_url
+
+@pytest.mark.parametrize("address, host, port", [
+    ("localhost", "localhost", None),
+    ("db.local:6432", "db.local", 6432),
+    ("[::1]:5433", "::1", 5433),
+    ("::1", "::1", None),
+])
+def test_credentials_survive_any_characters(address, host, port):
+    pg = Postgres(username="shop@eu", password="p@ss:w/o%rd#?", url=address, database="shop")
+
+    url = sa.make_url(database_url(pg).render_as_string(hide_password=False))
+
+    assert (url.username, url.password, url.host, url.port, url.database) == ("shop@eu", "p@ss:w/o%rd#?", host, port, "shop")
+    assert url.query == {"prepared_statement_cache_size": str(pg.prepared_statement_cache_size)}
+
+def test_replica_host():
+    pg = Postgres(username="shop", password="secret", url="primary:5432", database="shop")
+
+    url = database_url(pg, driver="psycopg2", host="replica")
+
+    assert (url.drivername, url.host, url.port, dict(url.query)) == ("postgresql+psycopg2", "replica", None, {})
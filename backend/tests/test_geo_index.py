@@ -0,0 +1,91 @@
+import math
+import random
+from uuid import uuid4
+
+import pytest
+
+from utils.geo_index import GeoIndex, EARTH_RADIUS
+
+def haversine(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS * math.asin(math.sqrt(min(a, 1.0)))
+
+def brute_force(points: dict, lat: float, lon: float, radius: float) -> set:
+    return {id for id, (point_lat, point_lon) in points.items() if haversine(lat, lon, point_lat, point_lon) <= radius}
+
+@pytest.fixture
+def points() -> dict:
+    random.seed(0)
+    # dense around one city and sparse over the globe, with some at the poles and the antimeridian
+    points = {uuid4(): (55.75 + random.uniform(-0.5, 0.5), 37.61 + random.uniform(-0.5, 0.5)) for _ in range(2000)}
+    points.update({uuid4(): (random.uniform(-90, 90), random.uniform(-180, 180)) for _ in range(2000)})
+    points.update({uuid4(): (random.uniform(89, 90), random.uniform(-180, 180)) for _ in range(50)})
+    points.update({uuid4(): (random.uniform(-10, 10), random.choice((-1, 1)) * random.uniform(179.5, 180)) for _ in range(50)})
+    return points
+
+def make_index(points: dict) -> GeoIndex:
+    index = GeoIndex()
+    for id, (lat, lon) in points.items():
+        index.insert(id, lat, lon)
+    return index
+
+@pytest.mark.parametrize("lat, lon, radius", [
+    (55.75, 37.61, 1000),
+    (55.75, 37.61, 20000),
+    (0, 179.9, 50000),
+    (89.9, 0, 200000),
+    (10, 20, 3000000),
+])
+def test_within_matches_brute_force(points, lat, lon, radius):
+    index = make_index(points)
+    hits = index.within(lat, lon, radius)
+
+    assert {id for _, id in hits} == brute_force(points, lat, lon, radius)
+    for distance, id in hits:
+        assert distance == pytest.approx(haversine(lat, lon, *points[id]), abs=0.01)
+
+def test_within_sorted_by_distance(points):
+    hits = make_index(points).within(55.75, 37.61, 30000)
+
+    assert len(hits) > 1
+    assert [distance for distance, _ in hits] == sorted(distance for distance, _ in hits)
+
+def test_remove(points):
+    index = make_index(points)
+    removed = random.sample(list(points), 1000)
+    for id in removed:
+        index.remove(id)
+        del points[id]
+    # unknown ids are ignored
+    index.remove(uuid4())
+
+    assert len(index) == len(points)
+    assert {id for _, id in index.within(55.75, 37.61, 20000)} == brute_force(points, 55.75, 37.61, 20000)
+
+def test_reinsert_moves_point():
+    index = GeoIndex()
+    id = uuid4()
+    index.insert(id, 55.75, 37.61)
+    index.insert(id, -33.87, 151.21)
+
+    assert len(index) == 1
+    assert index.within(55.75, 37.61, 10000) == []
+    assert [hit_id for _, hit_id in index.within(-33.87, 151.21, 10000)] == [id]
+
+def test_lookup_sees_writes_after_previous_lookup():
+    index = GeoIndex()
+    first, second = uuid4(), uuid4()
+    index.insert(first, 55.75, 37.61)
+    assert [id for _, id in index.within(55.75, 37.61, 1000)] == [first]
+
+    # same cell, so its cached arrays have to be rebuilt
+    index.insert(second, 55.7501, 37.6101)
+    assert {id for _, id in index.within(55.75, 37.61, 1000)} == {first, second}
+
+    index.remove(first)
+    assert [id for _, id in index.within(55.75, 37.61, 1000)] == [second]
+
+    index.remove(second)
+    assert index.within(55.75, 37.61, 1000) == []
+    assert not index.cells
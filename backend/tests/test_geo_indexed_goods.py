@@ -0,0 +1,78 @@
+import asyncio
+from uuid import uuid4
+
+import pytest
+
+from pydantic_extra_types.coordinate import Coordinate
+
+from model import Good, GoodsList, LookFilter, Area, InvalidCursorError
+
+from repositories.geo_indexed_goods import GeoIndexedGoodRepo
+from repositories.goods import distance_keyset
+
+from usecases.goods import GoodRepo
+
+from utils.geo_index import GeoIndex
+
+PLACE = Coordinate(latitude=55.75, longitude=37.61)
+
+class FakeDatabaseRepo(GoodRepo):
+    def __init__(self, goods: list[Good]):
+        self.goods = {good.id: good for good in goods}
+        self.lookups: list[LookFilter] = []
+
+    async def get_goods(self, conn, good_ids) -> list[Good]:
+        return [self.goods[good_id] for good_id in good_ids if good_id in self.goods]
+
+    async def look_good(self, conn, look_filter: LookFilter) -> GoodsList:
+        self.lookups.append(look_filter)
+        if look_filter.cursor:
+            # what the database keyset does with the cursor
+            distance_keyset(look_filter.location.place).decode(look_filter.cursor)
+        return GoodsList(array=[], next_cursor=distance_keyset(look_filter.location.place).encode_values([1.0, uuid4()]))
+
+def make_repo(count: int) -> tuple[GeoIndexedGoodRepo, FakeDatabaseRepo]:
+    owner_id = uuid4()
+    goods = [Good(id=uuid4(), name=f"good {i}", price=1, images=[], owner_id=owner_id,
+                  location=Coordinate(latitude=PLACE.latitude + i * 0.001, longitude=PLACE.longitude)) for i in range(count)]
+    database = FakeDatabaseRepo(goods)
+    repo = GeoIndexedGoodRepo(database, GeoIndex())
+    for good in goods:
+        repo.geo_index.insert(good.id, good.location.latitude, good.location.longitude)
+    repo.loaded = True
+    return repo, database
+
+def near(cursor: str | None = None) -> LookFilter:
+    return LookFilter(name="", location=Area(place=PLACE, radius=10000), limit=2, cursor=cursor)
+
+def test_pages_of_the_index_go_on_in_the_index():
+    repo, database = make_repo(5)
+
+    async def main():
+        pages = [await repo.look_good(None, near())]
+        while pages[-1].next_cursor:
+            pages.append(await repo.look_good(None, near(pages[-1].next_cursor)))
+        return pages
+
+    pages = asyncio.run(main())
+    assert [good.name for page in pages for good in page.array] == [f"good {i}" for i in range(5)]
+    assert database.lookups == []
+
+def test_pages_of_the_database_go_on_in_the_database():
+    repo, database = make_repo(5)
+    repo.loaded = False
+    first = asyncio.run(repo.look_good(None, near()))
+
+    # the index got loaded meanwhile
+    repo.loaded = True
+    asyncio.run(repo.look_good(None, near(first.next_cursor)))
+
+    assert len(database.lookups) == 2
+
+def test_database_rejects_cursors_of_the_index():
+    repo, database = make_repo(5)
+    first = asyncio.run(repo.look_good(None, near()))
+
+    repo.loaded = False
+    with pytest.raises(InvalidCursorError):
+        asyncio.run(repo.look_good(None, near(first.next_cursor)))
@@ -0,0 +1,118 @@
+import asyncio
+
+import pytest
+
+from utils.loader import DataLoader, loader_scope, scoped_loader, clear_scoped
+
+class MissingError(Exception):
+    pass
+
+class Source:
+    """
+    Batch function over a dict of values, remembers the batches it was called with
+    """
+    def __init__(self, values: dict):
+        self.values = values
+        self.batches: list[list] = []
+
+    async def __call__(self, keys: list) -> list:
+        self.batches.append(list(keys))
+        return [(key, self.values[key]) for key in keys if key in self.values]
+
+def make_loader(source: Source) -> DataLoader:
+    return DataLoader(source, key_fn=lambda value: value[0], missing_error=MissingError)
+
+def test_loads_in_one_batch():
+    source = Source({1: "a", 2: "b", 3: "c"})
+
+    async def main():
+        loader = make_loader(source)
+        return await asyncio.gather(loader.load(1), loader.load(2), loader.load(3))
+
+    assert asyncio.run(main()) == [(1, "a"), (2, "b"), (3, "c")]
+    assert source.batches == [[1, 2, 3]]
+
+def test_deduplicates_and_memoizes():
+    source = Source({1: "a"})
+
+    async def main():
+        loader = make_loader(source)
+        first = await asyncio.gather(loader.load(1), loader.load(1))
+        again = await loader.load(1)
+        return first, again
+
+    first, again = asyncio.run(main())
+    assert first == [(1, "a"), (1, "a")]
+    assert again == (1, "a")
+    assert source.batches == [[1]]
+
+def test_missing_key_is_not_memoized():
+    source = Source({})
+
+    async def main():
+        loader = make_loader(source)
+        with pytest.raises(MissingError):
+            await loader.load(1)
+        source.values[1] = "a"
+        return await loader.load(1)
+
+    assert asyncio.run(main()) == (1, "a")
+    assert source.batches == [[1], [1]]
+
+def test_batch_error_reaches_every_caller():
+    async def failing(keys):
+        raise RuntimeError("down")
+
+    async def main():
+        loader = DataLoader(failing, key_fn=lambda value: value[0], missing_error=MissingError)
+        return await asyncio.gather(loader.load(1), loader.load(2), return_exceptions=True)
+
+    results = asyncio.run(main())
+    assert all(isinstance(result, RuntimeError) for result in results)
+
+def test_clear_reloads_key():
+    source = Source({1: "a"})
+
+    async def main():
+        loader = make_loader(source)
+        await loader.load(1)
+        source.values[1] = "b"
+        loader.clear(1)
+        return await loader.load(1)
+
+    assert asyncio.run(main()) == (1, "b")
+    assert source.batches == [[1], [1]]
+
+def test_no_loader_outside_of_scope():
+    assert scoped_loader("values", "conn", Source({}), lambda value: value[0], MissingError) is None
+
+def test_scoped_loaders_per_owner():
+    first, second = Source({1: "a"}), Source({1: "b"})
+
+    async def main():
+        with loader_scope():
+            loader = scoped_loader("values", "first", first, lambda value: value[0], MissingError)
+            assert scoped_loader("values", "first", first, lambda value: value[0], MissingError) is loader
+            other = scoped_loader("values", "second", second, lambda value: value[0], MissingError)
+            assert other is not loader
+            return await asyncio.gather(loader.load(1), other.load(1))
+
+    # every owner loads through its own batch function
+    assert asyncio.run(main()) == [(1, "a"), (1, "b")]
+    assert first.batches == [[1]] and second.batches == [[1]]
+
+def test_clear_scoped_clears_every_owner():
+    first, second = Source({1: "a"}), Source({1: "b"})
+
+    async def main():
+        with loader_scope():
+            loaders = [scoped_loader("values", owner, source, lambda value: value[0], MissingError)
+                       for owner, source in [("first", first), ("second", second)]]
+            for loader in loaders:
+                await loader.load(1)
+            clear_scoped("values", 1)
+            for loader in loaders:
+                await loader.load(1)
+
+    asyncio.run(main())
+    assert first.batches == [[1], [1]] and second.batches == [[1], [1]]
@@ -0,0 +1,86 @@
+import base64
+import json
+from datetime import datetime, timezone
+from types import SimpleNamespace
+from uuid import UUID, uuid4
+
+import pytest
+
+import sqlalchemy as sa
+from sqlalchemy.dialects.postgresql import asyncpg
+
+from model import InvalidCursorError
+
+from repositories.pagination import Keyset
+
+table = sa.table("items", sa.column("created_at", sa.DateTime), sa.column("price", sa.Float), sa.column("id", sa.Uuid))
+
+newest = Keyset("newest", [(table.c.created_at, datetime), (table.c.id, UUID)])
+cheapest = Keyset("cheapest", [(table.c.price, float), (table.c.id, UUID)], descending=False)
+
+def raw_cursor(values) -> str:
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode().rstrip("=")
+
+def test_roundtrip():
+    values = [datetime(2024, 5, 1, 12, 30, tzinfo=timezone.utc), uuid4()]
+    cursor = newest.encode_values(values)
+
+    assert "=" not in cursor
+    assert newest.decode(cursor) == values
+
+def test_encode_reads_labeled_columns():
+    id = uuid4()
+    row = SimpleNamespace(_mapping={"_keyset_0": 9.5, "_keyset_1": id})
+
+    assert cheapest.decode(cheapest.encode(row)) == [9.5, id]
+
+def test_cursor_of_other_ordering():
+    cursor = newest.encode_values([datetime(2024, 5, 1), uuid4()])
+
+    with pytest.raises(InvalidCursorError):
+        cheapest.decode(cursor)
+
+@pytest.mark.parametrize("keyset, cursor", [
+    (cheapest, "not a cursor!"),
+    (cheapest, "%%%"),
+    (cheapest, base64.urlsafe_b64encode(b"\xff\xfe").decode()),
+    (cheapest, raw_cursor(5)),
+    (cheapest, raw_cursor([])),
+    (cheapest, raw_cursor({"cheapest": 1})),
+    (cheapest, raw_cursor(["cheapest", 1.5])),
+    (cheapest, raw_cursor(["cheapest", 1.5, str(uuid4()), 7])),
+    (cheapest, raw_cursor(["cheapest", "cheap", str(uuid4())])),
+    (cheapest, raw_cursor(["cheapest", None, str(uuid4())])),
+    (cheapest, raw_cursor(["cheapest", 1.5, "not an uuid"])),
+    (cheapest, raw_cursor(["cheapest", 1.5, 456])),
+    (newest, raw_cursor(["newest", "yesterday", str(uuid4())])),
+    (newest, raw_cursor(["newest", None, str(uuid4())])),
+])
+def test_garbage_is_invalid_cursor(keyset, cursor):
+    with pytest.raises(InvalidCursorError):
+        keyset.decode(cursor)
+
+def compile(stmt) -> str:
+    return str(stmt.compile(dialect=asyncpg.dialect()))
+
+def test_apply_first_page():
+    sql = compile(cheapest.apply(sa.select(table.c.id), None, 20))
+
+    assert "ORDER BY items.price ASC, items.id ASC" in sql
+    assert "WHERE" not in sql
+
+def test_apply_next_page():
+    descending = compile(newest.apply(sa.select(table.c.id), newest.encode_values([datetime(2024, 5, 1), uuid4()]), 20))
+    ascending = compile(cheapest.apply(sa.select(table.c.id), cheapest.encode_values([1.5, uuid4()]), 20))
+
+    assert "WHERE (items.created_at, items.id) < (" in descending
+    assert "ORDER BY items.created_at DESC, items.id DESC" in descending
+    assert "WHERE (items.price, items.id) > (" in ascending
+
+def test_page():
+    rows = [SimpleNamespace(_mapping={"_keyset_0": float(i), "_keyset_1": uuid4()}) for i in range(3)]
+
+    assert cheapest.page(rows, 3) == (rows, None)
+    page, cursor = cheapest.page(rows, 2)
+    assert page == rows[:2]
+    assert cheapest.decode(cursor) == [1.0, rows[1]._mapping["_keyset_1"]]
@@ -0,0 +1,71 @@
+from uuid import uuid4
+
+from utils.prefix_index import PrefixIndex
+
+def make_index(names: list[str]) -> tuple[PrefixIndex, dict]:
+    ids = {name: uuid4() for name in names}
+    index = PrefixIndex()
+    index.load([(id, name) for name, id in ids.items()])
+    return index, ids
+
+def names(suggestions) -> list[str]:
+    return [name for _, name in suggestions]
+
+def test_suggest_by_prefix():
+    index, ids = make_index(["Red Chair", "red  lamp", "Green Chair", "reading glasses"])
+
+    # case and spaces don't matter, names are returned as they were given
+    assert names(index.suggest("  RED ", 10)) == ["Red Chair", "red  lamp"]
+    assert names(index.suggest("re", 10)) == ["reading glasses", "Red Chair", "red  lamp"]
+    assert names(index.suggest("re", 1)) == ["reading glasses"]
+    assert index.suggest("blue", 10) == []
+    assert index.suggest("   ", 10) == []
+    assert index.suggest("green", 10) == [(ids["Green Chair"], "Green Chair")]
+
+def test_popular_names_go_first():
+    index, ids = make_index(["lamp a", "lamp b", "lamp c", "lamp d"])
+    for _ in range(3):
+        index.touch(ids["lamp c"])
+    index.touch(ids["lamp d"])
+
+    assert names(index.suggest("lamp", 3)) == ["lamp c", "lamp d", "lamp a"]
+    # unknown ids aren't counted
+    index.touch(uuid4())
+    assert len(index.popularity) == 2
+
+def test_max_scan_bounds_candidates():
+    index, _ = make_index([f"lamp {i:03}" for i in range(100)])
+    index.max_scan = 10
+
+    assert names(index.suggest("lamp", 20)) == [f"lamp {i:03}" for i in range(10)]
+
+def test_rename_keeps_popularity():
+    index, ids = make_index(["lamp", "lantern"])
+    index.touch(ids["lantern"])
+    index.insert(ids["lantern"], "lamp shade")
+
+    assert len(index) == 2
+    assert names(index.suggest("lan", 10)) == []
+    assert names(index.suggest("lamp", 10)) == ["lamp shade", "lamp"]
+
+def test_remove():
+    index, ids = make_index(["lamp", "lantern"])
+    index.touch(ids["lamp"])
+    index.remove(ids["lamp"])
+    # unknown ids are ignored
+    index.remove(uuid4())
+
+    assert len(index) == 1
+    assert names(index.suggest("la", 10)) == ["lantern"]
+    assert ids["lamp"].int not in index.popularity
+
+def test_load_keeps_popularity_of_remaining():
+    index, ids = make_index(["lamp", "lantern", "ladder"])
+    index.touch(ids["lantern"])
+    index.touch(ids["ladder"])
+
+    index.load([(ids["lamp"], "lamp"), (ids["lantern"], "lantern")])
+
+    assert len(index) == 2
+    assert names(index.suggest("la", 10)) == ["lantern", "lamp"]
+    assert set(index.popularity) == {ids["lantern"].int}
@@ -0,0 +1,76 @@
+import asyncio
+
+import pytest
+
+from utils import rate_limit
+from utils.rate_limit import LocalRateLimitBackend, RateLimiter
+
+@pytest.fixture
+def clock(fake_clock, monkeypatch):
+    monkeypatch.setattr(rate_limit, "time", fake_clock)
+    return fake_clock
+
+def check(limiter: RateLimiter, key, times: int = 1, cost: float = 1) -> list[float]:
+    async def main():
+        return [await limiter.check(key, cost) for _ in range(times)]
+    return asyncio.run(main())
+
+def test_burst_then_limited(clock):
+    limiter = RateLimiter(LocalRateLimitBackend(), "login", rate=0.5, burst=3)
+
+    assert check(limiter, "1.2.3.4", 3) == [0, 0, 0]
+    # a token comes every 2 seconds
+    assert check(limiter, "1.2.3.4") == [pytest.approx(2)]
+    # other keys have their own buckets
+    assert check(limiter, "5.6.7.8") == [0]
+    assert limiter.stats() == {"allowed": 4, "limited": 1}
+
+def test_refill(clock):
+    limiter = RateLimiter(LocalRateLimitBackend(), "login", rate=0.5, burst=3)
+    check(limiter, "key", 3)
+
+    clock.now += 1
+    assert check(limiter, "key") == [pytest.approx(1)]
+    clock.now += 1
+    assert check(limiter, "key") == [0]
+
+    # refills up to burst only
+    clock.now += 3600
+    assert check(limiter, "key", 4)[:3] == [0, 0, 0]
+
+def test_cost(clock):
+    limiter = RateLimiter(LocalRateLimitBackend(), "publish", rate=10, burst=100)
+
+    assert check(limiter, "user", cost=60) == [0]
+    assert check(limiter, "user", cost=60) == [pytest.approx(2)]
+    assert check(limiter, "user", cost=40) == [0]
+
+def test_limiters_share_backend_by_name(clock):
+    backend = LocalRateLimitBackend()
+    login = RateLimiter(backend, "login", rate=1, burst=1)
+    register = RateLimiter(backend, "register", rate=1, burst=1)
+
+    assert check(login, "key") == [0]
+    assert check(register, "key") == [0]
+    assert check(login, "key") != [0]
+
+def test_least_recently_used_buckets_dropped(clock):
+    backend = LocalRateLimitBackend(max_keys=2)
+    limiter = RateLimiter(backend, "login", rate=0.1, burst=1)
+
+    check(limiter, "a")
+    check(limiter, "b")
+    check(limiter, "a")
+    check(limiter, "c")
+
+    assert list(backend.buckets) == [("login", "a"), ("login", "c")]
+    # a dropped bucket comes back full
+    assert check(limiter, "b") == [0]
+
+def test_backend_stats(clock):
+    backend = LocalRateLimitBackend()
+    limiter = RateLimiter(backend, "login", rate=1, burst=2)
+    check(limiter, "a", 2)
+    check(limiter, "b")
+
+    assert backend.stats() == {"buckets": 2, "empty_buckets": 1}
@@ -0,0 +1,47 @@
+from types import SimpleNamespace
+from uuid import uuid4
+
+import pytest
+
+from pydantic_extra_types.coordinate import Coordinate
+
+from model import Good, GoodSummary
+
+from repositories.goods import good_from_row, summary_from_row
+
+def make_row(latitude: float | None = 55.75, longitude: float | None = 37.61) -> SimpleNamespace:
+    return SimpleNamespace(_mapping={
+        "id": uuid4(), "name": "lamp", "description": None, "price": 10.5, "images": ["a.png", "b.png"],
+        "image": "a.png", "latitude": latitude, "longitude": longitude, "owner_id": uuid4(),
+    })
+
+def validated_good(row) -> Good:
+    row = row._mapping
+    location = None if row["latitude"] is None else Coordinate(latitude=row["latitude"], longitude=row["longitude"])
+    return Good(id=row["id"], name=row["name"], description=row["description"], price=row["price"],
+                images=row["images"], location=location, owner_id=row["owner_id"])
+
+def validated_summary(row) -> GoodSummary:
+    row = row._mapping
+    location = None if row["latitude"] is None else Coordinate(latitude=row["latitude"], longitude=row["longitude"])
+    return GoodSummary(id=row["id"], name=row["name"], price=row["price"], image=row["image"], location=location)
+
+@pytest.mark.parametrize("row", [make_row(), make_row(None, None)])
+@pytest.mark.parametrize("mapper, validated", [(good_from_row, validated_good), (summary_from_row, validated_summary)])
+def test_mapped_models_equal_validated(row, mapper, validated):
+    mapped, expected = mapper(row), validated(row)
+
+    assert mapped == expected
+    assert mapped.model_dump_json() == expected.model_dump_json()
+    assert mapped.model_fields_set == expected.model_fields_set
+    assert repr(mapped) == repr(expected)
+
+def test_mapped_good_behaves_like_model():
+    good = good_from_row(make_row())
+
+    copy = good.model_copy(update={"name": "chair"})
+    assert (copy.name, good.name) == ("chair", "lamp")
+    assert copy.location == Coordinate(latitude=55.75, longitude=37.61)
+
+    good.price = 20
+    assert good.model_dump()["price"] == 20
@@ -0,0 +1,107 @@
+import asyncio
+from uuid import uuid4
+
+import pytest
+
+from pydantic_extra_types.coordinate import Coordinate
+
+from model import Good, GoodsList, GoodSummary, GoodSummaryList, LookFilter, Area, GoodsOrder, PriceBucket
+
+from usecases.goods import GoodRepo, GoodUsecase
+from usecases.search_cache import SearchCache
+
+from utils.cache import TTLCache
+from utils.geo_index import distance
+
+# about 111 km per degree of latitude
+CENTER = (55.7512, 37.6184)
+
+def north_of_center(meters: float) -> Coordinate:
+    return Coordinate(latitude=CENTER[0] + meters / 111195, longitude=CENTER[1])
+
+class FakeGoodRepo(GoodRepo):
+    """
+    Answers lookups exactly like the database would, remembers the filters it was asked with
+    """
+    def __init__(self, goods: list[Good]):
+        self.goods = goods
+        self.filters: list[LookFilter] = []
+
+    def _inside(self, look_filter: LookFilter) -> list[Good]:
+        self.filters.append(look_filter)
+        area = look_filter.location
+        return [good for good in self.goods if distance(area.place.latitude, area.place.longitude,
+                                                        good.location.latitude, good.location.longitude) <= area.radius]
+
+    async def look_good(self, conn, look_filter: LookFilter) -> GoodsList:
+        return GoodsList(array=self._inside(look_filter))
+
+    async def look_summaries(self, conn, look_filter: LookFilter) -> GoodSummaryList:
+        return GoodSummaryList(array=[GoodSummary(id=good.id, name=good.name, price=good.price, location=good.location)
+                                      for good in self._inside(look_filter)])
+
+    async def price_facets(self, conn, look_filter: LookFilter, bounds: list[float]) -> list[PriceBucket]:
+        return [PriceBucket(count=len(self._inside(look_filter)))]
+
+def make_good(meters: float) -> Good:
+    return Good(id=uuid4(), name=f"good {meters} m", price=10, images=[], location=north_of_center(meters), owner_id=uuid4())
+
+@pytest.fixture
+def goods() -> dict[str, Good]:
+    return {"near": make_good(500), "edge": make_good(1005)}
+
+def make_usecase(goods: dict[str, Good]) -> tuple[GoodUsecase, FakeGoodRepo]:
+    repo = FakeGoodRepo(list(goods.values()))
+    return GoodUsecase(repo, SearchCache(TTLCache(100, 60), grid=0.01, radius_step=500)), repo
+
+def area_filter(radius: float, order: GoodsOrder | None = None, place: Coordinate | None = None) -> LookFilter:
+    place = place or Coordinate(latitude=CENTER[0], longitude=CENTER[1])
+    return LookFilter(name="", location=Area(place=place, radius=radius), order=order)
+
+def names(page) -> set[str]:
+    return {item.name for item in page.array}
+
+def test_lookup_runs_with_requested_area(goods):
+    usecase, repo = make_usecase(goods)
+    look_filter = area_filter(1001, GoodsOrder.newest)
+
+    page = asyncio.run(usecase.look_good(None, look_filter))
+
+    # the good 1005 m away is inside of the snapped area, but not of the requested one
+    assert names(page) == {goods["near"].name}
+    assert repo.filters == [look_filter]
+
+def test_neighbouring_search_gets_page_clipped_to_its_area(goods):
+    usecase, repo = make_usecase(goods)
+
+    async def main():
+        wide = await usecase.look_good(None, area_filter(1400, GoodsOrder.newest))
+        narrow = await usecase.look_good(None, area_filter(1001, GoodsOrder.newest))
+        summaries = await usecase.look_summaries(None, area_filter(1400, GoodsOrder.newest))
+        narrow_summaries = await usecase.look_summaries(None, area_filter(1001, GoodsOrder.newest))
+        return wide, narrow, summaries, narrow_summaries
+
+    wide, narrow, summaries, narrow_summaries = asyncio.run(main())
+    assert names(wide) == names(summaries) == {goods["near"].name, goods["edge"].name}
+    assert names(narrow) == names(narrow_summaries) == {goods["near"].name}
+    # both searches share an entry
+    assert len(repo.filters) == 2
+
+def test_facets_run_with_requested_area(goods):
+    usecase, repo = make_usecase(goods)
+    look_filter = area_filter(1000)
+
+    assert asyncio.run(usecase.price_facets(None, look_filter, [100])) == [PriceBucket(count=1)]
+    assert repo.filters == [look_filter]
+
+def test_distance_ordered_searches_are_not_shared(goods):
+    usecase, repo = make_usecase(goods)
+
+    async def main():
+        await usecase.look_good(None, area_filter(1000))
+        # same cell of the grid, but distances and cursors are measured from the exact place
+        await usecase.look_good(None, area_filter(1000, place=north_of_center(10)))
+        await usecase.look_good(None, area_filter(1000))
+
+    asyncio.run(main())
+    assert len(repo.filters) == 2
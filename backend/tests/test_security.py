@@ -0,0 +1,119 @@
+import asyncio
+from contextlib import asynccontextmanager
+from uuid import uuid4
+
+import pytest
+
+from fastapi import HTTPException
+
+from config import SecuritySettings
+
+from api import database, security
+
+from model import User, ActiveTime
+
+class FakeUserUsecase:
+    def __init__(self, user: User):
+        self.user = user
+        self.lookups = 0
+
+    def add_user_changed_listener(self, listener):
+        pass
+
+    def add_tokens_revoked_listener(self, listener):
+        pass
+
+    async def get_by_username(self, conn, username: str) -> User:
+        assert conn == "conn" and username == self.user.name
+        self.lookups += 1
+        return self.user
+
+    async def get_user(self, conn, user_id) -> User:
+        assert conn == "conn" and user_id == self.user.id
+        self.lookups += 1
+        return self.user
+
+@pytest.fixture
+def connections(monkeypatch) -> list[str]:
+    # connections taken from the pool
+    taken = []
+
+    @asynccontextmanager
+    async def transaction():
+        taken.append("conn")
+        yield "conn"
+
+    monkeypatch.setattr(database, "transaction", transaction)
+    return taken
+
+def make_user(active: bool) -> User:
+    return User(id=uuid4(), name="alice", hashed_pasword="-", active_time=ActiveTime(from_hour=0, to_hour=0),
+                telegram="alice", active=active)
+
+def setup(user: User, stateless: bool) -> FakeUserUsecase:
+    usecase = FakeUserUsecase(user)
+    security.init(usecase, SecuritySettings(secretkey="test-secret-key-of-at-least-32-bytes", algorithm="HS256", stateless_tokens=stateless))
+    return usecase
+
+def authorize(user: User):
+    return asyncio.run(security.get_current_user(security.create_access_token(security.user_claims(user))))
+
+def test_stateless_token_takes_no_connection(connections):
+    user = make_user(active=True)
+    usecase = setup(user, stateless=True)
+
+    principal = authorize(user)
+
+    assert (principal.id, principal.name, principal.active) == (user.id, user.name, True)
+    assert connections == [] and usecase.lookups == 0
+
+def test_inactive_stateless_token_is_looked_up(connections):
+    user = make_user(active=False)
+    usecase = setup(user, stateless=True)
+    # activated after the token was issued
+    token = security.create_access_token(security.user_claims(user))
+    user.active = True
+
+    assert asyncio.run(security.get_current_user(token)).active
+    assert usecase.lookups == 1
+
+def test_connection_taken_only_on_cache_miss(connections):
+    user = make_user(active=True)
+    usecase = setup(user, stateless=False)
+
+    for _ in range(3):
+        assert authorize(user).id == user.id
+    assert connections == ["conn"] and usecase.lookups == 1
+
+def test_inactive_user_is_forbidden(connections):
+    user = make_user(active=False)
+    setup(user, stateless=False)
+    principal = authorize(user)
+
+    with pytest.raises(HTTPException) as e:
+        asyncio.run(security.get_active_user(principal))
+    assert e.value.status_code == 403
+
+    principal.active = True
+    assert asyncio.run(security.get_active_user(principal)) is principal
+
+def test_changed_user_is_dropped_from_cache(connections):
+    user = make_user(active=True)
+    usecase = setup(user, stateless=False)
+    authorize(user)
+
+    user.name = "bob"
+    security.invalidate_user(user.id)
+
+    # tokens issued before renaming still work and see the new name
+    assert authorize(user.model_copy(update={"name": "alice"})).name == "bob"
+    assert usecase.lookups == 2
+
+def test_tokens_without_id_are_not_cached(connections):
+    user = make_user(active=True)
+    usecase = setup(user, stateless=False)
+    token = security.create_access_token({"sub": user.name})
+
+    for _ in range(2):
+        assert asyncio.run(security.get_current_user(token)).id == user.id
+    assert usecase.lookups == 2
@@ -1,60 +1,204 @@
+import asyncio
+from collections.abc import AsyncIterator
 from uuid import UUID
 
-from model import Good, GoodsList, GoodNotBelongsError, LookFilter
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+from model import Good, GoodsList, GoodSummary, GoodSummaryList, GoodNotBelongsError, LookFilter, PublishResult, PriceBucket, \
+    Suggestion
+
+from usecases.search_cache import SearchCache
+
+from utils.prefix_index import PrefixIndex
 
 import logging
 logger = logging.getLogger(__name__)
 
 class GoodRepo:
-    def add_good(self, good: Good) -> Good:
+    async def add_good(self, conn: AsyncConnection, good: Good) -> Good:
+        raise NotImplementedError
+
+    async def add_goods(self, conn: AsyncConnection, goods: list[Good]) -> list[Good | None]:
         raise NotImplementedError
     
-    def update_good(self, good_id: UUID, good: Good) -> Good:
+    async def update_good(self, conn: AsyncConnection, good_id: UUID, good: Good) -> Good:
         raise NotImplementedError
     
-    def get_good(self, good_id: UUID) -> Good:
+    async def get_good(self, conn: AsyncConnection, good_id: UUID) -> Good:
+        raise NotImplementedError
+
+    async def get_goods(self, conn: AsyncConnection, good_ids: list[UUID]) -> list[Good]:
+        raise NotImplementedError
+
+    async def get_summaries(self, conn: AsyncConnection, good_ids: list[UUID]) -> list[GoodSummary]:
         raise NotImplementedError
     
-    def delete_good(self, good_id: UUID):
+    async def delete_good(self, conn: AsyncConnection, good_id: UUID):
         raise NotImplementedError
     
-    def look_good(self, look_filter: LookFilter) -> GoodsList:
+    async def look_good(self, conn: AsyncConnection, look_filter: LookFilter) -> GoodsList:
+        raise NotImplementedError
+
+    async def look_summaries(self, conn: AsyncConnection, look_filter: LookFilter) -> GoodSummaryList:
+        raise NotImplementedError
+
+    async def price_facets(self, conn: AsyncConnection, look_filter: LookFilter, bounds: list[float]) -> list[PriceBucket]:
+        raise NotImplementedError
+
+    def stream_goods(self, conn: AsyncConnection, look_filter: LookFilter) -> AsyncIterator[Good]:
+        raise NotImplementedError
+
+    def stream_locations(self, conn: AsyncConnection) -> AsyncIterator[tuple[UUID, float, float]]:
+        raise NotImplementedError
+
+    def stream_names(self, conn: AsyncConnection) -> AsyncIterator[tuple[UUID, str]]:
         raise NotImplementedError
 
 class GoodUsecase:
-    def __init__(self, good: GoodRepo):
+    def __init__(self, good: GoodRepo, search_cache: SearchCache | None = None, prefix_index: PrefixIndex | None = None):
         self.good = good
+        self.search_cache = search_cache
+        self.prefix_index = prefix_index
+        # changes made by this worker while names are streaming, the snapshot may have been taken before them
+        self.pending_suggestions: list[tuple[list[Good], list[UUID]]] | None = None
+
+    async def load_suggestions(self, conn: AsyncConnection):
+        if not self.prefix_index:
+            return
+        self.pending_suggestions = []
+        try:
+            items = [item async for item in self.good.stream_names(conn)]
+            self.prefix_index.load(items)
+            for added, removed in self.pending_suggestions:
+                self._index_suggestions(added, removed)
+        finally:
+            self.pending_suggestions = None
+
+    async def load_suggestions_forever(self, interval: float, transaction):
+        # other workers write to the table too, their goods show up in suggestions only after a reload
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                async with transaction() as conn:
+                    await self.load_suggestions(conn)
+            except Exception as e:
+                logger.warning("failed to reload suggestions: %s", e)
+
+    def _index_suggestions(self, added: list[Good], removed: list[UUID]):
+        for good_id in removed:
+            self.prefix_index.remove(good_id)
+        for good in added:
+            self.prefix_index.insert(good.id, good.name)
+
+    def _goods_changed(self, added: list[Good] = (), removed: list[UUID] = ()):
+        if self.search_cache:
+            self.search_cache.invalidate()
+        if self.prefix_index:
+            self._index_suggestions(added, removed)
+            if self.pending_suggestions is not None:
+                self.pending_suggestions.append((list(added), list(removed)))
 
-    def publish_good(self, user_id: UUID, good: Good) -> Good:
+    async def publish_good(self, conn: AsyncConnection, user_id: UUID, good: Good) -> Good:
         good = good.model_copy(update={"id": None, "owner_id": user_id})
 
-        good = self.good.add_good(good)
+        good = await self.good.add_good(conn, good)
+        self._goods_changed(added=[good])
         logger.info("published new good %s from user %s", good, user_id)
         return good
     
-    def get_good(self, good_id: UUID) -> Good:
-        return self.good.get_good(good_id)
+    async def publish_goods(self, conn: AsyncConnection, user_id: UUID, goods: list[Good]) -> list[PublishResult]:
+        goods = [good.model_copy(update={"id": None, "owner_id": user_id}) for good in goods]
+
+        new_goods = await self.good.add_goods(conn, goods)
+        self._goods_changed(added=[good for good in new_goods if good is not None])
+        results = []
+        for good, new_good in zip(goods, new_goods):
+            if new_good is None:
+                results.append(PublishResult(name=good.name, error=f"Name {good.name} is already in use"))
+            else:
+                results.append(PublishResult(name=good.name, good=new_good))
+        logger.info("published %s new goods out of %s from user %s", 
+                    sum(result.good is not None for result in results), len(goods), user_id)
+        return results
+
+    async def get_good(self, conn: AsyncConnection, good_id: UUID) -> Good:
+        good = await self.good.get_good(conn, good_id)
+        # views are what suggestions are ranked by
+        if self.prefix_index:
+            self.prefix_index.touch(good_id)
+        return good
     
-    def update_good(self, user_id: UUID, good_id: UUID, good: Good) -> Good:
+    async def update_good(self, conn: AsyncConnection, user_id: UUID, good_id: UUID, good: Good) -> Good:
         good = good.model_copy(update={"id": good_id})
-        old_good = self.good.get_good(good_id)
+        old_good = await self.good.get_good(conn, good_id)
 
         if old_good.owner_id != user_id:
             raise GoodNotBelongsError(good_id, user_id)
         
         good.owner_id = user_id
-        good = self.good.update_good(good_id, good)
+        good = await self.good.update_good(conn, good_id, good)
+        self._goods_changed(added=[good])
         logger.info("update info of good %s owned by user %s", good, user_id)
         return good
     
-    def delete_good(self, user_id: UUID, good_id: UUID):
-        good = self.good.get_good(good_id)
+    async def delete_good(self, conn: AsyncConnection, user_id: UUID, good_id: UUID):
+        good = await self.good.get_good(conn, good_id)
 
         if good.owner_id != user_id:
             raise GoodNotBelongsError(good_id, user_id)
 
-        self.good.delete_good(good_id)
+        await self.good.delete_good(conn, good_id)
+        self._goods_changed(removed=[good_id])
         logger.info("remove good with id %s owned by user %s", good_id, user_id)
 
-    def look_good(self, filter: LookFilter) -> GoodsList:
-        return self.good.look_good(filter)
+    async def look_good(self, conn: AsyncConnection, filter: LookFilter) -> GoodsList:
+        if not self.search_cache:
+            return await self.good.look_good(conn, filter)
+
+        key = self.search_cache.normalize(filter)
+        goods_list = self.search_cache.get("look", key)
+        if goods_list is not None:
+            return self.search_cache.clip(filter, goods_list)
+
+        generation = self.search_cache.generation
+        goods_list = await self.good.look_good(conn, filter)
+        self.search_cache.put("look", key, goods_list, generation=generation)
+        return goods_list
+
+    async def look_summaries(self, conn: AsyncConnection, filter: LookFilter) -> GoodSummaryList:
+        if not self.search_cache:
+            return await self.good.look_summaries(conn, filter)
+
+        key = self.search_cache.normalize(filter)
+        summary_list = self.search_cache.get("summaries", key)
+        if summary_list is not None:
+            return self.search_cache.clip(filter, summary_list)
+
+        generation = self.search_cache.generation
+        summary_list = await self.good.look_summaries(conn, filter)
+        self.search_cache.put("summaries", key, summary_list, generation=generation)
+        return summary_list
+
+    async def price_facets(self, conn: AsyncConnection, filter: LookFilter, bounds: list[float]) -> list[PriceBucket]:
+        bounds = tuple(sorted(set(bounds)))
+        if not self.search_cache:
+            return await self.good.price_facets(conn, filter, list(bounds))
+
+        key = self.search_cache.normalize(filter)
+        facets = self.search_cache.get("facets", key, bounds)
+        if facets is None:
+            generation = self.search_cache.generation
+            facets = await self.good.price_facets(conn, filter, list(bounds))
+            self.search_cache.put("facets", key, facets, bounds, generation=generation)
+        return facets
+
+    async def suggest(self, conn: AsyncConnection, prefix: str, limit: int) -> list[Suggestion]:
+        if self.prefix_index:
+            return [Suggestion(id=good_id, name=name) for good_id, name in self.prefix_index.suggest(prefix, limit)]
+
+        # without the index falls back to the name search
+        summary_list = await self.look_summaries(conn, LookFilter(name=prefix, limit=limit))
+        return [Suggestion(id=summary.id, name=summary.name) for summary in summary_list.array]
+
+    def export_goods(self, conn: AsyncConnection, filter: LookFilter) -> AsyncIterator[Good]:
+        return self.good.stream_goods(conn, filter)
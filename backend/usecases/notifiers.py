@@ -1,5 +1,7 @@
 from pydantic import NameEmail
 
+from sqlalchemy.ext.asyncio import AsyncConnection
+
 import time
 
 from usecases.users import TelegramNotifier, MailNotifier, UserRepo
@@ -8,41 +10,42 @@ from utils.late_executor import LateExecutor
 
 from model import Message, ActiveTime
 
-from config import config
-
-
 import logging
 logger = logging.getLogger(__name__)
 
 CONFIRM_PREFIX = "/confirm/"
 
-def get_url(late_executor: LateExecutor, task_id, args) -> str:
-    id = late_executor.put_task(task_id, args)
-    return f"{config.domain}{CONFIRM_PREFIX}{id}"
+async def get_url(conn: AsyncConnection, late_executor: LateExecutor, domain: str, task_id, args) -> str:
+    id = await late_executor.put_task(conn, task_id, args)
+    return f"{domain}{CONFIRM_PREFIX}{id}"
 
 class TWriter:
-    def message(text: str, telegram: str):
+    def message(self, text: str, telegram: str):
         raise NotImplementedError
     
-    def message_later(text: str, telegram: str, eta):
+    def message_later(self, text: str, telegram: str, eta):
         raise NotImplementedError
 
 class TNotifierUsecase(TelegramNotifier):
-    def __init__(self, twriter: TWriter, good_repo: GoodRepo, user_repo: UserRepo, late_executor: LateExecutor):
+    def __init__(self, twriter: TWriter, good_repo: GoodRepo, user_repo: UserRepo, late_executor: LateExecutor, domain: str):
         self.twriter = twriter
         self.good_repo = good_repo
         self.user_repo = user_repo
         self.late_executor = late_executor
+        self.domain = domain
 
-    def confirm_address(self, telegram: str, task_id, args):
-        url = get_url(self.late_executor, task_id, args)
+    async def confirm_address(self, conn: AsyncConnection, telegram: str, task_id, args):
+        url = await get_url(conn, self.late_executor, self.domain, task_id, args)
         self.twriter.message(f"Please, follow the link to confirm your telegram address: {url}", telegram)
 
-    def ask(self, telegram: str, message: str, task_id, args):
-        url = get_url(self.late_executor, task_id, args)
+    async def ask(self, conn: AsyncConnection, telegram: str, message: str, task_id, args):
+        url = await get_url(conn, self.late_executor, self.domain, task_id, args)
         self.twriter.message(f"Please, follow the link to \"{message}\": {url}", telegram)
 
-    def notify(self, telegram: str, message: Message, time_window: ActiveTime | None = None):
+    def message(self, telegram: str, text: str):
+        self.twriter.message(text, telegram)
+
+    async def notify(self, conn: AsyncConnection, telegram: str, message: Message, time_window: ActiveTime | None = None):
         # hours are stored in gmt format in database, so it's frontend's responsibility to convert them to user time
         hour = time.gmtime(time.time()).tm_hour
         to_time = time_window.from_hour
@@ -52,8 +55,8 @@ class TNotifierUsecase(TelegramNotifier):
         if hour < time_window.from_hour:
             hour += 24
 
-        good = self.good_repo.get_good(message.good_id)
-        user = self.user_repo.get_user(message.sender)
+        good = await self.good_repo.get_good(conn, message.good_id)
+        user = await self.user_repo.get_user(conn, message.sender)
         message = f"New message on {good.name} topic received from {user.name}:\n" \
                   f"{message.message}\n" \
                   f"Contact him on: {message.contact_info}"
@@ -65,28 +68,42 @@ class TNotifierUsecase(TelegramNotifier):
             self.twriter.message_later(message, telegram, eta)
 
 class MWriter:
-    def message(text: str, email: NameEmail):
+    def message(self, text: str, email: NameEmail):
         raise NotImplementedError
     
-    def message_later(text: str, email: NameEmail, eta):
+    def message_later(self, text: str, email: NameEmail, eta):
         raise NotImplementedError
 
+class LoggingWriter(TWriter, MWriter):
+    """
+    Only logs messages instead of sending them, stands in for real senders in development
+    """
+    def message(self, text: str, address):
+        logger.info("message to %s: %s", address, text)
+
+    def message_later(self, text: str, address, eta):
+        logger.info("message to %s in %s seconds: %s", address, eta, text)
+
 class MNotifierUsecase(MailNotifier):
-    def __init__(self, mwriter: MWriter, good_repo: GoodRepo, user_repo: UserRepo, late_executor: LateExecutor):
+    def __init__(self, mwriter: MWriter, good_repo: GoodRepo, user_repo: UserRepo, late_executor: LateExecutor, domain: str):
         self.mwriter = mwriter
         self.good_repo = good_repo
         self.user_repo = user_repo
         self.late_executor = late_executor
+        self.domain = domain
 
-    def confirm_address(self, email: NameEmail, task_id, args):
-        url = get_url(self.late_executor, task_id, args)
+    async def confirm_address(self, conn: AsyncConnection, email: NameEmail, task_id, args):
+        url = await get_url(conn, self.late_executor, self.domain, task_id, args)
         self.mwriter.message(f"Please, follow the link to confirm your telegram address: {url}", email)
 
-    def ask(self, email: NameEmail, message: str, task_id, args):
-        url = get_url(self.late_executor, task_id, args)
+    async def ask(self, conn: AsyncConnection, email: NameEmail, message: str, task_id, args):
+        url = await get_url(conn, self.late_executor, self.domain, task_id, args)
         self.mwriter.message(f"Please, follow the link to \"{message}\": {url}", email)
 
-    def notify(self, email: NameEmail, message: Message, time_window: ActiveTime | None = None):
+    def message(self, email: NameEmail, text: str):
+        self.mwriter.message(text, email)
+
+    async def notify(self, conn: AsyncConnection, email: NameEmail, message: Message, time_window: ActiveTime | None = None):
         # hours are stored in gmt format in database, so it's frontend's responsibility to convert them to user time
         hour = time.gmtime(time.time()).tm_hour
         to_time = time_window.from_hour
@@ -96,8 +113,8 @@ class MNotifierUsecase(MailNotifier):
         if hour < time_window.from_hour:
             hour += 24
 
-        good = self.good_repo.get_good(message.good_id)
-        user = self.user_repo.get_user(message.sender)
+        good = await self.good_repo.get_good(conn, message.good_id)
+        user = await self.user_repo.get_user(conn, message.sender)
         message = f"New message on {good.name} topic received from {user.name}:\n" \
                   f"{message.message}\n" \
                   f"Contact him on: {message.contact_info}"
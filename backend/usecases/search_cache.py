@@ -0,0 +1,91 @@
+import math
+from collections.abc import Hashable
+
+from pydantic_extra_types.coordinate import Coordinate
+
+from model import LookFilter, Area, GoodsOrder, look_order
+
+from utils.cache import TTLCache
+from utils.geo_index import distance
+
+import logging
+logger = logging.getLogger(__name__)
+
+class SearchCache:
+    """
+    Caches lookup results by normalized filter
+
+    Coordinates are snapped to a grid and radius is rounded up in the key only, so close searches share an entry,
+    while lookups themselves run with the filter as it was asked. A page shared that way is clipped to the area
+    of every search it's served to, but it may miss goods near the edge found by a wider neighbouring search,
+    and facets count the neighbour's area, until the entry expires.
+    Any change of goods bumps the generation, entries of older generations are dropped on access,
+    so invalidation doesn't go through the cache.
+    """
+    def __init__(self, cache: TTLCache, grid: float, radius_step: float):
+        self.cache = cache
+        # degrees
+        self.grid = grid
+        # meters
+        self.radius_step = radius_step
+        self.generation = 0
+
+    def normalize(self, look_filter: LookFilter) -> LookFilter:
+        # for the key only, never to be looked up with
+        update = {"name": " ".join(look_filter.name.casefold().split())}
+
+        # pages ordered by distance and their cursors are measured from the exact place, so they aren't shared
+        if look_filter.location and look_order(look_filter) != GoodsOrder.distance:
+            place = look_filter.location.place
+            update["location"] = Area(
+                place=Coordinate(
+                    latitude=round(round(place.latitude / self.grid) * self.grid, 7),
+                    longitude=round(round(place.longitude / self.grid) * self.grid, 7)
+                ),
+                radius=math.ceil(look_filter.location.radius / self.radius_step) * self.radius_step
+            )
+        return look_filter.model_copy(update=update)
+
+    def clip(self, look_filter: LookFilter, page):
+        """
+        Drops goods outside of the requested area from a page (GoodsList or GoodSummaryList)
+        that may have been cached for a neighbouring search
+        """
+        area = look_filter.location
+        if area is None:
+            return page
+
+        place = area.place
+        array = [item for item in page.array if item.location is not None and distance(
+            place.latitude, place.longitude, item.location.latitude, item.location.longitude) <= area.radius]
+        if len(array) == len(page.array):
+            return page
+        return page.model_copy(update={"array": array})
+
+    def _key(self, kind: str, look_filter: LookFilter, *args: Hashable) -> tuple:
+        return (kind, look_filter.model_dump_json(), *args)
+
+    def get(self, kind: str, look_filter: LookFilter, *args: Hashable):
+        key = self._key(kind, look_filter, *args)
+        entry = self.cache.get(key)
+        if entry is None:
+            return None
+
+        generation, value = entry
+        if generation != self.generation:
+            self.cache.pop(key)
+            return None
+        return value
+
+    def put(self, kind: str, look_filter: LookFilter, value, *args: Hashable, generation: int | None = None):
+        # generation should be taken before the lookup, so results that raced with a change are born stale
+        if generation is None:
+            generation = self.generation
+        self.cache.put(self._key(kind, look_filter, *args), (generation, value))
+
+    def invalidate(self):
+        self.generation += 1
+        logger.debug("search cache generation bumped to %s", self.generation)
+
+    def stats(self) -> dict[str, int]:
+        return {**self.cache.stats(), "generation": self.generation}
@@ -1,12 +1,16 @@
+from datetime import datetime, timezone
 from uuid import UUID
+from collections.abc import Callable
 import secrets
 import string
 
 from pydantic import NameEmail, BaseModel
 
-from model import User, Good, Message, ActiveTime, NoConfirmationSourceError, ConfirmationInUseError, IncorrectOldPasswordError, safe_print_user
+from sqlalchemy.ext.asyncio import AsyncConnection
 
-from utils.security import get_password_hash, verify_password
+from model import User, Good, Message, ActiveTime, NoConfirmationSourceError, IncorrectOldPasswordError, safe_print_user
+
+from utils.security import hash_password, verify_password
 
 from utils.late_executor import LateExecutor
 
@@ -14,52 +18,72 @@ import logging
 logger = logging.getLogger(__name__)
 
 class UserRepo:
-    def add_nonactive(self, user: User) -> User:
+    # raises UsernameInUseError or ConfirmationInUseError instead of inserting a conflicting user
+    async def add_nonactive(self, conn: AsyncConnection, user: User) -> User:
         raise NotImplementedError
     
-    def activate(self, id: UUID) -> User:
+    async def activate(self, conn: AsyncConnection, id: UUID):
         raise NotImplementedError
     
-    def is_mail_used(self, email: NameEmail) -> bool:
+    async def get_user(self, conn: AsyncConnection, uuid: UUID) -> User:
         raise NotImplementedError
-    
-    def is_telegram_used(self, telegram: str) -> bool:
+
+    async def get_users(self, conn: AsyncConnection, uuids: list[UUID]) -> list[User]:
         raise NotImplementedError
     
-    def get_user(self, uuid: UUID) -> User:
+    async def get_by_username(self, conn: AsyncConnection, username: str) -> User:
         raise NotImplementedError
     
-    def get_by_username(self, username: str) -> User:
+    async def update_user_info(self, conn: AsyncConnection, uuid: UUID, name: str | None = None, active_time: ActiveTime | None = None) -> User:
         raise NotImplementedError
     
-    def update_user_info(self, uuid: UUID, name: str | None = None, active_time: str | None = None) -> User:
+    async def update_user(self, conn: AsyncConnection, user: User) -> User:
         raise NotImplementedError
-    
-    def update_user(self, user: User) -> User:
+
+    # only if the hash is still old_hash, returns whether it was updated
+    async def update_password_hash(self, conn: AsyncConnection, uuid: UUID, old_hash: str, new_hash: str) -> bool:
         raise NotImplementedError
     
+class RevocationRepo:
+    async def add_revocation(self, conn: AsyncConnection, user_id: UUID, revoked_at: datetime):
+        raise NotImplementedError
+
+    # (id, user_id, revoked_at) ordered by id
+    async def get_revocations(self, conn: AsyncConnection, since: datetime, after_id: int = 0, recent: datetime | None = None) -> list[tuple[int, UUID, datetime]]:
+        raise NotImplementedError
+
 class GoodRepo:
-    def get_good(self, uuid: UUID) -> Good:
+    async def get_good(self, conn: AsyncConnection, uuid: UUID) -> Good:
+        raise NotImplementedError
+
+    async def get_goods(self, conn: AsyncConnection, uuids: list[UUID]) -> list[Good]:
         raise NotImplementedError
 
 class MailNotifier:
-    def confirm_address(self, email: NameEmail, task_id, args):
+    async def confirm_address(self, conn: AsyncConnection, email: NameEmail, task_id, args):
         raise NotImplementedError
     
-    def ask(self, email: NameEmail, message: str, task_id, args):
+    async def ask(self, conn: AsyncConnection, email: NameEmail, message: str, task_id, args):
         raise NotImplementedError
     
-    def notify(self, email: NameEmail, message: Message, time_window: ActiveTime | None = None):
+    # plain text, unlike notify it isn't about any good
+    def message(self, email: NameEmail, text: str):
+        raise NotImplementedError
+    
+    async def notify(self, conn: AsyncConnection, email: NameEmail, message: Message, time_window: ActiveTime | None = None):
         raise NotImplementedError
 
 class TelegramNotifier:
-    def confirm_address(self, telegram: str, task_id, args):
+    async def confirm_address(self, conn: AsyncConnection, telegram: str, task_id, args):
         raise NotImplementedError
     
-    def ask(self, telegram: str, message: str, task_id, args):
+    async def ask(self, conn: AsyncConnection, telegram: str, message: str, task_id, args):
         raise NotImplementedError
     
-    def notify(self, telegram: str, message: Message, time_window: ActiveTime | None = None):
+    def message(self, telegram: str, text: str):
+        raise NotImplementedError
+    
+    async def notify(self, conn: AsyncConnection, telegram: str, message: Message, time_window: ActiveTime | None = None):
         raise NotImplementedError
 
 ACTIVATE_CALLBACK = "callback_activate"
@@ -73,130 +97,172 @@ class UpdateConfirmationArguments(BaseModel):
     telegram: str | None = None
 
 class UserUsecase:
-    def __init__(self, user: UserRepo, good: GoodRepo, mail: MailNotifier, telegram: TelegramNotifier, late_executor: LateExecutor):
+    def __init__(self, user: UserRepo, good: GoodRepo, mail: MailNotifier, telegram: TelegramNotifier, late_executor: LateExecutor,
+                 revocation: RevocationRepo | None = None):
         self.user = user
+        self.revocation = revocation
         self.good = good
         self.mail = mail
         self.telegram = telegram
         self.late_executor = late_executor
-
-        def callback_activate(user_id: UUID):
-            self.user.activate(user_id)
+        # called with id of every changed user, e.g. to drop it from caches
+        self.user_changed_listeners: list[Callable[[UUID], None]] = []
+        # called with id of the user and time its earlier tokens are revoked at
+        self.tokens_revoked_listeners: list[Callable[[UUID, datetime], None]] = []
+
+        async def callback_activate(conn: AsyncConnection, user_id: UUID):
+            await self.user.activate(conn, user_id)
+            self._user_changed(user_id)
             logger.info("activated user with id %s", user_id)
 
-        late_executor.register_task(ACTIVATE_CALLBACK, callback_activate)
+        late_executor.register_task(ACTIVATE_CALLBACK, callback_activate, UUID)
 
-        def callback_update(user: User):
-            self.user.update_user(user)
+        async def callback_update(conn: AsyncConnection, user: User):
+            await self.user.update_user(conn, user)
+            self._user_changed(user.id)
+            # password, confirmation source or activity might have changed, tokens issued before mustn't outlive that
+            await self._revoke_tokens(conn, user.id)
             logger.info("updated user %s", safe_print_user(user))
 
-        late_executor.register_task(UPDATE_CALLBACK, callback_update)
+        late_executor.register_task(UPDATE_CALLBACK, callback_update, User)
 
-        def callback_reset_password(user: User):
+        async def callback_reset_password(conn: AsyncConnection, user: User):
             alphabet = string.ascii_letters + string.digits
             password = ''.join(secrets.choice(alphabet) for i in range(20)) 
 
-            user.hashed_pasword = get_password_hash(password)
-            self.user.update_user(user)
+            user.hashed_pasword = await hash_password(password)
+            await self.user.update_user(conn, user)
+            self._user_changed(user.id)
+            await self._revoke_tokens(conn, user.id)
 
             if user.email:
-                self.mail.notify(user.email, f"Your new password is {password}")
+                self.mail.message(user.email, f"Your new password is {password}")
             elif user.telegram:
-                self.telegram.notify(user.telegram, f"Your new password is {password}")
+                self.telegram.message(user.telegram, f"Your new password is {password}")
             logger.info("reset password for user %s", user.id)
 
-        late_executor.register_task(RESET_PASSWORD_CALLBACK, callback_reset_password)
+        late_executor.register_task(RESET_PASSWORD_CALLBACK, callback_reset_password, User)
 
-        def callback_update_confirmation(args: UpdateConfirmationArguments):
+        async def callback_update_confirmation(conn: AsyncConnection, args: UpdateConfirmationArguments):
             if args.email:
                 args.user.email = args.email
 
-                self.mail.confirm_address(args.email, "Confirm your new confirmation source", UPDATE_CALLBACK, args.user)
+                await self.mail.ask(conn, args.email, "Confirm your new confirmation source", UPDATE_CALLBACK, args.user)
             elif args.telegram:
                 args.user.telegram = args.telegram
                 
-                self.telegram.confirm_address(args.telegram, "Confirm your new confirmation source", UPDATE_CALLBACK, args.user)
+                await self.telegram.ask(conn, args.telegram, "Confirm your new confirmation source", UPDATE_CALLBACK, args.user)
             logger.info("sent confirmation to the new source for user %s", args.user.id)
 
-        late_executor.register_task(UPDATE_CONFIRMATION_CALLBACK, callback_update_confirmation)
+        late_executor.register_task(UPDATE_CONFIRMATION_CALLBACK, callback_update_confirmation, UpdateConfirmationArguments)
 
-    def register_user(self, user: User, password: str) -> User:
-        user = user.model_copy(update={"id": None, "hashed_password": get_password_hash(password), "active": False})
-        
+    def add_user_changed_listener(self, listener: Callable[[UUID], None]):
+        self.user_changed_listeners.append(listener)
+
+    def _user_changed(self, user_id: UUID):
+        for listener in self.user_changed_listeners:
+            listener(user_id)
+
+    def add_tokens_revoked_listener(self, listener: Callable[[UUID, datetime], None]):
+        self.tokens_revoked_listeners.append(listener)
+
+    async def _revoke_tokens(self, conn: AsyncConnection, user_id: UUID):
+        revoked_at = datetime.now(timezone.utc)
+        if self.revocation:
+            await self.revocation.add_revocation(conn, user_id, revoked_at)
+        for listener in self.tokens_revoked_listeners:
+            listener(user_id, revoked_at)
+
+    async def get_revocations(self, conn: AsyncConnection, since: datetime, after_id: int = 0,
+                              recent: datetime | None = None) -> list[tuple[int, UUID, datetime]]:
+        if not self.revocation:
+            return []
+        return await self.revocation.get_revocations(conn, since, after_id, recent)
+
+    async def register_user(self, conn: AsyncConnection, user: User, password: str) -> User:
         if not user.email and not user.telegram:
             raise NoConfirmationSourceError()
+
+        user = user.model_copy(update={"id": None, "hashed_pasword": await hash_password(password), "active": False})
         
-        user = self.user.add_nonactive(user)
+        # name and confirmation sources are checked by the insert itself
+        user = await self.user.add_nonactive(conn, user)
 
         if user.email:
-            if self.user.is_mail_used(user.email):
-                raise ConfirmationInUseError("email", user.email)
-
-            self.mail.confirm_address(user.email, ACTIVATE_CALLBACK, user.id)
+            await self.mail.confirm_address(conn, user.email, ACTIVATE_CALLBACK, user.id)
         elif user.telegram:
-            if self.user.is_telegram_used(user.telegram):
-                raise ConfirmationInUseError("telegram", user.telegram)
-
-            self.telegram.confirm_address(user.telegram, ACTIVATE_CALLBACK, user.id)
+            await self.telegram.confirm_address(conn, user.telegram, ACTIVATE_CALLBACK, user.id)
 
         logger.info("created unactivated user %s", safe_print_user(user))
         
         return user
     
-    def get_user(self, id: UUID) -> User:
-        return self.user.get_user(id)
+    async def get_user(self, conn: AsyncConnection, id: UUID) -> User:
+        return await self.user.get_user(conn, id)
     
-    def get_by_username(self, username: str) -> User:
-        return self.user.get_by_username(username)
+    async def get_by_username(self, conn: AsyncConnection, username: str) -> User:
+        return await self.user.get_by_username(conn, username)
     
-    def update_user_info(self, id: UUID, name: str | None = None, active_time: str | None = None) -> User:
-        user = self.user.update_user_info(self, id, name, active_time)
+    async def update_user_info(self, conn: AsyncConnection, id: UUID, name: str | None = None, active_time: ActiveTime | None = None) -> User:
+        user = await self.user.update_user_info(conn, id, name, active_time)
+        self._user_changed(id)
         logger.info("updated user %s", safe_print_user(user))
         return user
 
-    def message_owner(self, message: Message):
+    async def update_password_hash(self, conn: AsyncConnection, user: User, hashed_password: str) -> User:
+        # same password hashed with the current parameters, so no confirmation is needed;
+        # only the hash is written, and only if nothing changed it since it was read
+        if not await self.user.update_password_hash(conn, user.id, user.hashed_pasword, hashed_password):
+            logger.info("password of user %s changed before rehash, keeping it", user.id)
+            return user
+        user = user.model_copy(update={"hashed_pasword": hashed_password})
+        self._user_changed(user.id)
+        logger.info("rehashed password of user %s", user.id)
+        return user
+
+    async def message_owner(self, conn: AsyncConnection, message: Message):
         message = message.model_copy(update={"recipient": None})
-        good = self.good.get_good(message.good_id)
+        good = await self.good.get_good(conn, message.good_id)
 
         message.recipient = good.owner_id
-        owner = self.user.get_user(good.owner_id)
+        owner = await self.user.get_user(conn, good.owner_id)
         
         if owner.email:
-            self.mail.notify(owner.email, message, time_window = owner.active_time)
+            await self.mail.notify(conn, owner.email, message, time_window = owner.active_time)
         if owner.telegram:
-            self.telegram.notify(owner.telegram, message, time_window = owner.active_time)
+            await self.telegram.notify(conn, owner.telegram, message, time_window = owner.active_time)
         logger.info("sent message %s", message)
 
-    def change_password(self, user_id: UUID, old_password: str, new_password: str):
-        user = self.user.get_user(user_id)
+    async def change_password(self, conn: AsyncConnection, user_id: UUID, old_password: str, new_password: str):
+        user = await self.user.get_user(conn, user_id)
 
-        if not verify_password(old_password, user.hashed_pasword):
+        if not await verify_password(old_password, user.hashed_pasword):
             raise IncorrectOldPasswordError(old_password)
         
-        user.hashed_pasword = get_password_hash(new_password)
+        user.hashed_pasword = await hash_password(new_password)
 
         if user.email:
-            self.mail.ask(user.email, "Confirm updating your pasword", UPDATE_CALLBACK, user)
+            await self.mail.ask(conn, user.email, "Confirm updating your pasword", UPDATE_CALLBACK, user)
         elif user.telegram:
-            self.telegram.ask(user.telegram, "Confirm updating your pasword", UPDATE_CALLBACK, user)
+            await self.telegram.ask(conn, user.telegram, "Confirm updating your pasword", UPDATE_CALLBACK, user)
         logger.info("sent confirmation for updating the password for user %s", user_id)
 
-    def reset_password(self, username: str):
-        user = self.user.get_by_username(username)
+    async def reset_password(self, conn: AsyncConnection, username: str):
+        user = await self.user.get_by_username(conn, username)
 
         if user.email:
-            self.mail.ask(user.email, "Confirm resetting your password", RESET_PASSWORD_CALLBACK, user)
+            await self.mail.ask(conn, user.email, "Confirm resetting your password", RESET_PASSWORD_CALLBACK, user)
         elif user.telegram:
-            self.mail.ask(user.email, "Confirm resetting your password", RESET_PASSWORD_CALLBACK, user)
+            await self.telegram.ask(conn, user.telegram, "Confirm resetting your password", RESET_PASSWORD_CALLBACK, user)
         logger.info("sent confirmation for resetting the password for user %s", user.id)
 
-    def update_confirmation(self, user_id: UUID, email: NameEmail | None = None, telegram: str | None = None):
-        user = self.user.get_user(user_id)
+    async def update_confirmation(self, conn: AsyncConnection, user_id: UUID, email: NameEmail | None = None, telegram: str | None = None):
+        user = await self.user.get_user(conn, user_id)
 
-        args = UpdateConfirmationArguments(user, email, telegram)
+        args = UpdateConfirmationArguments(user=user, email=email, telegram=telegram)
 
         if user.email:
-            self.mail.ask(user.email, "Confirm updating your confirmation source", UPDATE_CONFIRMATION_CALLBACK, args)
+            await self.mail.ask(conn, user.email, "Confirm updating your confirmation source", UPDATE_CONFIRMATION_CALLBACK, args)
         elif user.telegram:
-            self.telegram.ask(user.telegram, "Confirm updating your confirmation source", UPDATE_CONFIRMATION_CALLBACK, args)
+            await self.telegram.ask(conn, user.telegram, "Confirm updating your confirmation source", UPDATE_CONFIRMATION_CALLBACK, args)
         logger.info("sent confirmation to the old source for user %s", user_id)
@@ -0,0 +1,81 @@
+import asyncio
+import time
+from collections import OrderedDict
+from collections.abc import Awaitable, Callable
+from typing import Any, Hashable
+
+import logging
+logger = logging.getLogger(__name__)
+
+_MISSING = object()
+
+class TTLCache:
+    """
+    Bounded LRU cache, entries also expire after ttl seconds
+
+    Attributes:
+        hits, misses -- lookup counters since creation
+    """
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.entries: OrderedDict[Hashable, tuple[float, Any]] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        # loads in progress, so concurrent misses of the same key make one load;
+        # a load popped from here by pop or clear doesn't put its (maybe stale) result
+        self.loading: dict[Hashable, asyncio.Future] = dict()
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def get(self, key: Hashable, default=None):
+        entry = self.entries.get(key, _MISSING)
+        if entry is not _MISSING:
+            expires_at, value = entry
+            if expires_at > time.monotonic():
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return value
+            del self.entries[key]
+
+        self.misses += 1
+        return default
+
+    def put(self, key: Hashable, value, ttl: float | None = None):
+        if ttl is None:
+            ttl = self.ttl
+        self.entries[key] = (time.monotonic() + ttl, value)
+        self.entries.move_to_end(key)
+
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    def pop(self, key: Hashable):
+        self.entries.pop(key, None)
+        self.loading.pop(key, None)
+
+    def clear(self):
+        self.entries.clear()
+        self.loading.clear()
+
+    async def get_or_load(self, key: Hashable, load: Callable[[], Awaitable], ttl: float | None = None):
+        value = self.get(key, _MISSING)
+        if value is not _MISSING:
+            return value
+
+        future = self.loading.get(key)
+        if future is None:
+            future = self.loading[key] = asyncio.ensure_future(self._load(key, load, ttl))
+            future.add_done_callback(lambda done: self.loading.pop(key, None) if self.loading.get(key) is done else None)
+        # one cancelled caller shouldn't cancel the load for the others
+        return await asyncio.shield(future)
+
+    async def _load(self, key: Hashable, load: Callable[[], Awaitable], ttl: float | None):
+        value = await load()
+        if self.loading.get(key) is asyncio.current_task():
+            self.put(key, value, ttl)
+        return value
+
+    def stats(self) -> dict[str, int]:
+        return {"size": len(self.entries), "hits": self.hits, "misses": self.misses}
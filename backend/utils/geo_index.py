@@ -0,0 +1,142 @@
+import math
+from uuid import UUID
+
+import numpy as np
+
+import logging
+logger = logging.getLogger(__name__)
+
+# mean earth radius in meters, the same sphere postgis uses for geography <->
+EARTH_RADIUS = 6371008.8
+
+def distance(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """
+    Haversine distance in meters between two points, the same within() measures
+    """
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS * math.asin(math.sqrt(min(a, 1.0)))
+
+class _Cell:
+    __slots__ = ("ids", "lats", "lons", "arrays")
+
+    def __init__(self):
+        self.ids = []
+        self.lats = []
+        self.lons = []
+        # ids, latitudes and longitudes in radians as numpy arrays, dropped on every write of the cell
+        self.arrays: tuple[np.ndarray, np.ndarray, np.ndarray] | None = None
+
+    def points(self) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        # rebuilt on the first lookup after a write, so loads and bursts of writes don't pay for it on every point
+        if self.arrays is None:
+            self.arrays = (np.array(self.ids, dtype=object), np.radians(np.array(self.lats, dtype=np.float64)),
+                           np.radians(np.array(self.lons, dtype=np.float64)))
+        return self.arrays
+
+class GeoIndex:
+    """
+    In-memory grid of points for radius lookups
+
+    Points are bucketed into cells of cell_size degrees, a lookup collects the cells
+    covering the bounding box of the circle and refines candidates with vectorised haversine.
+    """
+    def __init__(self, cell_size: float = 0.05):
+        self.cell_size = cell_size
+        self.columns = math.ceil(360 / cell_size)
+        self.cells: dict[tuple[int, int], _Cell] = dict()
+        # id -> (cell key, position in cell)
+        self.positions: dict[UUID, tuple[tuple[int, int], int]] = dict()
+
+    def __len__(self) -> int:
+        return len(self.positions)
+
+    def _row(self, lat: float) -> int:
+        return math.floor((lat + 90) / self.cell_size)
+
+    def _column(self, lon: float) -> int:
+        return math.floor((lon + 180) / self.cell_size) % self.columns
+
+    def insert(self, id: UUID, lat: float, lon: float):
+        self.remove(id)
+
+        key = (self._row(lat), self._column(lon))
+        cell = self.cells.get(key)
+        if cell is None:
+            cell = self.cells[key] = _Cell()
+
+        self.positions[id] = (key, len(cell.ids))
+        cell.ids.append(id)
+        cell.lats.append(lat)
+        cell.lons.append(lon)
+        cell.arrays = None
+
+    def remove(self, id: UUID):
+        position = self.positions.pop(id, None)
+        if position is None:
+            return
+        key, i = position
+        cell = self.cells[key]
+
+        # the last point takes the place of removed one, so removal is O(1)
+        last = len(cell.ids) - 1
+        if i != last:
+            cell.ids[i] = cell.ids[last]
+            cell.lats[i] = cell.lats[last]
+            cell.lons[i] = cell.lons[last]
+            self.positions[cell.ids[i]] = (key, i)
+        cell.ids.pop()
+        cell.lats.pop()
+        cell.lons.pop()
+        cell.arrays = None
+
+        if not cell.ids:
+            del self.cells[key]
+
+    def _candidate_cells(self, lat: float, lon: float, radius: float) -> list[_Cell]:
+        dlat = math.degrees(radius / EARTH_RADIUS)
+        lat_from = max(lat - dlat, -90)
+        lat_to = min(lat + dlat, 90)
+
+        # near the poles circle covers all the longitudes
+        max_abs_lat = max(abs(lat_from), abs(lat_to))
+        dlon = 180
+        if max_abs_lat < 90:
+            dlon = math.degrees(radius / (EARTH_RADIUS * math.cos(math.radians(max_abs_lat))))
+
+        rows = range(self._row(lat_from), self._row(lat_to) + 1)
+        if dlon >= 180:
+            columns = range(self.columns)
+        else:
+            first = math.floor((lon - dlon + 180) / self.cell_size)
+            last = math.floor((lon + dlon + 180) / self.cell_size)
+            columns = {column % self.columns for column in range(first, last + 1)}
+
+        # for huge circles it's cheaper to go through the cells that exist
+        if len(rows) * len(columns) > len(self.cells):
+            return [cell for (row, column), cell in self.cells.items() if row in rows and column in columns]
+        return [self.cells[(row, column)] for row in rows for column in columns if (row, column) in self.cells]
+
+    def within(self, lat: float, lon: float, radius: float) -> list[tuple[float, UUID]]:
+        """
+        Returns (distance in meters, id) of the points inside the circle, nearest first
+        """
+        cells = self._candidate_cells(lat, lon, radius)
+        if not cells:
+            return []
+
+        points = [cell.points() for cell in cells]
+        if len(points) == 1:
+            ids, lats, lons = points[0]
+        else:
+            ids, lats, lons = (np.concatenate(arrays) for arrays in zip(*points))
+
+        lat0 = math.radians(lat)
+        lon0 = math.radians(lon)
+        a = np.sin((lats - lat0) / 2) ** 2 + math.cos(lat0) * np.cos(lats) * np.sin((lons - lon0) / 2) ** 2
+        distances = 2 * EARTH_RADIUS * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+        inside = np.flatnonzero(distances <= radius)
+        hits = sorted(zip(distances[inside].tolist(), ids[inside].tolist()))
+        logger.debug("geo index lookup found %s out of %s candidates", len(hits), len(ids))
+        return hits
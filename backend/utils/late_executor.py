@@ -1,17 +1,59 @@
 from typing import Any
-from uuid import UUID
+from uuid import UUID, uuid4
+
+from pydantic import TypeAdapter
+
+from utils import metrics
+from utils.cache import TTLCache
 
 import logging
 logger = logging.getLogger(__name__)
 
+tasks_put = metrics.counter("late_executor_tasks_put_total", "Tasks put off until confirmation", ("action",))
+# result is executed, failed, expired (no such task) or unknown_action
+tasks_executed = metrics.counter("late_executor_tasks_executed_total", "Confirmations of tasks by result", ("action", "result"))
+
 class TaskArgumentStorage:
-    def put(action_id, args) -> UUID:
+    # args come serialized to json, conn is the one of the request putting the task,
+    # so a task of a rolled back request is never confirmed
+    async def put(self, conn, action_id: str, args: str) -> UUID:
         raise NotImplementedError
     
-    # returns action_id and args of the said task
-    def get(task_id: UUID) -> tuple[Any, Any]:
+    # returns action_id and args of the said task, every task can be taken once
+    async def get(self, conn, task_id: UUID) -> tuple[str, str]:
         raise NotImplementedError
 
+class TaskNotExistsError(Exception):
+    """Exception raised when task with such id doesn't exist, was executed already or expired
+    
+    Attributes:
+        task_id -- given task id
+    """
+    def __init__(self, task_id):
+        self.task_id = task_id
+        super().__init__(f"Task with id {self.task_id} doesn't exist")
+
+class InMemoryTaskArgumentStorage(TaskArgumentStorage):
+    """
+    Keeps tasks in memory of this process, so links only work while it lives and with a single worker
+
+    Every task can be taken once, unused ones expire after ttl seconds
+    """
+    def __init__(self, max_size: int, ttl: float):
+        self.tasks = TTLCache(max_size, ttl)
+
+    async def put(self, conn, action_id: str, args: str) -> UUID:
+        task_id = uuid4()
+        self.tasks.put(task_id, (action_id, args))
+        return task_id
+
+    async def get(self, conn, task_id: UUID) -> tuple[str, str]:
+        task = self.tasks.get(task_id)
+        if task is None:
+            raise TaskNotExistsError(task_id)
+        self.tasks.pop(task_id)
+        return task
+
 class ActionNotExistsError(Exception):
     """Exception raised when action with such id doesn't exist
     
@@ -25,27 +67,45 @@ class ActionNotExistsError(Exception):
 class LateExecutor:
     """
     This class allows to store action that should be executed later
+
+    Actions are coroutine functions taking the connection of the confirming request and the task arguments,
+    arguments are stored as json, so every action is registered with their type to read them back
     """
     def __init__(self, arg_storage: TaskArgumentStorage):
-        self.tasks_action_dict = dict()
+        self.tasks_action_dict: dict[str, tuple[Any, TypeAdapter]] = dict()
         self.arg_storage = arg_storage
 
-    def register_task(self, action_id, action):
-        self.tasks_action_dict[action_id] = action
+    def register_task(self, action_id: str, action, args_type):
+        self.tasks_action_dict[action_id] = (action, TypeAdapter(args_type))
         logger.debug("registered action with id %s", action_id)
 
-    def put_task(self, action_id, args) -> UUID:
-        id = self.arg_storage.put(action_id, args)
+    async def put_task(self, conn, action_id: str, args) -> UUID:
+        if action_id not in self.tasks_action_dict:
+            raise ActionNotExistsError(action_id)
+        _, adapter = self.tasks_action_dict[action_id]
+        id = await self.arg_storage.put(conn, action_id, adapter.dump_json(args).decode())
+        tasks_put.inc(action_id)
         logger.debug("put new task with aciton_id = %s, id = %s and args = %s", action_id, id, args)
         return id
     
-    def execute_task(self, task_id):
-        action_id, args = self.arg_storage.get(task_id)
+    async def execute_task(self, conn, task_id):
+        try:
+            action_id, args = await self.arg_storage.get(conn, task_id)
+        except TaskNotExistsError:
+            tasks_executed.inc("", "expired")
+            raise
 
         if action_id not in self.tasks_action_dict:
             logger.error("action %s not found", action_id)
+            tasks_executed.inc(action_id, "unknown_action")
             raise ActionNotExistsError(action_id)
 
-        action_func = self.tasks_action_dict[action_id]
-        action_func(args)
+        action_func, adapter = self.tasks_action_dict[action_id]
+        args = adapter.validate_json(args)
+        try:
+            await action_func(conn, args)
+        except Exception:
+            tasks_executed.inc(action_id, "failed")
+            raise
+        tasks_executed.inc(action_id, "executed")
         logger.debug("executed task %s of action %s with args %s", task_id, action_id, args)
@@ -0,0 +1,115 @@
+import asyncio
+from collections.abc import Awaitable, Callable, Hashable
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any
+
+import logging
+logger = logging.getLogger(__name__)
+
+class DataLoader:
+    """
+    Collects keys requested during one event loop iteration and loads them with a single batch call,
+    results are memoized, so the same key is loaded once per loader
+
+    Attributes:
+        batch_fn -- loads values for a list of keys, may skip keys that don't exist
+        key_fn -- returns the key of a loaded value
+        missing_error -- builds an exception for a key that wasn't found
+    """
+    def __init__(self, batch_fn: Callable[[list], Awaitable[list]], key_fn: Callable[[Any], Hashable],
+                 missing_error: Callable[[Hashable], Exception]):
+        self.batch_fn = batch_fn
+        self.key_fn = key_fn
+        self.missing_error = missing_error
+        self.futures: dict[Hashable, asyncio.Future] = dict()
+        self.pending: list[Hashable] = []
+        self.tasks: set[asyncio.Task] = set()
+
+    async def load(self, key: Hashable):
+        future = self.futures.get(key)
+        if future is None:
+            loop = asyncio.get_running_loop()
+            future = self.futures[key] = loop.create_future()
+            if not self.pending:
+                # everyone who asks before the next iteration gets into the same batch
+                loop.call_soon(self._schedule)
+            self.pending.append(key)
+
+        # one cancelled caller shouldn't cancel the load for the others
+        return await asyncio.shield(future)
+
+    def clear(self, key: Hashable):
+        self.futures.pop(key, None)
+
+    def _schedule(self):
+        task = asyncio.ensure_future(self._dispatch())
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    async def _dispatch(self):
+        keys, self.pending = self.pending, []
+        logger.debug("loading batch of %s keys", len(keys))
+
+        try:
+            values = await self.batch_fn(keys)
+        except Exception as e:
+            for key in keys:
+                future = self.futures.pop(key, None)
+                if future is not None and not future.done():
+                    future.set_exception(e)
+            return
+
+        found = {self.key_fn(value): value for value in values}
+        for key in keys:
+            future = self.futures.get(key)
+            if future is None or future.done():
+                continue
+            if key in found:
+                future.set_result(found[key])
+            else:
+                # errors are not memoized
+                del self.futures[key]
+                future.set_exception(self.missing_error(key))
+
+# (name, owner) -> loader
+_loaders: ContextVar[dict[tuple[str, Hashable], DataLoader] | None] = ContextVar("loaders", default=None)
+
+@contextmanager
+def loader_scope():
+    """
+    Loaders created inside of the scope are shared by everything running in it (usually one request)
+    """
+    token = _loaders.set(dict())
+    try:
+        yield
+    finally:
+        _loaders.reset(token)
+
+def scoped_loader(name: str, owner: Hashable, batch_fn: Callable[[list], Awaitable[list]], key_fn: Callable[[Any], Hashable],
+                  missing_error: Callable[[Hashable], Exception]) -> DataLoader | None:
+    """
+    Returns loader with such name and owner from the current scope, creating it if needed, or None outside of any scope
+
+    Owner is what batch_fn is bound to (usually a connection), one request may read through several of them
+    and every one gets its own loader, so a load never runs on a connection other than the one it was asked with
+    """
+    loaders = _loaders.get()
+    if loaders is None:
+        return None
+
+    loader = loaders.get((name, owner))
+    if loader is None:
+        loader = loaders[(name, owner)] = DataLoader(batch_fn, key_fn, missing_error)
+    return loader
+
+def clear_scoped(name: str, key: Hashable):
+    """
+    Forgets the key in loaders with such name of every owner in the current scope, e.g. after it was written
+    """
+    loaders = _loaders.get()
+    if loaders is None:
+        return
+    for (loader_name, _), loader in loaders.items():
+        if loader_name == name:
+            loader.clear(key)
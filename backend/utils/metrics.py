@@ -0,0 +1,163 @@
+import math
+from bisect import bisect_left
+from collections.abc import Callable, Iterable
+
+import logging
+logger = logging.getLogger(__name__)
+
+# seconds, from a point lookup to a slow request
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if value == int(value):
+        return str(int(value))
+    return repr(float(value))
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(names: Iterable[str], values: Iterable) -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+class Metric:
+    """
+    Values of one metric by label values, kept in memory of this process
+
+    Updates are plain dict operations without locks, they are made from the event loop only
+    (hashing pool threads are read through callbacks instead)
+
+    Attributes:
+        name -- metric name as prometheus shows it
+        labels -- names of labels, values are given positionally in the same order
+    """
+    type = "untyped"
+
+    def __init__(self, name: str, description: str, labels: tuple[str, ...] = ()):
+        self.name = name
+        self.description = description
+        self.labels = labels
+        self.values: dict[tuple, float] = dict()
+
+    def samples(self) -> Iterable[tuple[str, tuple[str, ...], tuple, float]]:
+        for label_values, value in self.values.items():
+            yield self.name, self.labels, label_values, value
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} {self.type}"]
+        for name, label_names, label_values, value in self.samples():
+            lines.append(f"{name}{_format_labels(label_names, label_values)} {_format_value(value)}")
+        return "\n".join(lines)
+
+class Counter(Metric):
+    type = "counter"
+
+    def inc(self, *label_values, amount: float = 1):
+        self.values[label_values] = self.values.get(label_values, 0) + amount
+
+class Gauge(Metric):
+    type = "gauge"
+
+    def inc(self, *label_values, amount: float = 1):
+        self.values[label_values] = self.values.get(label_values, 0) + amount
+
+    def dec(self, *label_values, amount: float = 1):
+        self.values[label_values] = self.values.get(label_values, 0) - amount
+
+    def set(self, *label_values, value: float):
+        self.values[label_values] = value
+
+class CallbackGauge(Metric):
+    """
+    Gauge read from the callback on every scrape, for state that is already counted elsewhere (pool sizes, stats)
+
+    The callback gives values by label values, an empty tuple for a metric without labels
+    """
+    type = "gauge"
+
+    def __init__(self, name: str, description: str, callback: Callable[[], dict[tuple, float]], labels: tuple[str, ...] = ()):
+        super().__init__(name, description, labels)
+        self.callback = callback
+
+    def samples(self):
+        try:
+            values = self.callback()
+        except Exception as e:
+            logger.warning("failed to collect %s: %s", self.name, e)
+            return
+        for label_values, value in values.items():
+            yield self.name, self.labels, label_values, value
+
+class CallbackCounter(CallbackGauge):
+    """
+    Counter read from the callback on every scrape, for totals that are already counted elsewhere
+    (hits of caches, rejections); they only grow, a drop is taken by prometheus for a restart
+    """
+    type = "counter"
+
+class Histogram(Metric):
+    """
+    Counts of observations by upper bounds of buckets, plus their sum and count
+    """
+    type = "histogram"
+
+    def __init__(self, name: str, description: str, labels: tuple[str, ...] = (), buckets: tuple[float, ...] = DEFAULT_BUCKETS):
+        super().__init__(name, description, labels)
+        self.buckets = tuple(sorted(buckets))
+        # label values -> counts of every bucket (not cumulative, summed on render) and the sum
+        self.observations: dict[tuple, tuple[list[int], list[float]]] = dict()
+
+    def observe(self, value: float, *label_values):
+        observation = self.observations.get(label_values)
+        if observation is None:
+            observation = self.observations[label_values] = ([0] * (len(self.buckets) + 1), [0.0])
+        counts, total = observation
+        counts[bisect_left(self.buckets, value)] += 1
+        total[0] += value
+
+    def samples(self):
+        bucket_labels = self.labels + ("le",)
+        for label_values, (counts, total) in list(self.observations.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), counts):
+                cumulative += count
+                yield f"{self.name}_bucket", bucket_labels, label_values + (_format_value(bound),), cumulative
+            yield f"{self.name}_sum", self.labels, label_values, total[0]
+            yield f"{self.name}_count", self.labels, label_values, cumulative
+
+class Registry:
+    def __init__(self):
+        self.metrics: dict[str, Metric] = dict()
+
+    def register(self, metric: Metric) -> Metric:
+        # modules may be imported again (tests, reloads), the metric made first is kept
+        return self.metrics.setdefault(metric.name, metric)
+
+    def render(self) -> str:
+        # prometheus text exposition format
+        return "\n".join(metric.render() for metric in self.metrics.values()) + "\n"
+
+registry = Registry()
+
+def counter(name: str, description: str, labels: tuple[str, ...] = ()) -> Counter:
+    return registry.register(Counter(name, description, labels))
+
+def gauge(name: str, description: str, labels: tuple[str, ...] = ()) -> Gauge:
+    return registry.register(Gauge(name, description, labels))
+
+def callback_gauge(name: str, description: str, callback: Callable[[], dict[tuple, float]], labels: tuple[str, ...] = ()) -> CallbackGauge:
+    # registered again on every init, so the callback reads the current state
+    metric = CallbackGauge(name, description, callback, labels)
+    registry.metrics[name] = metric
+    return metric
+
+def callback_counter(name: str, description: str, callback: Callable[[], dict[tuple, float]], labels: tuple[str, ...] = ()) -> CallbackCounter:
+    # registered again on every init, same as callback_gauge
+    metric = CallbackCounter(name, description, callback, labels)
+    registry.metrics[name] = metric
+    return metric
+
+def histogram(name: str, description: str, labels: tuple[str, ...] = (), buckets: tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+    return registry.register(Histogram(name, description, labels, buckets))
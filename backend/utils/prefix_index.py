@@ -0,0 +1,90 @@
+import bisect
+import heapq
+from uuid import UUID
+
+import logging
+logger = logging.getLogger(__name__)
+
+def normalize(text: str) -> str:
+    return " ".join(text.casefold().split())
+
+class PrefixIndex:
+    """
+    Sorted array of (normalized name, id) for prefix lookups with bisect, ranked by popularity
+
+    Ids are kept as UUID.int inside, hashing UUID itself goes through python code and dominates lookups.
+
+    Limits, traded for lookups of a few microseconds:
+        - only the first max_scan names with the prefix in alphabetical order are ranked, so for short prefixes
+          a popular name past them isn't suggested until the prefix gets longer
+        - popularity counts views through this worker only and starts from zero on restart,
+          workers may rank the same names differently
+        - insert (and renaming) shifts the array, O(n) per name, a published batch pays it for every good;
+          a memmove of pointers, about 0.25 ms per name at a million of them
+
+    Attributes:
+        max_scan -- how many names with the prefix are ranked at most, bounds latency of short prefixes
+    """
+    def __init__(self, max_scan: int = 1000):
+        self.max_scan = max_scan
+        self.entries: list[tuple[str, int]] = []
+        # id -> (normalized name, name as it was given)
+        self.names: dict[int, tuple[str, str]] = dict()
+        self.popularity: dict[int, int] = dict()
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def load(self, items: list[tuple[UUID, str]]):
+        # replaces everything but popularity of goods that are still there,
+        # sorting once is much cheaper than inserting one by one
+        names = {id.int: (normalize(name), name) for id, name in items}
+        entries = sorted((key, id) for id, (key, _) in names.items())
+        self.names, self.entries = names, entries
+        self.popularity = {id: count for id, count in self.popularity.items() if id in names}
+        logger.info("loaded %s names into prefix index", len(self.entries))
+
+    def _unlink(self, id: int):
+        entry = self.names.pop(id, None)
+        if entry is None:
+            return
+        i = bisect.bisect_left(self.entries, (entry[0], id))
+        if i < len(self.entries) and self.entries[i] == (entry[0], id):
+            del self.entries[i]
+
+    def insert(self, id: UUID, name: str):
+        # renamed goods keep their popularity
+        self._unlink(id.int)
+        key = normalize(name)
+        self.names[id.int] = (key, name)
+        bisect.insort(self.entries, (key, id.int))
+
+    def remove(self, id: UUID):
+        self._unlink(id.int)
+        self.popularity.pop(id.int, None)
+
+    def touch(self, id: UUID):
+        if id.int in self.names:
+            self.popularity[id.int] = self.popularity.get(id.int, 0) + 1
+
+    def suggest(self, prefix: str, limit: int) -> list[tuple[UUID, str]]:
+        prefix = normalize(prefix)
+        if not prefix:
+            return []
+
+        # every name with the prefix sorts between these two
+        start = bisect.bisect_left(self.entries, (prefix,))
+        end = bisect.bisect_left(self.entries, (prefix + "\U0010ffff",), lo=start)
+        candidates = [id for _, id in self.entries[start:min(end, start + self.max_scan)]]
+
+        # popular names go first, the rest in alphabetical order, which puts the shorter ones first
+        popular = [id for id in candidates if id in self.popularity]
+        best = heapq.nlargest(limit, popular, key=self.popularity.__getitem__)
+        if len(best) < limit:
+            chosen = set(best)
+            for id in candidates:
+                if id not in chosen:
+                    best.append(id)
+                    if len(best) == limit:
+                        break
+        return [(UUID(int=id), self.names[id][1]) for id in best]
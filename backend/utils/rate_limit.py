@@ -0,0 +1,79 @@
+import time
+from collections import OrderedDict
+from typing import Hashable
+
+import logging
+logger = logging.getLogger(__name__)
+
+class RateLimitBackend:
+    """
+    Keeps token buckets, a shared one lets several workers limit together
+    """
+    # takes cost tokens from the bucket of key, returns 0 if they were there or seconds to wait for them otherwise
+    async def take(self, key: Hashable, rate: float, burst: float, cost: float = 1) -> float:
+        raise NotImplementedError
+
+    def stats(self) -> dict[str, float]:
+        raise NotImplementedError
+
+class LocalRateLimitBackend(RateLimitBackend):
+    """
+    Buckets of this process only, every worker limits on its own
+
+    There are no awaits inside take, so it needs no locks on the event loop.
+    Buckets are refilled lazily on access, the least recently used are dropped over max_keys,
+    so spraying keys costs memory only up to the limit (and a dropped bucket is a full one for the next request).
+    """
+    def __init__(self, max_keys: int = 100000):
+        self.max_keys = max_keys
+        # key -> (tokens, monotonic time they were counted at)
+        self.buckets: OrderedDict[Hashable, tuple[float, float]] = OrderedDict()
+
+    async def take(self, key: Hashable, rate: float, burst: float, cost: float = 1) -> float:
+        now = time.monotonic()
+        tokens, updated = self.buckets.get(key, (burst, now))
+        tokens = min(burst, tokens + (now - updated) * rate)
+
+        if tokens >= cost:
+            tokens -= cost
+            wait = 0.0
+        else:
+            wait = (cost - tokens) / rate
+
+        self.buckets[key] = (tokens, now)
+        self.buckets.move_to_end(key)
+        while len(self.buckets) > self.max_keys:
+            self.buckets.popitem(last=False)
+        return wait
+
+    def stats(self) -> dict[str, float]:
+        # buckets that were empty when last touched, roughly the keys being limited right now
+        empty = sum(1 for tokens, _ in self.buckets.values() if tokens < 1)
+        return {"buckets": len(self.buckets), "empty_buckets": empty}
+
+class RateLimiter:
+    """
+    Token bucket per key: burst requests at once, then rate requests per second
+
+    Attributes:
+        allowed, limited -- request counters since creation
+    """
+    def __init__(self, backend: RateLimitBackend, name: str, rate: float, burst: float):
+        self.backend = backend
+        self.name = name
+        self.rate = rate
+        self.burst = burst
+        self.allowed = 0
+        self.limited = 0
+
+    async def check(self, key: Hashable, cost: float = 1) -> float:
+        wait = await self.backend.take((self.name, key), self.rate, self.burst, cost)
+        if wait:
+            self.limited += 1
+            logger.debug("limited %s %s for %.1f s", self.name, key, wait)
+        else:
+            self.allowed += 1
+        return wait
+
+    def stats(self) -> dict[str, float]:
+        return {"allowed": self.allowed, "limited": self.limited}
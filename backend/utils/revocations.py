@@ -0,0 +1,44 @@
+from datetime import datetime
+from uuid import UUID
+
+import logging
+logger = logging.getLogger(__name__)
+
+class RevocationList:
+    """
+    Latest token revocation of every user, tokens issued before it are rejected without going to the database
+
+    Kept in sync incrementally by the id of the last applied revocation, revocations older than
+    the token lifetime are forgotten as every token they could reject has already expired.
+
+    Attributes:
+        lifetime -- seconds tokens live
+    """
+    def __init__(self, lifetime: float):
+        self.lifetime = lifetime
+        # user id -> timestamp of the latest revocation
+        self.revoked: dict[UUID, float] = dict()
+        self.last_id = 0
+
+    def __len__(self) -> int:
+        return len(self.revoked)
+
+    def revoke(self, user_id: UUID, revoked_at: datetime):
+        at = revoked_at.timestamp()
+        if at > self.revoked.get(user_id, 0):
+            self.revoked[user_id] = at
+
+    def apply(self, revocations: list[tuple[int, UUID, datetime]]):
+        for id, user_id, revoked_at in revocations:
+            self.revoke(user_id, revoked_at)
+            self.last_id = max(self.last_id, id)
+        if revocations:
+            logger.debug("applied %s revocations, last id %s", len(revocations), self.last_id)
+
+    def prune(self, now: float):
+        expired = [user_id for user_id, at in self.revoked.items() if at < now - self.lifetime]
+        for user_id in expired:
+            del self.revoked[user_id]
+
+    def is_revoked(self, user_id: UUID, issued_at: float) -> bool:
+        return issued_at < self.revoked.get(user_id, 0)
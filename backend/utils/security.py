@@ -1,9 +1,181 @@
+import argparse
+import asyncio
+import os
+import statistics
+import threading
+import time
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
+
 from pwdlib import PasswordHash
+from pwdlib.hashers.argon2 import Argon2Hasher
+
+import logging
+logger = logging.getLogger(__name__)
+
+# KiB, owasp minimum for argon2id
+MIN_MEMORY_COST = 19 * 1024
+MAX_MEMORY_COST = 1024 * 1024
+MIN_TIME_COST = 2
+MAX_TIME_COST = 10
 
 password_hash = PasswordHash.recommended()
+# parameters of password_hash, None for pwdlib defaults; process workers are configured with them
+hash_params: tuple[int, int, int] | None = None
+
+def configure_hasher(time_cost: int, memory_cost: int, parallelism: int):
+    """
+    Makes new hashes with such parameters, hashes with other ones are still verified and get rehashed on login
+    """
+    global password_hash, hash_params
+    password_hash = PasswordHash((Argon2Hasher(time_cost=time_cost, memory_cost=memory_cost, parallelism=parallelism),))
+    hash_params = (time_cost, memory_cost, parallelism)
+
+def measure_hashing(time_cost: int, memory_cost: int, parallelism: int, rounds: int = 3) -> float:
+    # median of a few hashes in ms, single ones are noisy
+    hasher = Argon2Hasher(time_cost=time_cost, memory_cost=memory_cost, parallelism=parallelism)
+    timings = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        hasher.hash("calibration password")
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+def calibrate(budget_ms: float, parallelism: int = 4) -> tuple[int, int]:
+    """
+    Picks argon2 time and memory costs so that one hash fits into budget on this machine,
+    memory is raised first as it's what makes guessing expensive, then spare time goes to more passes
+
+    Returns time_cost and memory_cost in KiB, never below the owasp minimum even if it's over budget
+    """
+    time_cost, memory_cost = MIN_TIME_COST, MIN_MEMORY_COST
+    took = measure_hashing(time_cost, memory_cost, parallelism)
+    if took > budget_ms:
+        logger.warning("minimal argon2 parameters take %.1f ms, over budget of %.1f ms", took, budget_ms)
+        return time_cost, memory_cost
+
+    while memory_cost * 2 <= MAX_MEMORY_COST:
+        doubled = measure_hashing(time_cost, memory_cost * 2, parallelism)
+        if doubled > budget_ms:
+            break
+        memory_cost, took = memory_cost * 2, doubled
 
-def verify_password(plain_password, hashed_password):
+    while time_cost < MAX_TIME_COST:
+        longer = measure_hashing(time_cost + 1, memory_cost, parallelism)
+        if longer > budget_ms:
+            break
+        time_cost, took = time_cost + 1, longer
+
+    logger.info("calibrated argon2 to time_cost %s, memory_cost %s KiB, parallelism %s: %.1f ms per hash",
+                time_cost, memory_cost, parallelism, took)
+    return time_cost, memory_cost
+
+def check_password(plain_password, hashed_password):
     return password_hash.verify(plain_password, hashed_password)
 
+def check_and_update_password(plain_password, hashed_password) -> tuple[bool, str | None]:
+    # new hash is given when the old one was made with other parameters
+    return password_hash.verify_and_update(plain_password, hashed_password)
+
 def get_password_hash(password):
     return password_hash.hash(password)
+
+class PasswordHashingBusyError(Exception):
+    """Exception raised when all workers of the hashing pool are busy and its queue is full
+
+    Attributes:
+        pending -- hashes computed or waiting at the moment
+    """
+    def __init__(self, pending):
+        self.pending = pending
+        super().__init__(f"Password hashing pool is busy, {self.pending} hashes pending")
+
+class HashingPool:
+    """
+    Runs argon2 off the event loop, on threads (argon2 releases the GIL) or processes
+
+    Attributes:
+        workers -- hashes computed at the same time
+        max_queue -- hashes waiting for a worker at most, others fail fast instead of piling up latency
+    """
+    def __init__(self, workers: int | None = None, max_queue: int = 64, processes: bool = False):
+        self.workers = workers or os.cpu_count() or 1
+        self.max_queue = max_queue
+        self.processes = processes
+        self.executor: Executor | None = None
+        self.pending = 0
+        self.rejected = 0
+        # completion callbacks run on worker threads
+        self.lock = threading.Lock()
+
+    def _executor(self) -> Executor:
+        # created on first use, so processes aren't forked at import
+        if self.executor is None:
+            if self.processes:
+                # workers don't share module state with the parent, so they get the parameters explicitly
+                self.executor = ProcessPoolExecutor(max_workers=self.workers,
+                                                    initializer=configure_hasher if hash_params else None,
+                                                    initargs=hash_params or ())
+            else:
+                self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="password-hashing")
+            logger.info("started password hashing pool with %s %s", self.workers, "processes" if self.processes else "threads")
+        return self.executor
+
+    def _done(self, _: Future):
+        with self.lock:
+            self.pending -= 1
+
+    async def run(self, fn, *args):
+        with self.lock:
+            if self.pending >= self.workers + self.max_queue:
+                self.rejected += 1
+                raise PasswordHashingBusyError(self.pending)
+            self.pending += 1
+
+        # counted until the worker finishes, even if the caller is cancelled before that
+        try:
+            future = self._executor().submit(fn, *args)
+        except BaseException:
+            self._done(None)
+            raise
+        future.add_done_callback(self._done)
+        return await asyncio.wrap_future(future)
+
+    def shutdown(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
+
+    def stats(self) -> dict[str, int]:
+        return {"workers": self.workers, "pending": self.pending, "rejected": self.rejected}
+
+_pool = HashingPool()
+
+def init_pool(workers: int | None = None, max_queue: int = 64, processes: bool = False):
+    global _pool
+    _pool.shutdown()
+    _pool = HashingPool(workers, max_queue, processes)
+
+def shutdown_pool():
+    _pool.shutdown()
+
+def pool_stats() -> dict[str, int]:
+    return _pool.stats()
+
+async def verify_password(plain_password, hashed_password) -> bool:
+    return await _pool.run(check_password, plain_password, hashed_password)
+
+async def hash_password(password) -> str:
+    return await _pool.run(get_password_hash, password)
+
+async def verify_and_update_password(plain_password, hashed_password) -> tuple[bool, str | None]:
+    return await _pool.run(check_and_update_password, plain_password, hashed_password)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Pick argon2 parameters for this machine")
+    parser.add_argument("budget_ms", type=float, help="time one hash may take")
+    parser.add_argument("--parallelism", type=int, default=4)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    time_cost, memory_cost = calibrate(args.budget_ms, args.parallelism)
+    print(f"hash_time_cost: {time_cost}\nhash_memory_cost: {memory_cost}\nhash_parallelism: {args.parallelism}")